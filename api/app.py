@@ -3,18 +3,35 @@ API Flask StickerStreet - Backend partagé entre la webapp et le bot Telegram
 """
 import hashlib
 import hmac
+import html
 import json
 import os
 import re
+import tempfile
 import time
 import base64
-import urllib.request
+import bisect
 import urllib.parse
 import urllib.error
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request
 from flask_cors import CORS
 
+from attachments import FileAttachmentStore, PostgresAttachmentStore
+from cache import ReadCache
+from chat_hub import ChatHub
+from compression import choose_encoding, compress
+from export import batched, csv_chunks, stream_zip
+from filestore import FileStore
+from http_client import HttpClient
+from indexes import normalize_id, snapshot_index, snapshot_memo, snapshot_positions
+from jobs import FileJobStore, JobQueue, PeriodicTask, PermanentJobError, PostgresJobStore
+from pdf import render as render_pdf, render_many as render_pdfs
+from pdf_cache import PdfCache
+from rates import CachedRate
+from unit_of_work import StorageUnavailable, UnitOfWork
+
 try:
     from flask_limiter import Limiter
     from flask_limiter.util import get_remote_address
@@ -23,6 +40,9 @@ except ImportError:
     _HAS_LIMITER = False
 
 app = Flask(__name__)
+# JSON compact même en debug (pas d'indentation ni d'espaces après , et :), accents en UTF-8
+app.json.compact = True
+app.json.ensure_ascii = False
 
 _raw_origins = (os.environ.get("ALLOWED_ORIGINS", "") or "").strip()
 # Normaliser sans slash final pour matcher l'en-tête Origin envoyé par le navigateur
@@ -30,7 +50,8 @@ _cors_origins = [o.strip().rstrip("/") for o in _raw_origins.split(",") if o.str
 CORS(app, resources={r"/api/*": {
     "origins": _cors_origins,
     "methods": ["GET", "POST", "PATCH", "DELETE", "OPTIONS"],
-    "allow_headers": ["Content-Type", "X-Admin-Key", "Authorization"],
+    "allow_headers": ["Content-Type", "X-Admin-Key", "Authorization", "X-Telegram-Init-Data"],
+    "expose_headers": ["X-Total-Count", "X-Next-Cursor", "X-Prev-Cursor", "ETag"],
 }})
 
 if _HAS_LIMITER:
@@ -73,11 +94,27 @@ ADMIN_API_KEY = (os.environ.get("ADMIN_API_KEY", "") or "").strip().strip('"').s
 # Base de données : Neon (Postgres) si DATABASE_URL est défini, sinon fichier JSON
 USE_NEON = bool((os.environ.get("DATABASE_URL") or "").strip())
 if USE_NEON:
-    from db import load_data as _neon_load, save_data as _neon_save
-    def load_data():
-        return _neon_load()
+    from db import load_data as _neon_load, save_data as _neon_save, get_versions as _neon_versions, pool_stats, NEON_STORAGE
+    from db import load_rows as _neon_load_rows
+    def _neon_storage():
+        return NEON_STORAGE
+    def load_data(*collections):
+        data = _neon_load(*collections)
+        if data is not None:
+            # Mode kv : un ancien document peut ne pas avoir toutes les collections.
+            for key, empty in _empty_data().items():
+                if key in collections:
+                    data.setdefault(key, empty)
+        return data
     def save_data(data):
-        return _neon_save(data)
+        ok = _neon_save(data)
+        _read_cache.invalidate(list(data))
+        return ok
+    # Mode tables : les écritures ne lisent que les lignes qu'elles touchent.
+    load_rows = _neon_load_rows if NEON_STORAGE == "tables" else None
+    def _data_versions(collections):
+        return _neon_versions(collections)
+    from db import next_sequence_value as _next_sequence_value
 else:
     # En local : ../shared/data.json | Sur Railway : data.json dans api/
     _SHARED = os.path.join(os.path.dirname(__file__), "..", "shared", "data.json")
@@ -89,6 +126,61 @@ VERCEL_BLOB_UPLOAD_URL = os.environ.get("VERCEL_BLOB_UPLOAD_URL", "https://blob.
 VERCEL_BLOB_BASE_URL = os.environ.get("VERCEL_BLOB_BASE_URL", "").strip()
 BLOB_READ_WRITE_TOKEN = (os.environ.get("BLOB_READ_WRITE_TOKEN", "") or "").strip().strip('"').strip("'")
 PENDING_INVOICE_TTL_SECONDS = int(os.environ.get("PENDING_INVOICE_TTL_SECONDS", "86400") or "86400")
+# Cache disque LRU des PDF de factures (renvoi à la validation sans téléchargement)
+PDF_CACHE_DIR = (os.environ.get("PDF_CACHE_DIR", "") or "").strip() or os.path.join(tempfile.gettempdir(), "stickerstreet-invoices")
+PDF_CACHE_MAX_BYTES = int(os.environ.get("PDF_CACHE_MAX_BYTES", "52428800") or "52428800")
+# Export comptable (ZIP des factures) : PDF lus ou téléchargés en parallèle, au plus N à la fois
+EXPORT_FETCH_WORKERS = max(1, int(os.environ.get("EXPORT_FETCH_WORKERS", "4") or "4"))
+# Secondes entre deux purges des factures Stars expirées (thread d'arrière-plan)
+PENDING_INVOICE_SWEEP_INTERVAL = int(os.environ.get("PENDING_INVOICE_SWEEP_INTERVAL", "300") or "300")
+# Pagination de /api/orders et /api/chat (taille par défaut, plafond de ?limit=)
+ORDERS_PAGE_SIZE = int(os.environ.get("ORDERS_PAGE_SIZE", "50") or "50")
+CHAT_PAGE_SIZE = int(os.environ.get("CHAT_PAGE_SIZE", "100") or "100")
+# Long-poll du chat (?wait=) : attente maximale (s) et relecture des données (messages d'un autre worker)
+CHAT_WAIT_MAX = int(os.environ.get("CHAT_WAIT_MAX", "25") or "25")
+CHAT_WAIT_RECHECK = float(os.environ.get("CHAT_WAIT_RECHECK", "3") or "3")
+# Long-polls simultanés par client (fil Telegram, ou adresse IP pour le fil anonyme) ; au-delà : 429
+CHAT_WAIT_PER_CLIENT = max(1, int(os.environ.get("CHAT_WAIT_PER_CLIENT", "2") or "2"))
+PAGE_SIZE_MAX = int(os.environ.get("PAGE_SIZE_MAX", "200") or "200")
+# Cache-Control des routes catalogue (produits, bannières, statuts, MoMo), servies avec ETag
+CATALOG_CACHE_CONTROL = (
+    os.environ.get("CATALOG_CACHE_CONTROL", "") or "public, max-age=30, stale-while-revalidate=300"
+).strip()
+# Taille minimale (octets) d'une réponse JSON compressée (gzip / brotli)
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", "1024") or "1024")
+# File de tâches (notifications Telegram, envois Blob) : threads, essais, attente entre essais (s)
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2") or "2")
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "8") or "8")
+JOB_RETRY_BASE = float(os.environ.get("JOB_RETRY_BASE", "5") or "5")
+JOB_RETRY_MAX = float(os.environ.get("JOB_RETRY_MAX", "900") or "900")
+JOB_DEAD_MAX = int(os.environ.get("JOB_DEAD_MAX", "500") or "500")
+# Appels sortants (Telegram, Vercel Blob, CoinGecko) : connexions keep-alive par hôte, délais (s), essais
+HTTP_TIMEOUT = float(os.environ.get("HTTP_TIMEOUT", "10") or "10")
+HTTP_UPLOAD_TIMEOUT = float(os.environ.get("HTTP_UPLOAD_TIMEOUT", "30") or "30")
+HTTP_RETRIES = int(os.environ.get("HTTP_RETRIES", "2") or "2")
+_pdf_cache = PdfCache(PDF_CACHE_DIR, PDF_CACHE_MAX_BYTES)
+_chat_hub = ChatHub()
+_http = HttpClient(
+    max_idle=int(os.environ.get("HTTP_POOL_MAX_IDLE", "4") or "4"),
+    idle_timeout=float(os.environ.get("HTTP_IDLE_TIMEOUT", "60") or "60"),
+    retries=HTTP_RETRIES,
+)
+# Neon : durée (s) pendant laquelle la version lue est réutilisée sans requête (0 = vérifier à chaque lecture)
+DATA_CACHE_CHECK_INTERVAL = float(os.environ.get("DATA_CACHE_CHECK_INTERVAL", "1") or "1")
+
+
+def _empty_data():
+    return {
+        "products": [],
+        "orders": [],
+        "statuses": {},
+        "momo": [],
+        "clients": [],
+        "chat": [],
+        "banners": [],
+        "invoices": [],
+        "pending_invoices": {},
+    }
 
 
 if not USE_NEON:
@@ -106,49 +198,255 @@ if not USE_NEON:
         else:
             # Seed minimal pour éviter crash démarrage.
             with open(DATA_FILE, "w", encoding="utf-8") as dst:
-                json.dump(
-                    {
-                        "products": [],
-                        "orders": [],
-                        "statuses": {},
-                        "momo": [],
-                        "clients": [],
-                        "chat": [],
-                        "banners": [],
-                        "invoices": [],
-                        "pending_invoices": {},
-                    },
-                    dst,
-                    ensure_ascii=False,
-                    indent=2,
-                )
-
-    def load_data():
-        _ensure_data_file()
-        with open(DATA_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
+                json.dump(_empty_data(), dst, ensure_ascii=False, indent=2)
+
+    _ensure_data_file()
+    _file_store = FileStore(
+        DATA_FILE,
+        compact_bytes=int(os.environ.get("DATA_JOURNAL_COMPACT_BYTES", "1048576") or "1048576"),
+        compact_interval=float(os.environ.get("DATA_JOURNAL_COMPACT_INTERVAL", "60") or "60"),
+        fsync=(os.environ.get("DATA_JOURNAL_FSYNC", "true") or "true").lower() != "false",
+    )
+
+    load_rows = None
+
+    def load_data(*collections):
+        data = _file_store.load_data(*collections)
+        for key, empty in _empty_data().items():
+            if key in collections:
+                data.setdefault(key, empty)
+        return data
 
     def save_data(data):
-        _ensure_data_file()
-        with open(DATA_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        _file_store.save_data(data)
+        _read_cache.invalidate(list(data))
+        return True
+
+    def _data_versions(collections):
+        return _file_store.get_versions(collections)
+
+    def _next_sequence_value(name, seed):
+        return _file_store.next_sequence_value(name, seed)
+
+
+# Les versions du fichier sont tenues en mémoire ; Neon peut espacer les vérifications.
+_read_cache = ReadCache(
+    load_data,
+    _data_versions,
+    check_interval=DATA_CACHE_CHECK_INTERVAL if USE_NEON else 0,
+)
+
+
+# Neon : tables jobs et attachments partagées par tous les processus ; fichier : JOBS_FILE
+# (défaut DATA_FILE.jobs) et ATTACHMENTS_DIR (défaut DATA_FILE.attachments).
+if USE_NEON:
+    from db import connection as _db_connection
+    _job_store = PostgresJobStore(_db_connection, max_dead=JOB_DEAD_MAX)
+    _attachments = PostgresAttachmentStore(_db_connection)
+else:
+    _job_store = FileJobStore(
+        (os.environ.get("JOBS_FILE", "") or "").strip() or f"{DATA_FILE}.jobs", max_dead=JOB_DEAD_MAX,
+    )
+    _attachments = FileAttachmentStore((os.environ.get("ATTACHMENTS_DIR", "") or "").strip() or f"{DATA_FILE}.attachments")
+_jobs = JobQueue(
+    _job_store,
+    workers=JOB_WORKERS,
+    max_attempts=JOB_MAX_ATTEMPTS,
+    backoff_base=JOB_RETRY_BASE,
+    backoff_max=JOB_RETRY_MAX,
+    logger=app.logger,
+)
+
+
+@app.before_request
+def _start_background_threads():
+    """Threads démarrés au premier appel du processus : file de tâches (reprend celles laissées
+    par le précédent), rafraîchissement du cours TON, purge des factures Stars expirées."""
+    _jobs.start()
+    _ton_rate.start()
+    _pending_sweeper.start()
+    _attachments_migration.start()
+
+
+def read_data(*collections):
+    """Instantané partagé et figé des collections demandées (lecture seule, mis en cache).
+
+    Les routes qui modifient les données utilisent request_data()/mark_dirty().
+    """
+    return _read_cache.get(*collections)
+
+
+def _unit_of_work():
+    work = g.get("unit_of_work")
+    if work is None:
+        work = g.unit_of_work = UnitOfWork(load_data, save_data, load_rows)
+    return work
+
+
+def request_data(*collections):
+    """Données modifiables de la requête : chaque collection n'est chargée qu'une fois."""
+    return _unit_of_work().load(*collections)
+
+
+def request_rows(collection, field=None, keys=()):
+    """Liste modifiable de la requête contenant au moins les documents dont field vaut l'une des keys.
+
+    En mode tables, seules ces lignes sont lues (la liste est partielle : y ajouter, ou modifier
+    ces documents) ; sinon c'est la collection entière, comme request_data().
+    """
+    return _unit_of_work().rows(collection, field, keys)
+
+
+def request_index(collection, field, keys=None):
+    """Index {champ: documents} sur les données modifiables de la requête (keys : voir request_rows)."""
+    return _unit_of_work().index(collection, field, keys)
+
+
+def mark_dirty(*collections):
+    """Collections modifiées, enregistrées en un seul save_data() en fin de requête."""
+    _unit_of_work().mark_dirty(*collections)
+
+
+def commit_data():
+    """Enregistre tout de suite (avant un effet externe : notification, envoi de facture)."""
+    return _unit_of_work().commit()
+
+
+def _save_failed_response():
+    return jsonify({"error": "Enregistrement impossible, réessaie dans un instant"}), 503
+
+
+def _max_number(ids):
+    """Plus grand nombre en fin d'identifiant (ORD-1042 -> 1042, INV-20250101-0007 -> 7, 12 -> 12)."""
+    best = 0
+    for value in ids:
+        m = re.search(r"(\d+)$", str(value if value is not None else ""))
+        if m:
+            best = max(best, int(m.group(1)))
+    return best
+
+
+def next_id(name, existing_ids):
+    """Prochain numéro de la séquence name (Postgres en mode Neon, compteur journalisé sinon).
+
+    existing_ids() n'est parcouru qu'à la première allocation du processus, pour
+    placer la séquence au-dessus des identifiants déjà présents.
+    """
+    try:
+        return _next_sequence_value(name, lambda: _max_number(existing_ids()))
+    except Exception as e:
+        app.logger.warning(f"Séquence {name} indisponible: {e}")
+        raise StorageUnavailable(f"séquence {name} indisponible") from e
+
+
+@app.after_request
+def _compress_response(response):
+    """gzip / brotli à la volée des autres réponses JSON (commandes, chat...) au-delà de COMPRESS_MIN_BYTES."""
+    if (
+        response.status_code != 200
+        or response.direct_passthrough
+        or "Content-Encoding" in response.headers
+        or response.mimetype != "application/json"
+    ):
+        return response
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_BYTES:
+        return response
+    encoding = choose_encoding(request.accept_encodings)
+    response.vary.add("Accept-Encoding")
+    if not encoding:
+        return response
+    response.set_data(compress(body, encoding))
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+
+@app.after_request
+def _commit_unit_of_work(response):
+    """Un seul enregistrement par requête ; rien n'est écrit si la réponse est une erreur."""
+    work = g.pop("unit_of_work", None)
+    if work is None or not work.dirty:
+        return response
+    if response.status_code >= 400:
+        work.rollback()
+        return response
+    try:
+        ok = work.commit()
+    except Exception as e:
+        app.logger.warning(f"save_data error: {e}")
+        ok = False
+    if not ok:
+        app.logger.warning(f"Enregistrement échoué pour {request.method} {request.path}")
+        rv, status = _save_failed_response()
+        rv.status_code = status
+        return rv
+    return response
+
+
+@app.errorhandler(StorageUnavailable)
+def _storage_unavailable(e):
+    return jsonify({"error": "Stockage indisponible, réessaie dans un instant"}), 503
+
+
+def _snapshot_etag(snapshot):
+    """ETag fort d'un instantané : empreinte du contenu, calculée une fois par version de la collection."""
+    def build():
+        raw = json.dumps(snapshot, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+    return snapshot_memo(snapshot, "etag", build)
+
+
+def _compact_json(obj):
+    """JSON sans espaces ni échappements \\uXXXX : app.json.dumps() ignore app.json.compact."""
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def _catalog_response(snapshot, payload=None, etag_suffix=""):
+    """Réponse catalogue avec ETag + Cache-Control ; 304 sans corps si If-None-Match correspond.
+
+    payload : corps à renvoyer s'il diffère de l'instantané (ex. un seul produit).
+    Le JSON et ses versions gzip / brotli sont produits une fois par version de la
+    collection, puis resservis tels quels.
+    """
+    etag = _snapshot_etag(snapshot) + etag_suffix
+    body = snapshot_memo(
+        snapshot, ("body", etag_suffix),
+        lambda: _compact_json(snapshot if payload is None else payload).encode("utf-8"),
+    )
+    encoding = choose_encoding(request.accept_encodings) if len(body) >= COMPRESS_MIN_BYTES else None
+    # Un ETag par représentation ; n'importe laquelle valide le cache du client.
+    variants = [etag, f"{etag}-gzip", f"{etag}-br"]
+    if any(request.if_none_match.contains_weak(v) for v in variants):
+        resp = app.response_class(status=304)
+    elif encoding:
+        resp = app.response_class(
+            snapshot_memo(snapshot, (encoding, etag_suffix), lambda: compress(body, encoding, best=True)),
+            mimetype="application/json",
+        )
+        resp.headers["Content-Encoding"] = encoding
+    else:
+        resp = app.response_class(body, mimetype="application/json")
+    resp.set_etag(f"{etag}-{encoding}" if encoding else etag)
+    resp.headers["Cache-Control"] = CATALOG_CACHE_CONTROL
+    resp.vary.add("Accept-Encoding")
+    return resp
 
 
 @app.route("/api/products", methods=["GET"])
 def get_products():
     """Liste tous les produits"""
-    data = load_data()
-    return jsonify(data["products"])
+    data = read_data("products")
+    return _catalog_response(data["products"])
 
 
 @app.route("/api/products/<int:pid>", methods=["GET"])
 def get_product(pid):
     """Détails d'un produit"""
-    data = load_data()
-    p = next((x for x in data["products"] if x["id"] == pid), None)
+    data = read_data("products")
+    p = snapshot_index(data["products"], "id").get(pid)
     if not p:
         return jsonify({"error": "Produit introuvable"}), 404
-    return jsonify(p)
+    return _catalog_response(data["products"], payload=p, etag_suffix=f"-{pid}")
 
 
 def _sanitize_blob_folder(folder):
@@ -196,7 +494,7 @@ def _blob_pathname_from_url(url):
 
 
 def _delete_blob_url(url):
-    """Supprime un objet Vercel Blob via son URL complète."""
+    """Supprime un objet Vercel Blob via son URL complète (tâche "blob_delete" ; lève si l'appel échoue)."""
     if not BLOB_READ_WRITE_TOKEN or not _is_blob_url(url):
         return False
     pathname = _blob_pathname_from_url(url)
@@ -204,16 +502,25 @@ def _delete_blob_url(url):
         return False
     delete_url = f"{VERCEL_BLOB_UPLOAD_URL.rstrip('/')}/{pathname}"
     try:
-        req = urllib.request.Request(
-            delete_url,
-            method="DELETE",
-            headers={"Authorization": f"Bearer {BLOB_READ_WRITE_TOKEN}"},
-        )
-        urllib.request.urlopen(req, timeout=15)
-        return True
-    except Exception as e:
-        app.logger.warning(f"Blob delete failed for {url}: {e}")
-        return False
+        _http.request("DELETE", delete_url, headers={"Authorization": f"Bearer {BLOB_READ_WRITE_TOKEN}"}, timeout=HTTP_TIMEOUT)
+    except urllib.error.HTTPError as e:
+        if e.code == 404:
+            return True  # déjà supprimé
+        if 400 <= e.code < 500 and e.code != 429:
+            raise PermanentJobError(f"Blob delete refusé ({e.code}) pour {url}") from e
+        raise
+    return True
+
+
+def _enqueue_blob_deletions(urls):
+    """Suppressions Blob en tâche de fond, une fois la donnée qui les référençait enregistrée."""
+    if not BLOB_READ_WRITE_TOKEN:
+        return
+    for url in urls:
+        _jobs.enqueue("blob_delete", {"url": url})
+
+
+_jobs.register("blob_delete", lambda payload: _delete_blob_url(payload.get("url")))
 
 
 def _collect_product_blob_urls(product):
@@ -253,9 +560,7 @@ def _upload_bytes_to_blob(blob, folder, original_name, content_type):
         "x-access": "public",
         "x-add-random-suffix": "1",
     }
-    req = urllib.request.Request(upload_url, data=blob, method="PUT", headers=headers)
-    with urllib.request.urlopen(req, timeout=25) as resp:
-        payload = json.loads(resp.read().decode() or "{}")
+    payload = _http.request("PUT", upload_url, body=blob, headers=headers, timeout=HTTP_UPLOAD_TIMEOUT).json()
     url = payload.get("url") or payload.get("downloadUrl")
     pathname = payload.get("pathname", pathname)
     if not url and VERCEL_BLOB_BASE_URL:
@@ -438,18 +743,14 @@ def _sanitize_banner_payload(body, existing=None):
 
 @app.route("/api/banners", methods=["GET"])
 def get_banners():
-    data = load_data()
-    data.setdefault("banners", [])
-    normalized = []
-    changed = False
-    for b in data["banners"]:
-        if "section" not in b:
-            b["section"] = "home"
-            changed = True
-        normalized.append(b)
-    if changed:
-        save_data(data)
-    return jsonify(normalized)
+    data = read_data("banners")
+    banners = data["banners"]
+    # Anciennes bannières sans section : normalisées à la volée (pas d'écriture pendant un GET).
+    normalized = snapshot_memo(
+        banners, "normalized",
+        lambda: [b if "section" in b else {**b, "section": "home"} for b in (banners or [])],
+    )
+    return _catalog_response(banners, payload=normalized)
 
 
 @app.route("/api/banners", methods=["POST"])
@@ -457,16 +758,15 @@ def create_banner():
     auth_err = _require_admin_api_key()
     if auth_err:
         return auth_err
-    data = load_data()
+    data = request_data("banners")
     data.setdefault("banners", [])
     body = request.get_json() or {}
     cleaned, err = _sanitize_banner_payload(body)
     if err:
         return jsonify({"error": err}), 400
-    nums = [int(b.get("id", 0)) for b in data["banners"] if str(b.get("id", "")).isdigit()]
-    cleaned["id"] = max(nums, default=0) + 1
+    cleaned["id"] = next_id("banners", lambda: (b.get("id") for b in data["banners"]))
     data["banners"].append(cleaned)
-    save_data(data)
+    mark_dirty("banners")
     return jsonify(cleaned), 201
 
 
@@ -475,9 +775,9 @@ def update_banner(bid):
     auth_err = _require_admin_api_key()
     if auth_err:
         return auth_err
-    data = load_data()
+    data = request_data("banners")
     data.setdefault("banners", [])
-    banner = next((b for b in data["banners"] if b.get("id") == bid), None)
+    banner = request_index("banners", "id").get(bid)
     if not banner:
         return jsonify({"error": "Bannière introuvable"}), 404
     body = request.get_json() or {}
@@ -485,7 +785,7 @@ def update_banner(bid):
     if err:
         return jsonify({"error": err}), 400
     banner.update(cleaned)
-    save_data(data)
+    mark_dirty("banners")
     return jsonify(banner)
 
 
@@ -494,9 +794,9 @@ def delete_banner(bid):
     auth_err = _require_admin_api_key()
     if auth_err:
         return auth_err
-    data = load_data()
+    data = request_data("banners", "products")
     data.setdefault("banners", [])
-    target = next((b for b in data["banners"] if b.get("id") == bid), None)
+    target = request_index("banners", "id").get(bid)
     if not target:
         return jsonify({"error": "Bannière introuvable"}), 404
     before = len(data["banners"])
@@ -505,6 +805,7 @@ def delete_banner(bid):
         return jsonify({"error": "Bannière introuvable"}), 404
 
     banner_url = str((target or {}).get("image", "")).strip()
+    unused_urls = []
     if _is_blob_url(banner_url):
         still_used = any(str((b or {}).get("image", "")).strip() == banner_url for b in data["banners"])
         if not still_used:
@@ -513,9 +814,12 @@ def delete_banner(bid):
                     still_used = True
                     break
         if not still_used:
-            _delete_blob_url(banner_url)
+            unused_urls.append(banner_url)
 
-    save_data(data)
+    mark_dirty("banners")
+    if not commit_data():
+        return _save_failed_response()
+    _enqueue_blob_deletions(unused_urls)
     return jsonify({"ok": True, "deleted_id": bid})
 
 
@@ -525,15 +829,14 @@ def create_product():
     auth_err = _require_admin_api_key()
     if auth_err:
         return auth_err
-    data = load_data()
+    data = request_data("products")
     body = request.get_json() or {}
     cleaned, err = _sanitize_product_payload(body)
     if err:
         return jsonify({"error": err}), 400
-    nums = [int(p.get("id", 0)) for p in data["products"] if str(p.get("id", "")).isdigit()]
-    cleaned["id"] = max(nums, default=0) + 1
+    cleaned["id"] = next_id("products", lambda: (p.get("id") for p in data["products"]))
     data["products"].append(cleaned)
-    save_data(data)
+    mark_dirty("products")
     return jsonify(cleaned), 201
 
 
@@ -543,8 +846,8 @@ def update_product(pid):
     auth_err = _require_admin_api_key()
     if auth_err:
         return auth_err
-    data = load_data()
-    product = next((x for x in data["products"] if x["id"] == pid), None)
+    data = request_data("products")
+    product = request_index("products", "id").get(pid)
     if not product:
         return jsonify({"error": "Produit introuvable"}), 404
     body = request.get_json() or {}
@@ -552,7 +855,7 @@ def update_product(pid):
     if err:
         return jsonify({"error": err}), 400
     product.update(cleaned)
-    save_data(data)
+    mark_dirty("products")
     return jsonify(product)
 
 
@@ -562,8 +865,8 @@ def delete_product(pid):
     auth_err = _require_admin_api_key()
     if auth_err:
         return auth_err
-    data = load_data()
-    target = next((p for p in data["products"] if p.get("id") == pid), None)
+    data = request_data("products", "banners")
+    target = request_index("products", "id").get(pid)
     if not target:
         return jsonify({"error": "Produit introuvable"}), 404
     before = len(data["products"])
@@ -580,31 +883,135 @@ def delete_product(pid):
         bu = str((b or {}).get("image", "")).strip()
         if _is_blob_url(bu):
             still_used.add(bu)
-    for u in candidate_urls:
-        if u not in still_used:
-            _delete_blob_url(u)
-
-    save_data(data)
+    mark_dirty("products")
+    if not commit_data():
+        return _save_failed_response()
+    _enqueue_blob_deletions([u for u in candidate_urls if u not in still_used])
     return jsonify({"ok": True, "deleted_id": pid})
 
 
+def _page_limit(default):
+    try:
+        limit = int(request.args.get("limit") or default)
+    except ValueError:
+        limit = default
+    return max(1, min(PAGE_SIZE_MAX, limit))
+
+
+def _paged_response(items, total, next_cursor=None, prev_cursor=None):
+    """Page JSON (liste, comme avant) ; total et curseurs dans les en-têtes."""
+    resp = jsonify(items)
+    resp.headers["X-Total-Count"] = str(total)
+    if next_cursor is not None:
+        resp.headers["X-Next-Cursor"] = str(next_cursor)
+    if prev_cursor is not None:
+        resp.headers["X-Prev-Cursor"] = str(prev_cursor)
+    return resp
+
+
+_DATE_ARG = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+
+def _order_filters(args):
+    """Filtres ?status=a,b &payment_method= &date_from= &date_to= (AAAA-MM-JJ, inclus)."""
+    statuses = frozenset(x.strip() for x in (args.get("status") or "").split(",") if x.strip())
+    payment = (args.get("payment_method") or "").strip()
+    date_from = (args.get("date_from") or "").strip()
+    date_to = (args.get("date_to") or "").strip()
+    for d in (date_from, date_to):
+        if d and not _DATE_ARG.match(d):
+            return (None, None), "Date invalide (format AAAA-MM-JJ)"
+    key = (statuses, payment, date_from, date_to)
+    if not any(key):
+        return (key, None), None
+
+    def match(o):
+        if statuses and o.get("status") not in statuses:
+            return False
+        if payment and (o.get("payment_method") or "") != payment:
+            return False
+        date = str(o.get("date") or "")
+        if date_from and date < date_from:
+            return False
+        if date_to and date > date_to:
+            return False
+        return True
+    return (key, match), None
+
+
 @app.route("/api/orders", methods=["GET"])
 def get_orders():
-    """Liste les commandes (optionnel: ?telegram_user_id=123)"""
-    data = load_data()
-    tg_id = request.args.get("telegram_user_id", type=int)
-    orders = data["orders"]
-    if tg_id is not None:
-        orders = [o for o in orders if o.get("telegram_user_id") == tg_id]
-    return jsonify(orders)
+    """Liste paginée des commandes, plus récentes d'abord.
+
+    ?limit= (défaut ORDERS_PAGE_SIZE), ?after=<id> (plus anciennes), ?before=<id>
+    (plus récentes), filtres ?telegram_user_id= &status= &payment_method= &date_from= &date_to=.
+    En-têtes : X-Total-Count (après filtres), X-Next-Cursor / X-Prev-Cursor.
+    """
+    data = read_data("orders")
+    orders = data["orders"] or []
+    (filter_key, match), err = _order_filters(request.args)
+    if err:
+        return jsonify({"error": err}), 400
+    tg_id = normalize_id(request.args.get("telegram_user_id"))
+    if tg_id:
+        # Commandes d'un client : quelques dizaines, parcourues directement.
+        candidates = snapshot_index(orders, "telegram_user_id").get_all(tg_id)
+        positions = {}
+        for i, o in enumerate(candidates):
+            positions.setdefault(normalize_id(o.get("id")), i)
+        total = len(candidates) if match is None else sum(1 for o in candidates if match(o))
+    else:
+        candidates = orders
+        positions = snapshot_positions(orders, "id")
+
+        def count():
+            return len(orders) if match is None else sum(1 for o in orders if match(o))
+        # Total mis en cache par version des données, sauf pour les plages de dates (trop de variantes).
+        total = count() if filter_key[2] or filter_key[3] else snapshot_memo(orders, ("count", filter_key), count)
+    limit = _page_limit(ORDERS_PAGE_SIZE)
+    after = normalize_id(request.args.get("after"))
+    before = normalize_id(request.args.get("before"))
+    cursor = after or before
+    if cursor and cursor not in positions:
+        return jsonify({"error": "Curseur inconnu"}), 400
+
+    if before and not after:
+        indices = range(positions[before] - 1, -1, -1)
+    else:
+        indices = range(positions[after] + 1 if after else 0, len(candidates))
+    page = []
+    for i in indices:
+        o = candidates[i]
+        if match is None or match(o):
+            page.append(o)
+            if len(page) > limit:
+                break
+    more = len(page) > limit
+    page = page[:limit]
+    if before and not after:
+        page.reverse()
+        return _paged_response(page, total, prev_cursor=page[0]["id"] if more else None)
+    return _paged_response(page, total, next_cursor=page[-1]["id"] if more else None)
+
+
+@app.route("/api/orders/summary", methods=["GET"])
+def get_orders_summary():
+    """Compteurs du panel admin (nombre, en attente, revenus), calculés une fois par version."""
+    orders = read_data("orders")["orders"] or []
+
+    def build():
+        return {
+            "count": len(orders),
+            "pending": sum(1 for o in orders if o.get("status") == "pending"),
+            "revenue_xof": sum(int(o.get("totalXof") or 0) for o in orders),
+        }
+    return jsonify(snapshot_memo(orders, "summary", build))
 
 
 @limiter.limit("20 per minute")
 @app.route("/api/orders", methods=["POST"])
 def create_order():
     """Créer une commande (depuis webapp ou bot)"""
-    data = load_data()
-    _cleanup_expired_pending_invoices(data)
     body = request.get_json() or {}
     items = body.get("items", [])
     if not items:
@@ -612,8 +1019,7 @@ def create_order():
 
     total = sum(float(i.get("price", 0)) * int(i.get("qty", 1)) for i in items)
     total_xof = sum(float(i.get("xof", 0)) * int(i.get("qty", 1)) for i in items)
-    nums = [int(o["id"].split("-")[1]) for o in data["orders"] if "-" in o.get("id", "") and o["id"].split("-")[1].isdigit()]
-    order_id = f"ORD-{max(nums, default=1000) + 1}"
+    order_id = _next_order_id()
     date = datetime.now().strftime("%Y-%m-%d")
 
     order = {
@@ -628,18 +1034,27 @@ def create_order():
         "client_phone": body.get("client_phone"),
         "client_address": body.get("client_address"),
     }
-    data["orders"].insert(0, order)
-    invoice_filename, invoice_pdf, invoice_number = _create_invoice_pdf_and_store(data, order)
+    request_rows("orders").insert(0, order)
+    _filename, _pdf_bytes, invoice_number = _create_invoice_pdf_and_store(order)
     order["invoice_number"] = invoice_number
-    save_data(data)
+    mark_dirty("orders", "invoices")
+    # Enregistrée avant les notifications : l'admin n'est jamais alerté d'une commande perdue.
+    if not commit_data():
+        return _save_failed_response()
 
-    # Alerte admin : nouvelle commande
+    # Alerte admin, facture et envoi Blob : tâches de fond, la réponse n'attend aucun appel réseau.
     _notify_admin_new_order(order, payment=order.get("payment_method") or "MoMo / TON")
-    _send_telegram_document(invoice_pdf, invoice_filename, caption=f"🧾 Facture {invoice_number} — {order.get('id')}")
+    _send_invoice_to_admins(order.get("id"), caption=f"🧾 Facture {invoice_number} — {order.get('id')}")
+    _enqueue_invoice_upload(invoice_number)
 
     return jsonify(order), 201
 
 
+def _next_order_id():
+    # Numérotation historique : ORD-1001 pour la première commande.
+    return f"ORD-{next_id('orders', lambda: [1000] + [o.get('id') for o in read_data('orders')['orders']])}"
+
+
 def _notify_admin_new_order(order, payment=None):
     """Envoie une alerte aux admins Telegram pour une nouvelle commande."""
     items_txt = "\n".join(
@@ -660,49 +1075,13 @@ def _notify_admin_new_order(order, payment=None):
     _send_telegram(msg)
 
 
-def _pdf_escape(text):
-    return str(text or "").replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
-
-
-def _build_simple_pdf(lines):
-    y = 810
-    text_ops = []
-    for line in lines:
-        text_ops.append(f"BT /F1 11 Tf 40 {y} Td ({_pdf_escape(line)}) Tj ET")
-        y -= 16
-        if y < 40:
-            break
-    stream_data = "\n".join(text_ops).encode("latin-1", "replace")
-    objects = [
-        b"1 0 obj\n<< /Type /Catalog /Pages 2 0 R >>\nendobj\n",
-        b"2 0 obj\n<< /Type /Pages /Count 1 /Kids [3 0 R] >>\nendobj\n",
-        b"3 0 obj\n<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>\nendobj\n",
-        b"4 0 obj\n<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>\nendobj\n",
-        b"5 0 obj\n<< /Length " + str(len(stream_data)).encode("ascii") + b" >>\nstream\n" + stream_data + b"\nendstream\nendobj\n",
-    ]
-    pdf = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
-    offsets = [0]
-    for obj in objects:
-        offsets.append(len(pdf))
-        pdf += obj
-    xref_pos = len(pdf)
-    size = len(objects) + 1
-    pdf += f"xref\n0 {size}\n".encode("ascii")
-    pdf += b"0000000000 65535 f \n"
-    for off in offsets[1:]:
-        pdf += f"{off:010d} 00000 n \n".encode("ascii")
-    pdf += f"trailer\n<< /Size {size} /Root 1 0 R >>\nstartxref\n{xref_pos}\n%%EOF".encode("ascii")
-    return pdf
-
-
-def _create_invoice_pdf_and_store(data, order):
-    data.setdefault("invoices", [])
-    invoice_number = f"INV-{datetime.now().strftime('%Y%m%d')}-{len(data['invoices']) + 1:04d}"
+def _invoice_lines(order, invoice_number, date=None):
+    """Texte de la facture (une ligne par élément), mis en page par render_pdf()."""
     lines = [
         "StickerStreet - Facture",
         f"Numero: {invoice_number}",
         f"Commande: {order.get('id', '-')}",
-        f"Date: {datetime.now().strftime('%Y-%m-%d %H:%M')}",
+        f"Date: {date or datetime.now().strftime('%Y-%m-%d %H:%M')}",
         "",
         f"Client: {order.get('client_name') or '-'}",
         f"Tel: {order.get('client_phone') or '-'}",
@@ -722,8 +1101,18 @@ def _create_invoice_pdf_and_store(data, order):
         "",
         "Merci pour votre confiance.",
     ]
-    pdf_bytes = _build_simple_pdf(lines)
-    filename = f"{invoice_number}_{order.get('id', 'order')}.pdf"
+    return lines
+
+
+def _create_invoice_pdf_and_store(order):
+    def existing():
+        invoices = read_data("invoices")["invoices"]
+        return [len(invoices)] + [i.get("invoice_number") for i in invoices]
+
+    # Ancienne numérotation : len(invoices) + 1 ; la séquence repart au-dessus des deux.
+    seq = next_id("invoices", existing)
+    invoice_number = f"INV-{datetime.now().strftime('%Y%m%d')}-{seq:04d}"
+    filename, pdf_bytes = _build_invoice_pdf_only(order, invoice_number)
     invoice_entry = {
         "invoice_number": invoice_number,
         "order_id": order.get("id"),
@@ -732,74 +1121,150 @@ def _create_invoice_pdf_and_store(data, order):
         "total_xof": int(order.get("totalXof", 0)),
         "client_name": order.get("client_name"),
     }
-    # Migration: on privilégie le stockage fichier (Blob) plutôt que base64.
+    # PDF en pièce jointe (hors du document) le temps que la tâche "invoice_upload" le déplace vers Blob.
     try:
-        uploaded = _upload_bytes_to_blob(
-            blob=pdf_bytes,
-            folder="invoices",
-            original_name=filename,
-            content_type="application/pdf",
-        )
-        invoice_entry["pdf_url"] = uploaded.get("url")
-        invoice_entry["pdf_pathname"] = uploaded.get("pathname")
+        invoice_entry["pdf_attachment"] = _attachments.put(pdf_bytes)
     except Exception as e:
-        app.logger.warning(f"Invoice Blob upload failed: {e}")
+        app.logger.warning(f"Invoice attachment store failed: {e}")
         invoice_entry["pdf_base64"] = base64.b64encode(pdf_bytes).decode("ascii")
-    data["invoices"].insert(0, invoice_entry)
+    invoice_entry["pdf_sha256"] = _pdf_cache.put(invoice_number, pdf_bytes)
+    request_rows("invoices").insert(0, invoice_entry)
     return filename, pdf_bytes, invoice_number
 
 
-def _build_invoice_pdf_only(order, invoice_number=None):
-    """Construit le PDF de facture sans l'enregistrer (pour renvoi à la validation)."""
+def _invoice_pdf_bytes(inv):
+    """PDF d'une facture sans appel réseau : cache disque, pièce jointe, ancien base64 ; sinon None."""
+    pdf_bytes = _pdf_cache.get(inv.get("invoice_number"), inv.get("pdf_sha256"))
+    if not pdf_bytes and inv.get("pdf_attachment"):
+        try:
+            pdf_bytes = _attachments.get(inv["pdf_attachment"])
+        except Exception as e:
+            app.logger.warning(f"Invoice attachment read failed: {e}")
+    if not pdf_bytes and inv.get("pdf_base64"):
+        try:
+            pdf_bytes = base64.b64decode(inv["pdf_base64"])
+        except Exception:
+            pdf_bytes = None
+    return pdf_bytes or None
+
+
+def _migrate_invoice_attachments():
+    """Sort une fois pour toutes les PDF base64 des anciennes factures vers les pièces jointes.
+
+    Sans facture en base64 (cas normal après le premier passage), rien n'est écrit.
+    """
+    if not any(i.get("pdf_base64") for i in read_data("invoices")["invoices"]):
+        return 0
+    work = UnitOfWork(load_data, save_data)
+    moved = []
+    for inv in work.load("invoices")["invoices"]:
+        if not inv.get("pdf_base64"):
+            continue
+        try:
+            pdf_bytes = base64.b64decode(inv["pdf_base64"])
+        except Exception:
+            continue
+        inv["pdf_attachment"] = _attachments.put(pdf_bytes)
+        inv.pop("pdf_base64", None)
+        moved.append(inv.get("invoice_number"))
+    if not moved:
+        return 0
+    work.mark_dirty("invoices")
+    if not work.commit():
+        raise RuntimeError("enregistrement des factures impossible")
+    for number in moved:
+        inv = work.index("invoices", "invoice_number").get(number)
+        if inv and not inv.get("pdf_url"):
+            _enqueue_invoice_upload(number)
+    app.logger.warning(f"{len(moved)} PDF de factures déplacés vers les pièces jointes")
+    return len(moved)
+
+
+_attachments_migration = PeriodicTask(
+    _migrate_invoice_attachments, 0, "invoice-attachments-migration", logger=app.logger, once=True,
+)
+
+
+def _enqueue_invoice_upload(invoice_number):
+    """À appeler après l'enregistrement de la facture ; sans Blob configuré, la pièce jointe reste en place."""
+    if BLOB_READ_WRITE_TOKEN:
+        _jobs.enqueue("invoice_upload", {"invoice_number": invoice_number})
+
+
+def _stored_index(collection, field, key):
+    """Index {field: documents} lu dans le stockage, sans le cache de lecture (seulement la ligne
+    cherchée en mode tables). Pour les tâches : un worker d'un autre processus peut la traiter
+    avant que son cache ne voie la commande ou la facture qui vient d'être enregistrée."""
+    return UnitOfWork(load_data, save_data, load_rows).index(collection, field, [key])
+
+
+def _job_invoice_upload(payload):
+    """Envoie le PDF d'une facture vers Vercel Blob puis remplace la pièce jointe par pdf_url."""
+    number = payload.get("invoice_number")
+    inv = _stored_index("invoices", "invoice_number", number).get(number)
+    if not inv:
+        raise PermanentJobError(f"Facture {number} introuvable")
+    if inv.get("pdf_url"):
+        return
+    pdf_bytes = _invoice_pdf_bytes(inv)
+    if not pdf_bytes:
+        raise PermanentJobError(f"PDF de la facture {number} introuvable")
+    uploaded = _upload_bytes_to_blob(
+        blob=pdf_bytes,
+        folder="invoices",
+        original_name=inv.get("filename") or f"{number}.pdf",
+        content_type="application/pdf",
+    )
+    # Relecture après l'envoi (quelques secondes) : n'écrase pas une modification faite entre-temps.
+    work = UnitOfWork(load_data, save_data, load_rows)
+    entry = work.index("invoices", "invoice_number", [number]).get(number)
+    if not entry:
+        return
+    entry["pdf_url"] = uploaded.get("url")
+    entry["pdf_pathname"] = uploaded.get("pathname")
+    entry.pop("pdf_base64", None)
+    attachment = entry.pop("pdf_attachment", None)
+    work.mark_dirty("invoices")
+    if not work.commit():
+        raise RuntimeError(f"Enregistrement de la facture {number} impossible")
+    if attachment:
+        _attachments.delete(attachment)
+
+
+_jobs.register("invoice_upload", _job_invoice_upload)
+
+
+def _build_invoice_pdf_only(order, invoice_number=None, date=None):
+    """Construit le PDF de facture sans l'enregistrer (création, renvoi à la validation)."""
     inv_num = invoice_number or order.get("invoice_number") or f"INV-VALID-{order.get('id', '')}"
-    lines = [
-        "StickerStreet - Facture",
-        f"Numero: {inv_num}",
-        f"Commande: {order.get('id', '-')}",
-        f"Date: {datetime.now().strftime('%Y-%m-%d %H:%M')}",
-        "",
-        f"Client: {order.get('client_name') or '-'}",
-        f"Tel: {order.get('client_phone') or '-'}",
-        f"Adresse: {order.get('client_address') or '-'}",
-        "",
-        "Articles:",
-    ]
-    for item in order.get("items", []):
-        qty = int(item.get("qty", 1))
-        line_total = int(float(item.get("xof", 0)) * qty)
-        size = item.get("sz") or "-"
-        lines.append(f"- {item.get('name', '?')} x{qty} ({size}) : {line_total} F")
-    lines += [
-        "",
-        f"Total: {int(order.get('totalXof', 0))} F CFA",
-        f"Paiement: {order.get('payment_method', 'MoMo / TON')}",
-        "",
-        "Merci pour votre confiance.",
+    return f"{inv_num}_{order.get('id', 'order')}.pdf", render_pdf(_invoice_lines(order, inv_num, date))
+
+
+def _build_invoice_pdfs(orders):
+    """[(filename, pdf_bytes)] pour une liste de (commande, numéro de facture, date) en un appel."""
+    documents = [_invoice_lines(order, number, date) for order, number, date in orders]
+    return [
+        (f"{number}_{order.get('id', 'order')}.pdf", pdf_bytes)
+        for (order, number, _date), pdf_bytes in zip(orders, render_pdfs(documents))
     ]
-    pdf_bytes = _build_simple_pdf(lines)
-    filename = f"{inv_num}_{order.get('id', 'order')}.pdf"
-    return filename, pdf_bytes
 
 
-def _get_invoice_pdf_for_order(data, order):
-    """Retourne (filename, pdf_bytes) pour une commande, ou (None, None) si indisponible."""
+def _get_invoice_pdf_for_order(invoices_by_order, order):
+    """Retourne (filename, pdf_bytes) pour une commande (invoices_by_order : index par order_id)."""
     order_id = order.get("id")
-    for inv in data.get("invoices", []):
-        if inv.get("order_id") == order_id:
-            if inv.get("pdf_base64"):
-                try:
-                    pdf_bytes = base64.b64decode(inv["pdf_base64"])
-                    return (inv.get("filename") or f"invoice_{order_id}.pdf", pdf_bytes)
-                except Exception:
-                    pass
-            if inv.get("pdf_url"):
-                try:
-                    with urllib.request.urlopen(inv["pdf_url"], timeout=10) as resp:
-                        pdf_bytes = resp.read()
-                    return (inv.get("filename") or f"invoice_{order_id}.pdf", pdf_bytes)
-                except Exception:
-                    pass
-            break
+    inv = invoices_by_order.get(order_id)
+    if inv:
+        filename = inv.get("filename") or f"invoice_{order_id}.pdf"
+        pdf_bytes = _invoice_pdf_bytes(inv)
+        if not pdf_bytes and inv.get("pdf_url"):
+            try:
+                pdf_bytes = _http.request("GET", inv["pdf_url"], timeout=HTTP_TIMEOUT).body
+            except Exception:
+                pdf_bytes = None
+        if pdf_bytes:
+            if inv.get("invoice_number"):
+                _pdf_cache.put(inv["invoice_number"], pdf_bytes)
+            return (filename, pdf_bytes)
     filename, pdf_bytes = _build_invoice_pdf_only(order)
     return (filename, pdf_bytes)
 
@@ -821,45 +1286,99 @@ def _multipart_build(fields, file_field, filename, file_bytes, content_type):
     return boundary, bytes(payload)
 
 
-def _send_telegram_document(file_bytes, filename, caption=""):
-    """Envoie un PDF aux admins Telegram."""
+def _telegram_call(method, body, content_type, timeout=HTTP_TIMEOUT):
+    """Appel à l'API Bot ; 400/403 (chat inconnu, bot bloqué) sont définitifs, le reste est réessayé."""
+    url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/{method}"
+    try:
+        _http.request("POST", url, body=body, headers={"Content-Type": content_type}, timeout=timeout)
+    except urllib.error.HTTPError as e:
+        if e.code in (400, 401, 403, 404):
+            raise PermanentJobError(f"Telegram {method} refusé ({e.code})") from e
+        raise
+
+
+def _send_invoice_to_admins(order_id, caption=""):
+    """Envoie la facture d'une commande aux admins Telegram (une tâche par admin : un échec ne
+    renvoie pas aux autres). La tâche ne porte que l'id de commande : le PDF est relu au moment
+    de l'envoi (cache disque, pièce jointe, Blob) ou reconstruit."""
     if not TELEGRAM_BOT_TOKEN or not ADMIN_TELEGRAM_IDS:
         return
-    url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendDocument"
     for chat_id in ADMIN_TELEGRAM_IDS:
-        try:
-            boundary, body = _multipart_build(
-                fields={"chat_id": chat_id, "caption": caption[:1024]},
-                file_field="document",
-                filename=filename,
-                file_bytes=file_bytes,
-                content_type="application/pdf",
-            )
-            req = urllib.request.Request(
-                url,
-                data=body,
-                method="POST",
-                headers={"Content-Type": f"multipart/form-data; boundary={boundary}"},
-            )
-            urllib.request.urlopen(req, timeout=15)
-        except Exception as e:
-            app.logger.warning(f"Telegram sendDocument failed for {chat_id}: {e}")
+        _jobs.enqueue("telegram_document", {"chat_id": chat_id, "order_id": order_id, "caption": caption[:1024]})
 
 
-def _cleanup_expired_pending_invoices(data):
-    """Nettoie les factures Stars en attente expirées."""
-    data.setdefault("pending_invoices", {})
-    now_ts = int(time.time())
-    ttl = max(60, int(PENDING_INVOICE_TTL_SECONDS))
-    stale_ids = []
-    for inv_id, payload in data["pending_invoices"].items():
-        created_ts = int((payload or {}).get("created_at_ts") or 0)
-        if created_ts <= 0 or (now_ts - created_ts) > ttl:
-            stale_ids.append(inv_id)
-    for inv_id in stale_ids:
-        data["pending_invoices"].pop(inv_id, None)
-    if stale_ids:
-        save_data(data)
+def _job_telegram_document(payload):
+    if payload.get("pdf_base64"):
+        # Tâche enregistrée avant le passage par référence : le PDF est dans la charge utile.
+        filename, pdf_bytes = payload.get("filename") or "facture.pdf", base64.b64decode(payload["pdf_base64"])
+    else:
+        order_id = payload.get("order_id")
+        order = _stored_index("orders", "id", order_id).get(order_id)
+        if not order:
+            raise PermanentJobError(f"Commande {order_id} introuvable")
+        filename, pdf_bytes = _get_invoice_pdf_for_order(_stored_index("invoices", "order_id", order_id), order)
+    boundary, body = _multipart_build(
+        fields={"chat_id": payload["chat_id"], "caption": payload.get("caption") or ""},
+        file_field="document",
+        filename=filename,
+        file_bytes=pdf_bytes,
+        content_type="application/pdf",
+    )
+    _telegram_call("sendDocument", body, f"multipart/form-data; boundary={boundary}", timeout=HTTP_UPLOAD_TIMEOUT)
+
+
+def _job_order_invoice_document(payload):
+    """Tâches enregistrées avant le passage par référence : une tâche telegram_document par admin."""
+    _send_invoice_to_admins(payload.get("order_id"), caption=payload.get("caption") or "")
+
+
+_jobs.register("telegram_document", _job_telegram_document)
+_jobs.register("order_invoice_document", _job_order_invoice_document)
+
+
+def _pending_invoice_cutoff():
+    """Une facture Stars créée avant ce timestamp est expirée."""
+    return int(time.time()) - max(60, int(PENDING_INVOICE_TTL_SECONDS))
+
+
+def _pending_invoice_expired(payload):
+    created_ts = int((payload or {}).get("created_at_ts") or 0)
+    return created_ts <= 0 or created_ts < _pending_invoice_cutoff()
+
+
+def _pending_expiry_index(pending):
+    """[(created_at_ts, invoice_id)] trié, construit une fois par version de pending_invoices."""
+    return snapshot_memo(pending, "expiry", lambda: sorted(
+        (int((p or {}).get("created_at_ts") or 0), inv_id) for inv_id, p in pending.items()
+    ))
+
+
+def _sweep_expired_pending_invoices():
+    """Retire en un seul enregistrement les factures Stars expirées ; renvoie leur nombre.
+
+    L'index trié donne directement les expirées (bisect) : rien n'est écrit, ni même
+    parcouru, s'il n'y en a aucune.
+    """
+    expiry = _pending_expiry_index(read_data("pending_invoices")["pending_invoices"])
+    expired = expiry[:bisect.bisect_left(expiry, (_pending_invoice_cutoff(),))]
+    if not expired:
+        return 0
+    work = UnitOfWork(load_data, save_data)
+    pending = work.load("pending_invoices").setdefault("pending_invoices", {})
+    for _ts, inv_id in expired:
+        pending.pop(inv_id, None)
+    work.mark_dirty("pending_invoices")
+    if not work.commit():
+        raise RuntimeError("enregistrement de pending_invoices impossible")
+    return len(expired)
+
+
+_pending_sweeper = PeriodicTask(
+    _sweep_expired_pending_invoices,
+    PENDING_INVOICE_SWEEP_INTERVAL,
+    "pending-invoices-sweeper",
+    logger=app.logger,
+)
 
 
 @app.route("/api/orders/<order_id>/status", methods=["PATCH"])
@@ -868,31 +1387,27 @@ def update_order_status(order_id):
     auth_err = _require_admin_api_key()
     if auth_err:
         return auth_err
-    data = load_data()
     body = request.get_json() or {}
     status = body.get("status")
-    if status not in data.get("statuses", {}):
+    if status not in read_data("statuses")["statuses"]:
         return jsonify({"error": "Statut invalide"}), 400
 
-    for o in data["orders"]:
-        if o["id"] == order_id:
-            o["status"] = status
-            save_data(data)
-            if status == "confirmed":
-                filename, pdf_bytes = _get_invoice_pdf_for_order(data, o)
-                if pdf_bytes:
-                    _send_telegram_document(
-                        pdf_bytes, filename,
-                        caption=f"✅ Facture validée — {o.get('id', '')}",
-                    )
-            return jsonify(o)
-    return jsonify({"error": "Commande introuvable"}), 404
+    o = request_index("orders", "id", [order_id]).get(order_id)
+    if not o:
+        return jsonify({"error": "Commande introuvable"}), 404
+    o["status"] = status
+    mark_dirty("orders")
+    if not commit_data():
+        return _save_failed_response()
+    if status == "confirmed" and TELEGRAM_BOT_TOKEN and ADMIN_TELEGRAM_IDS:
+        _send_invoice_to_admins(o.get("id"), caption=f"✅ Facture validée — {o.get('id', '')}")
+    return jsonify(o)
 
 
 @app.route("/api/statuses", methods=["GET"])
 def get_statuses():
-    data = load_data()
-    return jsonify(data["statuses"])
+    data = read_data("statuses")
+    return _catalog_response(data["statuses"])
 
 
 def _env_float(key, default, min_val=0.01):
@@ -917,31 +1432,72 @@ XOF_PER_USD = _env_float("XOF_PER_USD", "600", 1)
 STARS_PER_TON = _env_float("STARS_PER_TON", "95", 1)
 XOF_PER_STAR_FALLBACK = _env_float("XOF_PER_STAR_FALLBACK", "600", 1)  # F par Star (secours)
 TON_FALLBACK_USD = _env_float("TON_FALLBACK_USD", "7", 0.01)  # $ par TON (secours)
+# Cours TON/USD : rafraîchi toutes les TON_RATE_TTL s, servi périmé jusqu'à TON_RATE_MAX_STALE s
+TON_RATE_TTL = _env_float("TON_RATE_TTL", "60", 5)
+TON_RATE_MAX_STALE = _env_float("TON_RATE_MAX_STALE", "21600", 5)
 
 
 def _fetch_ton_usd():
-    """Récupère le prix TON en USD via CoinGecko. Retourne 0 si échec."""
-    try:
-        url = "https://api.coingecko.com/api/v3/simple/price?ids=ton&vs_currencies=usd"
-        with urllib.request.urlopen(url, timeout=5) as resp:
-            data = json.loads(resp.read().decode())
-        return float(data.get("ton", {}).get("usd", 0))
-    except Exception:
-        return 0
+    """Récupère le prix TON en USD via CoinGecko (lève en cas d'échec)."""
+    url = "https://api.coingecko.com/api/v3/simple/price?ids=ton&vs_currencies=usd"
+    # Pas de nouvel essai immédiat : le cache garde l'ancienne valeur et réessaie au prochain cycle.
+    data = _http.request("GET", url, timeout=HTTP_TIMEOUT, retries=0).json()
+    return float(data.get("ton", {}).get("usd", 0))
+
+
+# Dernier cours valide conservé entre deux démarrages (kv_store en mode Neon, fichier sinon).
+if USE_NEON:
+    from db import get_setting as _get_setting, set_setting as _set_setting
+
+    def _load_saved_rate():
+        return _get_setting("rate:ton_usd")
+
+    def _save_rate(saved):
+        _set_setting("rate:ton_usd", saved)
+else:
+    _RATE_FILE = f"{DATA_FILE}.rates"
+
+    def _load_saved_rate():
+        if not os.path.exists(_RATE_FILE):
+            return None
+        with open(_RATE_FILE, "r", encoding="utf-8") as f:
+            return json.load(f).get("ton_usd")
+
+    def _save_rate(saved):
+        tmp = f"{_RATE_FILE}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"ton_usd": saved}, f)
+        os.replace(tmp, _RATE_FILE)
+
+
+_ton_rate = CachedRate(
+    _fetch_ton_usd,
+    ttl=TON_RATE_TTL,
+    max_stale=TON_RATE_MAX_STALE,
+    load_saved=_load_saved_rate,
+    save=_save_rate,
+    logger=app.logger,
+)
+
+
+def _get_ton_rate():
+    """(prix TON en USD, âge du cours en s, source) : cache CoinGecko, ou fallback (jamais 0)."""
+    value, age = _ton_rate.get()
+    if value:
+        return value, age, ("live" if age <= TON_RATE_TTL else "stale")
+    return (TON_FALLBACK_USD if TON_FALLBACK_USD > 0 else 7.0), age, "fallback"
 
 
 def _get_ton_usd():
-    """Prix TON en USD : CoinGecko ou fallback (jamais 0)."""
-    v = _fetch_ton_usd()
-    fallback = TON_FALLBACK_USD if TON_FALLBACK_USD > 0 else 7.0
-    return v if v > 0 else fallback
+    """Prix TON en USD sans attendre CoinGecko (voir _get_ton_rate)."""
+    return _get_ton_rate()[0]
 
 
 @app.route("/api/rates/ton", methods=["GET"])
 def get_ton_rate():
     """Retourne le prix TON en USD et le montant TON équivalent pour un total XOF donné."""
     total_xof = request.args.get("total_xof", type=float) or 0
-    ton_usd = _get_ton_usd()
+    ton_usd, age, source = _get_ton_rate()
     if XOF_PER_USD <= 0 or ton_usd <= 0:
         return jsonify({"error": "Taux indisponible", "ton_usd": 0, "amount_ton": 0}), 503
     amount_usd = total_xof / XOF_PER_USD
@@ -951,6 +1507,8 @@ def get_ton_rate():
         "xof_per_usd": XOF_PER_USD,
         "amount_ton": round(amount_ton, 6),
         "amount_usd": round(amount_usd, 2),
+        "rate_age_s": None if age is None else int(age),
+        "rate_source": source,
     })
 
 
@@ -977,8 +1535,7 @@ def create_invoice_stars():
     if total_stars < 0.01:
         return jsonify({"error": "Montant invalide"}), 400
     stars_int = max(1, int(round(total_stars)))
-    data = load_data()
-    _cleanup_expired_pending_invoices(data)
+    data = request_data("pending_invoices")
     data.setdefault("pending_invoices", {})
     inv_id = f"inv_{int(time.time() * 1000)}_{hashlib.md5(json.dumps(items).encode()).hexdigest()[:8]}"
     data["pending_invoices"][inv_id] = {
@@ -988,7 +1545,7 @@ def create_invoice_stars():
         "client_address": body.get("client_address"),
         "created_at_ts": int(time.time()),
     }
-    save_data(data)
+    mark_dirty("pending_invoices")
 
     title = "StickerStreet — Commande"
     description = f"{len(items)} article(s) — {stars_int} ★"
@@ -1002,9 +1559,7 @@ def create_invoice_stars():
     try:
         url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/createInvoiceLink"
         req_data = json.dumps(api_payload).encode("utf-8")
-        req = urllib.request.Request(url, data=req_data, method="POST", headers={"Content-Type": "application/json"})
-        with urllib.request.urlopen(req, timeout=10) as resp:
-            result = json.loads(resp.read().decode())
+        result = _http.request("POST", url, body=req_data, headers={"Content-Type": "application/json"}, timeout=HTTP_TIMEOUT).json()
         if result.get("ok") and result.get("result"):
             return jsonify({"url": result["result"]})
         err_msg = result.get("description", "Erreur inconnue Telegram")
@@ -1025,20 +1580,19 @@ def create_invoice_stars():
 @app.route("/api/orders/from-invoice", methods=["POST"])
 def create_order_from_invoice():
     """Crée une commande à partir d'un invoice_id (appelé par le bot après paiement Stars)."""
-    data = load_data()
-    _cleanup_expired_pending_invoices(data)
+    data = request_data("pending_invoices")
     data.setdefault("pending_invoices", {})
     body = request.get_json() or {}
     inv_id = body.get("invoice_id") or body.get("invoice_payload")
-    if not inv_id or inv_id not in data["pending_invoices"]:
+    # Les expirées sont purgées par _pending_sweeper ; en attendant, elles sont refusées ici.
+    if not inv_id or inv_id not in data["pending_invoices"] or _pending_invoice_expired(data["pending_invoices"][inv_id]):
         return jsonify({"error": "Facture introuvable ou expirée"}), 404
     pending = data["pending_invoices"].pop(inv_id)
-    save_data(data)
+    mark_dirty("pending_invoices")
     items = pending["items"]
     total = sum(float(i.get("price", 0)) * int(i.get("qty", 1)) for i in items)
     total_xof = sum(float(i.get("xof", 0)) * int(i.get("qty", 1)) for i in items)
-    nums = [int(o["id"].split("-")[1]) for o in data["orders"] if "-" in o.get("id", "") and o["id"].split("-")[1].isdigit()]
-    order_id = f"ORD-{max(nums, default=1000) + 1}"
+    order_id = _next_order_id()
     order = {
         "id": order_id,
         "items": items,
@@ -1052,21 +1606,33 @@ def create_order_from_invoice():
         "client_address": pending.get("client_address"),
         "payment_method": "stars",
     }
-    data["orders"].insert(0, order)
-    invoice_filename, invoice_pdf, invoice_number = _create_invoice_pdf_and_store(data, order)
+    request_rows("orders").insert(0, order)
+    _filename, _pdf_bytes, invoice_number = _create_invoice_pdf_and_store(order)
     order["invoice_number"] = invoice_number
-    save_data(data)
+    mark_dirty("orders", "invoices")
+    if not commit_data():
+        return _save_failed_response()
 
     _notify_admin_new_order(order, payment="Stars ★")
-    _send_telegram_document(invoice_pdf, invoice_filename, caption=f"🧾 Facture {invoice_number} — {order.get('id')}")
+    _send_invoice_to_admins(order.get("id"), caption=f"🧾 Facture {invoice_number} — {order.get('id')}")
+    _enqueue_invoice_upload(invoice_number)
 
     return jsonify(order), 201
 
 
 @app.route("/api/momo", methods=["GET"])
 def get_momo():
-    data = load_data()
-    return jsonify(data["momo"])
+    data = read_data("momo")
+    return _catalog_response(data["momo"])
+
+
+def _next_client_id():
+    def existing():
+        clients = read_data("clients")["clients"]
+        return [len(clients)] + [c.get("id") for c in clients]
+
+    # Anciens identifiants : CLI-{len(clients) + 1}.
+    return f"CLI-{next_id('clients', existing)}"
 
 
 @limiter.limit("10 per minute")
@@ -1096,17 +1662,16 @@ def auth_telegram():
         return jsonify({"error": "Session expirée"}), 400
 
     name = f"{first_name} {last_name}".strip() or username or f"User{user_id}"
-    data = load_data()
-    data.setdefault("clients", [])
-    existing = next((c for c in data["clients"] if c.get("telegram_user_id") == user_id), None)
+    clients_by_tg = request_index("clients", "telegram_user_id", [user_id])
+    existing = clients_by_tg.get(user_id)
     if existing:
         existing["name"] = name
         existing["telegram_username"] = username
         existing["updated_at"] = datetime.now().isoformat()
-        save_data(data)
+        mark_dirty("clients")
         return jsonify({"telegram_user_id": user_id, "name": name, "username": username, "client": existing})
     client = {
-        "id": f"CLI-{len(data['clients']) + 1}",
+        "id": _next_client_id(),
         "telegram_user_id": user_id,
         "telegram_username": username,
         "name": name,
@@ -1114,8 +1679,9 @@ def auth_telegram():
         "address": "",
         "created_at": datetime.now().isoformat(),
     }
-    data["clients"].append(client)
-    save_data(data)
+    request_rows("clients").append(client)
+    clients_by_tg.add(client)
+    mark_dirty("clients")
     return jsonify({"telegram_user_id": user_id, "name": name, "username": username, "client": client}), 201
 
 
@@ -1168,17 +1734,16 @@ def auth_telegram_miniapp():
     last_name = user.get("last_name", "")
     username = user.get("username", "")
     name = f"{first_name} {last_name}".strip() or username or f"User{user_id}"
-    data = load_data()
-    data.setdefault("clients", [])
-    existing = next((c for c in data["clients"] if str(c.get("telegram_user_id")) == str(user_id)), None)
+    clients_by_tg = request_index("clients", "telegram_user_id", [user_id])
+    existing = clients_by_tg.get(user_id)
     if existing:
         existing["name"] = name
         existing["telegram_username"] = username
         existing["updated_at"] = datetime.now().isoformat()
-        save_data(data)
+        mark_dirty("clients")
         return jsonify({"telegram_user_id": user_id, "name": name, "username": username, "client": existing})
     client = {
-        "id": f"CLI-{len(data['clients']) + 1}",
+        "id": _next_client_id(),
         "telegram_user_id": user_id,
         "telegram_username": username,
         "name": name,
@@ -1186,16 +1751,15 @@ def auth_telegram_miniapp():
         "address": "",
         "created_at": datetime.now().isoformat(),
     }
-    data["clients"].append(client)
-    save_data(data)
+    request_rows("clients").append(client)
+    clients_by_tg.add(client)
+    mark_dirty("clients")
     return jsonify({"telegram_user_id": user_id, "name": name, "username": username, "client": client}), 201
 
 
 @app.route("/api/register", methods=["POST"])
 def register_client():
     """Inscription client depuis le bot Telegram."""
-    data = load_data()
-    data.setdefault("clients", [])
     body = request.get_json() or {}
     tg_id = body.get("telegram_user_id")
     name = (body.get("name") or "").strip()
@@ -1206,36 +1770,37 @@ def register_client():
     if not name:
         return jsonify({"error": "Nom requis"}), 400
 
-    existing = next((c for c in data["clients"] if c.get("telegram_user_id") == tg_id), None)
+    clients_by_tg = request_index("clients", "telegram_user_id", [tg_id])
+    existing = clients_by_tg.get(tg_id)
     if existing:
         existing["name"] = name
         existing["phone"] = phone
         existing["address"] = address
         existing["updated_at"] = datetime.now().isoformat()
-        save_data(data)
+        mark_dirty("clients")
         return jsonify(existing)
     client = {
-        "id": f"CLI-{len(data['clients']) + 1}",
+        "id": _next_client_id(),
         "telegram_user_id": tg_id,
         "name": name,
         "phone": phone,
         "address": address,
         "created_at": datetime.now().isoformat(),
     }
-    data["clients"].append(client)
-    save_data(data)
+    request_rows("clients").append(client)
+    clients_by_tg.add(client)
+    mark_dirty("clients")
     return jsonify(client), 201
 
 
 @app.route("/api/profile", methods=["GET"])
 def get_profile():
     """Récupère le profil client par telegram_user_id."""
-    data = load_data()
-    data.setdefault("clients", [])
-    tg_id = request.args.get("telegram_user_id", type=int)
+    data = read_data("clients")
+    tg_id = (request.args.get("telegram_user_id") or "").strip()
     if not tg_id:
         return jsonify({"error": "telegram_user_id requis"}), 400
-    client = next((c for c in data["clients"] if c.get("telegram_user_id") == tg_id), None)
+    client = snapshot_index(data["clients"], "telegram_user_id").get(tg_id)
     if not client:
         return jsonify({"error": "Profil non trouvé"}), 404
     return jsonify(client)
@@ -1244,13 +1809,11 @@ def get_profile():
 @app.route("/api/profile", methods=["PATCH"])
 def update_profile():
     """Met à jour le profil client (nom, téléphone, adresse)."""
-    data = load_data()
-    data.setdefault("clients", [])
     body = request.get_json() or {}
     tg_id = body.get("telegram_user_id")
     if not tg_id:
         return jsonify({"error": "telegram_user_id requis"}), 400
-    client = next((c for c in data["clients"] if c.get("telegram_user_id") == tg_id), None)
+    client = request_index("clients", "telegram_user_id", [tg_id]).get(tg_id)
     if not client:
         return jsonify({"error": "Profil non trouvé"}), 404
     if "name" in body and body["name"] is not None:
@@ -1260,7 +1823,7 @@ def update_profile():
     if "address" in body and body["address"] is not None:
         client["address"] = str(body["address"]).strip()
     client["updated_at"] = datetime.now().isoformat()
-    save_data(data)
+    mark_dirty("clients")
     return jsonify(client)
 
 
@@ -1281,74 +1844,346 @@ def health():
         "status": "ok",
         "service": "stickerstreet-api",
         "database": "neon" if USE_NEON else "file",
+        "storage": _neon_storage() if USE_NEON else "file",
+        "cache": _read_cache.stats(),
+        **({"db_pool": pool_stats()} if USE_NEON else {"journal": _file_store.stats()}),
+        "jobs": _jobs.stats(),
+        "http": _http.stats(),
+        "ton_rate": _ton_rate.stats(),
+        "pending_invoices_sweeper": _pending_sweeper.stats(),
+        "pdf_cache": _pdf_cache.stats(),
+        "chat_wait": _chat_hub.stats(),
         "warnings": warnings,
     })
 
 
-def _send_telegram(text):
-    """Envoie un message à l'admin via Telegram."""
+def _send_telegram(text, reply_markup=None):
+    """Envoie un message aux admins via Telegram (tâche de fond, une par admin)."""
     if not TELEGRAM_BOT_TOKEN or not ADMIN_TELEGRAM_IDS:
         return
-    try:
-        url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-        for chat_id in ADMIN_TELEGRAM_IDS:
-            req_data = urllib.parse.urlencode({"chat_id": chat_id, "text": text, "parse_mode": "HTML"}).encode()
-            req = urllib.request.Request(url, data=req_data, method="POST", headers={"Content-Type": "application/x-www-form-urlencoded"})
-            urllib.request.urlopen(req, timeout=5)
-    except Exception as e:
-        app.logger.warning(f"Telegram send failed: {e}")
+    for chat_id in ADMIN_TELEGRAM_IDS:
+        payload = {"chat_id": chat_id, "text": text}
+        if reply_markup:
+            payload["reply_markup"] = reply_markup
+        _jobs.enqueue("telegram_message", payload)
+
+
+def _job_telegram_message(payload):
+    fields = {"chat_id": payload["chat_id"], "text": payload["text"], "parse_mode": "HTML"}
+    if payload.get("reply_markup"):
+        fields["reply_markup"] = json.dumps(payload["reply_markup"], ensure_ascii=False)
+    req_data = urllib.parse.urlencode(fields).encode()
+    _telegram_call("sendMessage", req_data, "application/x-www-form-urlencoded")
+
+
+_jobs.register("telegram_message", _job_telegram_message)
+
+
+@app.route("/api/jobs", methods=["GET"])
+def list_jobs():
+    """Tâches de fond d'un statut (dead par défaut : lettres mortes à relancer)."""
+    auth_err = _require_admin_api_key()
+    if auth_err:
+        return auth_err
+    status = request.args.get("status") or "dead"
+    if status not in ("pending", "running", "dead"):
+        return jsonify({"error": "Statut invalide"}), 400
+    return jsonify({"jobs": _job_store.list(status, _page_limit(50)), "stats": _jobs.stats()})
+
+
+@app.route("/api/jobs/<int:job_id>/retry", methods=["POST"])
+def retry_job(job_id):
+    """Relance une tâche en lettre morte."""
+    auth_err = _require_admin_api_key()
+    if auth_err:
+        return auth_err
+    if not _job_store.requeue(job_id):
+        return jsonify({"error": "Tâche introuvable ou pas en lettre morte"}), 404
+    _jobs.wake()
+    return jsonify({"ok": True, "id": job_id})
+
+
+def _invoice_day(inv):
+    """AAAA-MM-JJ de la facture : created_at, sinon la date du numéro INV-AAAAMMJJ-nnnn."""
+    created = str(inv.get("created_at") or "")
+    if len(created) >= 10:
+        return created[:10]
+    m = re.match(r"^INV-(\d{4})(\d{2})(\d{2})-", str(inv.get("invoice_number") or ""))
+    return f"{m.group(1)}-{m.group(2)}-{m.group(3)}" if m else ""
+
+
+def _export_invoice_pdf(inv):
+    """PDF d'une facture pour l'export : cache, pièce jointe, sinon Vercel Blob ; None s'il faut le régénérer.
+
+    Pas de mise en cache : un export mensuel chasserait du cache les factures récentes.
+    """
+    pdf_bytes = _invoice_pdf_bytes(inv)
+    if not pdf_bytes and inv.get("pdf_url"):
+        try:
+            pdf_bytes = _http.request("GET", inv["pdf_url"], timeout=HTTP_TIMEOUT).body
+        except Exception as e:
+            app.logger.warning(f"Export: PDF {inv.get('invoice_number')} indisponible sur Blob: {e}")
+    return pdf_bytes or None
+
+
+def _export_pdf_entries(invoices, orders_by_id):
+    """(nom, [pdf], False) par facture, par lots de EXPORT_FETCH_WORKERS * 4.
+
+    Un lot est lu en parallèle (au plus EXPORT_FETCH_WORKERS lectures à la fois) ; les PDF
+    introuvables sont régénérés d'un coup depuis la commande. Seul le lot en cours est en mémoire.
+    """
+    with ThreadPoolExecutor(EXPORT_FETCH_WORKERS, thread_name_prefix="invoice-export") as pool:
+        for chunk in batched(invoices, EXPORT_FETCH_WORKERS * 4):
+            found = list(pool.map(_export_invoice_pdf, chunk))
+            orders = [orders_by_id.get(inv.get("order_id")) if pdf_bytes is None else None for inv, pdf_bytes in zip(chunk, found)]
+            rendered = iter(_build_invoice_pdfs([
+                (order, inv.get("invoice_number"), str(inv.get("created_at") or "")[:16].replace("T", " ") or None)
+                for inv, order in zip(chunk, orders) if order
+            ]))
+            for inv, pdf_bytes, order in zip(chunk, found, orders):
+                if pdf_bytes is None:
+                    if not order:
+                        app.logger.warning(f"Export: facture {inv.get('invoice_number')} sans PDF ni commande")
+                        continue
+                    pdf_bytes = next(rendered)[1]
+                filename = inv.get("filename") or f"{inv.get('invoice_number')}_{inv.get('order_id')}.pdf"
+                yield f"factures/{filename}", [pdf_bytes], False
+
+
+@app.route("/api/invoices/export", methods=["GET"])
+def export_invoices():
+    """Export comptable des factures du ?from=AAAA-MM-JJ au ?to=AAAA-MM-JJ (inclus).
+
+    ZIP en flux (factures.csv puis un PDF par facture) ; ?format=csv : registre CSV seul.
+    """
+    auth_err = _require_admin_api_key()
+    if auth_err:
+        return auth_err
+    start = (request.args.get("from") or "").strip()
+    end = (request.args.get("to") or "").strip()
+    for value in (start, end):
+        if value and not re.match(r"^\d{4}-\d{2}-\d{2}$", value):
+            return jsonify({"error": "Dates au format AAAA-MM-JJ"}), 400
+    invoices = [
+        inv for inv in read_data("invoices")["invoices"]
+        if (not start or _invoice_day(inv) >= start) and (not end or _invoice_day(inv) <= end)
+    ]
+    invoices.reverse()  # les factures sont enregistrées de la plus récente à la plus ancienne
+    ledger = csv_chunks(
+        ["invoice_number", "order_id", "total_xof", "created_at"],
+        ([inv.get("invoice_number"), inv.get("order_id"), inv.get("total_xof"), inv.get("created_at")] for inv in invoices),
+    )
+    name = f"factures_{start or 'debut'}_{end or 'fin'}"
+    if request.args.get("format") == "csv":
+        return Response(ledger, mimetype="text/csv", headers={"Content-Disposition": f'attachment; filename="{name}.csv"'})
+    orders_by_id = snapshot_index(read_data("orders")["orders"], "id")
+
+    def entries():
+        yield "factures.csv", ledger, True
+        yield from _export_pdf_entries(invoices, orders_by_id)
+
+    return Response(
+        stream_zip(entries()),
+        mimetype="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{name}.zip"'},
+    )
+
+
+def _chat_id(msg, pos):
+    """Id d'un message : attribué par la séquence "chat" ; sa position pour un message d'avant les ids."""
+    msg_id = msg.get("id")
+    return pos if msg_id is None else msg_id
+
+
+def _chat_threads(messages):
+    """{telegram_user_id: ([ids croissants], [positions])} par instantané.
+
+    Les messages sans telegram_user_id (anciens, ou webapp hors Telegram) forment le fil None.
+    """
+    def build():
+        entries = {}
+        for pos, msg in enumerate(messages):
+            entries.setdefault(normalize_id(msg.get("telegram_user_id")), []).append((_chat_id(msg, pos), pos))
+        threads = {}
+        for thread, items in entries.items():
+            items.sort()
+            threads[thread] = ([i for i, _pos in items], [pos for _i, pos in items])
+        return threads
+    return snapshot_memo(messages, ("chat_threads",), build)
+
+
+def _chat_since():
+    """Id du dernier message déjà reçu : ?since=id, ou ancien curseur ?after=id (= since + 1)."""
+    since = request.args.get("since", type=int)
+    if since is None and request.args.get("after", type=int) is not None:
+        since = request.args.get("after", type=int) - 1
+    return since
+
+
+def _chat_page(messages, thread, since=None):
+    """Page des messages d'un fil, chacun avec son id.
+
+    Sans curseur : les CHAT_PAGE_SIZE derniers. since : messages d'id > since (X-Next-Cursor :
+    valeur à passer en ?after=). ?before=id : page précédente.
+    """
+    ids, positions = _chat_threads(messages).get(thread, ([], []))
+    limit = _page_limit(CHAT_PAGE_SIZE)
+    before = request.args.get("before", type=int)
+    if since is not None:
+        start = bisect.bisect_right(ids, since)
+        end = min(len(ids), start + limit)
+    else:
+        end = len(ids) if before is None else bisect.bisect_left(ids, before)
+        start = max(0, end - limit)
+    next_cursor = ids[end - 1] + 1 if end > start else (since + 1 if since is not None else 0)
+    return (
+        [dict(messages[pos], id=ids[start + n]) for n, pos in enumerate(positions[start:end])],
+        len(ids),
+        next_cursor,
+        ids[start] if since is None and start > 0 else None,
+    )
+
+
+def _chat_response(page):
+    items, total, next_cursor, prev_cursor = page
+    return _paged_response(items, total, next_cursor=next_cursor, prev_cursor=prev_cursor)
+
+
+def _chat_thread():
+    """Fil du demandeur : (thread, None), ou (None, réponse d'erreur).
+
+    Le fil d'un client est l'id Telegram de l'init_data validée (en-tête X-Telegram-Init-Data,
+    comme l'envoie la Mini App) ; sans init_data, c'est le fil anonyme (None). Un
+    telegram_user_id passé en paramètre ne choisit rien : il doit être celui de l'init_data.
+    """
+    init_data = (request.headers.get("X-Telegram-Init-Data") or "").strip()
+    thread = None
+    if init_data:
+        user = _validate_init_data(init_data)
+        if not user or normalize_id(user.get("id")) is None:
+            return None, (jsonify({"error": "init_data invalide ou expirée"}), 401)
+        thread = normalize_id(user.get("id"))
+    if request.method == "GET":
+        requested = request.args.get("telegram_user_id")
+    else:
+        requested = (request.get_json(silent=True) or {}).get("telegram_user_id")
+    requested = normalize_id(requested)
+    if requested is not None and requested != thread:
+        if thread is None:
+            return None, (jsonify({"error": "init_data requis pour ce fil"}), 401)
+        return None, (jsonify({"error": "Fil d'un autre client"}), 403)
+    return thread, None
 
 
 @app.route("/api/chat", methods=["GET"])
 def get_chat():
-    """Récupère tous les messages du support."""
-    data = load_data()
-    messages = data.get("chat", [])
-    if not messages:
+    """Messages du fil du client (init_data, voir _chat_thread), paginés (voir _chat_page).
+
+    ?since=id&wait=s : long-poll, la réponse part dès qu'un message arrive sur le fil
+    (au plus CHAT_WAIT_MAX secondes, liste vide sinon). Au plus CHAT_WAIT_PER_CLIENT
+    attentes à la fois par client : au-delà, 429.
+    """
+    thread, err = _chat_thread()
+    if err:
+        return err
+    since = _chat_since()
+    messages = read_data("chat").get("chat") or []
+    page = _chat_page(messages, thread, since)
+    wait = min(max(0.0, request.args.get("wait", 0, type=float)), CHAT_WAIT_MAX)
+    if since is not None and wait and not page[0]:
+        client = thread if thread is not None else f"ip:{request.remote_addr}"
+        with _chat_hub.slot(client, CHAT_WAIT_PER_CLIENT) as granted:
+            if not granted:
+                resp = jsonify({"error": "Trop d'attentes en cours pour ce client"})
+                resp.headers["Retry-After"] = str(int(CHAT_WAIT_RECHECK) or 1)
+                return resp, 429
+            deadline = time.monotonic() + wait
+            seen = since
+            while not page[0]:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                seen = _chat_hub.wait(thread, seen, min(remaining, CHAT_WAIT_RECHECK)) or seen
+                messages = read_data("chat").get("chat") or []
+                page = _chat_page(messages, thread, since)
+    if not page[1] and since is None:
         return jsonify([{"from": "bot", "text": "Salut ! 👋 Bienvenue chez StickerStreet. Dis-moi ce qu'il te faut !", "time": datetime.now().strftime("%H:%M")}])
-    return jsonify(messages)
+    return _chat_response(page)
 
 
-@limiter.limit("30 per minute")
-@app.route("/api/chat", methods=["POST"])
-def post_chat():
-    """Le client envoie un message → stockage + notification admin Telegram."""
-    data = load_data()
+def _append_chat_message(sender, thread):
+    """Ajoute le message du corps JSON au fil thread (None : fil anonyme) ; (message, id), ou
+    (None, None) si le texte est vide ou thread n'est pas un id Telegram (numérique).
+
+    L'id vient de la séquence "chat" (comme les numéros de commande) : deux workers qui
+    enregistrent en même temps n'attribuent jamais le même.
+    """
     body = request.get_json() or {}
     text = (body.get("text") or "").strip()
-    if not text:
-        return jsonify({"error": "Message vide"}), 400
-
-    messages = data.get("chat", [])
-    time_str = datetime.now().strftime("%H:%M")
-
-    # Ajouter le message client
-    messages.append({"from": "user", "text": text, "time": time_str})
-    data["chat"] = messages
-    save_data(data)
+    if not text or (thread is not None and not thread.isdigit()):
+        return None, None
+    # Mode tables : aucune ligne lue, le message est seulement ajouté (ids attribués à la migration).
+    messages = request_rows("chat")
+    if messages and messages[0].get("id") is None:
+        # Messages d'avant les ids (toujours en tête) : leur position devient leur id, une fois.
+        for pos, m in enumerate(messages):
+            m.setdefault("id", pos)
+    msg_id = next_id("chat", lambda: [m.get("id", pos) for pos, m in enumerate(read_data("chat")["chat"])])
+    msg = {"id": msg_id, "from": sender, "text": text, "time": datetime.now().strftime("%H:%M")}
+    if thread is not None:
+        msg["telegram_user_id"] = thread
+    messages.append(msg)
+    mark_dirty("chat")
+    return msg, msg_id
+
+
+def _chat_sent_response(msg, msg_id):
+    """Message enregistré (avec son id), et les messages du fil plus récents que body.since s'il est donné."""
+    since = (request.get_json() or {}).get("since")
+    thread = normalize_id(msg.get("telegram_user_id"))
+    if isinstance(since, int):
+        return _chat_response(_chat_page(read_data("chat").get("chat") or [], thread, since))
+    resp = jsonify([msg])
+    resp.headers["X-Next-Cursor"] = str(msg_id + 1)
+    return resp
 
-    # Notifier l'admin sur Telegram
-    _send_telegram(f"📩 <b>Client (WebApp) :</b>\n{text}")
 
-    return jsonify(messages)
+@limiter.limit("30 per minute")
+@app.route("/api/chat", methods=["POST"])
+def post_chat():
+    """Le client envoie un message sur son fil (init_data) → stockage + notification admin Telegram."""
+    thread, err = _chat_thread()
+    if err:
+        return err
+    msg, msg_id = _append_chat_message("user", thread)
+    if msg is None:
+        return jsonify({"error": "Message vide ou telegram_user_id invalide"}), 400
+    if not commit_data():
+        return _save_failed_response()
+    thread = msg.get("telegram_user_id")
+    _chat_hub.publish(thread, msg_id)
+    # L'admin répond en citant cette notification : le bot lit le fil dans le bouton (callback_data),
+    # jamais dans le texte du client.
+    _send_telegram(
+        f"📩 <b>Client (WebApp)</b> #{thread or 'anonyme'} :\n{html.escape(msg['text'])}",
+        reply_markup={"inline_keyboard": [[{"text": "↩️ Répondre", "callback_data": f"chat_thread_{thread or 'anonyme'}"}]]},
+    )
+    return _chat_sent_response(msg, msg_id)
 
 
 @app.route("/api/chat/reply", methods=["POST"])
 def post_chat_reply():
-    """L'admin répond via le bot → ajout du message (appelé par le bot)."""
-    data = load_data()
-    body = request.get_json() or {}
-    text = (body.get("text") or "").strip()
-    if not text:
-        return jsonify({"error": "Message vide"}), 400
-
-    messages = data.get("chat", [])
-    time_str = datetime.now().strftime("%H:%M")
-    messages.append({"from": "bot", "text": text, "time": time_str})
-    data["chat"] = messages
-    save_data(data)
-
-    return jsonify(messages)
+    """L'admin répond via le bot (clé admin) sur le fil telegram_user_id → réveille les long-polls de ce fil."""
+    auth_err = _require_admin_api_key()
+    if auth_err:
+        return auth_err
+    msg, msg_id = _append_chat_message("bot", normalize_id((request.get_json(silent=True) or {}).get("telegram_user_id")))
+    if msg is None:
+        return jsonify({"error": "Message vide ou telegram_user_id invalide"}), 400
+    if not commit_data():
+        return _save_failed_response()
+    _chat_hub.publish(msg.get("telegram_user_id"), msg_id)
+    return _chat_sent_response(msg, msg_id)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,83 @@
+"""
+Pièces jointes binaires (PDF de factures) hors du document de données.
+
+Les factures ne portent plus que l'identifiant de leur PDF (pdf_attachment) :
+les octets restent dans la table `attachments` (bytea) en mode Neon, ou dans un
+dossier de fichiers sinon, et ne sont plus relus à chaque load_data()/save_data().
+L'identifiant est le sha256 du contenu : réenregistrer le même PDF ne duplique rien.
+"""
+import hashlib
+import os
+import re
+
+_ID = re.compile(r"^[0-9a-f]{64}$")
+
+
+def attachment_id(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class FileAttachmentStore:
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, att_id):
+        if not _ID.match(str(att_id or "")):
+            raise ValueError(f"Identifiant de pièce jointe invalide : {att_id}")
+        return os.path.join(self.directory, att_id)
+
+    def put(self, data, content_type="application/pdf"):
+        att_id = attachment_id(data)
+        path = self._path(att_id)
+        if not os.path.exists(path):
+            tmp = f"{path}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+        return att_id
+
+    def get(self, att_id):
+        try:
+            with open(self._path(att_id), "rb") as f:
+                return f.read()
+        except (OSError, ValueError):
+            return None
+
+    def delete(self, att_id):
+        try:
+            os.remove(self._path(att_id))
+        except (OSError, ValueError):
+            pass
+
+
+class PostgresAttachmentStore:
+    """Table `attachments` (créée par db.py) ; connection : db.connection."""
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def put(self, data, content_type="application/pdf"):
+        import psycopg2
+        att_id = attachment_id(data)
+        with self._connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO attachments (id, content_type, data) VALUES (%s, %s, %s)
+                ON CONFLICT (id) DO NOTHING
+                """,
+                (att_id, content_type, psycopg2.Binary(data)),
+            )
+        return att_id
+
+    def get(self, att_id):
+        with self._connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT data FROM attachments WHERE id = %s", (att_id,))
+            row = cur.fetchone()
+        return bytes(row["data"]) if row else None
+
+    def delete(self, att_id):
+        with self._connection() as conn, conn.cursor() as cur:
+            cur.execute("DELETE FROM attachments WHERE id = %s", (att_id,))
@@ -0,0 +1,49 @@
+"""
+Micro-benchmark du moteur PDF des factures (pdf.py) : factures par seconde.
+
+Usage : python bench_pdf.py [nombre de factures] [articles par facture]
+"""
+import sys
+import time
+
+from pdf import paginate, render, render_many
+
+
+def _invoice(i, items):
+    lines = [
+        "StickerStreet - Facture",
+        f"Numero: INV-20250101-{i:04d}",
+        f"Commande: ORD-{1000 + i}",
+        "Date: 2025-01-01 12:00",
+        "",
+        "Client: Client de test",
+        "Tel: 0700000000",
+        "Adresse: Abidjan",
+        "",
+        "Articles:",
+    ]
+    lines += [f"- Sticker holographique n°{k} x2 (M) : 3000 F" for k in range(items)]
+    lines += ["", f"Total: {3000 * items} F CFA", "Paiement: MoMo / TON", "", "Merci pour votre confiance."]
+    return lines
+
+
+def _run(label, fn, count):
+    start = time.perf_counter()
+    size = fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {count / elapsed:10.0f} factures/s   {elapsed * 1000:8.1f} ms   {size / count:8.0f} octets/facture")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    items = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    documents = [_invoice(i, items) for i in range(count)]
+    pages = len(paginate(documents[0]))
+    print(f"{count} factures, {items} articles, {pages} page(s) chacune")
+    render(documents[0])  # échauffement
+    _run("render() une par une", lambda: sum(len(render(d)) for d in documents), count)
+    _run("render_many() en un appel", lambda: sum(len(p) for p in render_many(documents)), count)
+
+
+if __name__ == "__main__":
+    main()
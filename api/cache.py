@@ -0,0 +1,128 @@
+"""
+Cache de lecture en mémoire pour l'API StickerStreet.
+
+Chaque collection (products, statuses, momo...) est gardée sous forme d'instantané
+figé, associé à la version des données au moment du chargement : (mtime, taille)
+du fichier en mode fichier, compteur `version` de kv_store en mode Neon.
+Tant que la version ne change pas, les lectures ne touchent pas le stockage.
+"""
+import threading
+import time
+
+from unit_of_work import StorageUnavailable
+
+
+class FrozenDict(dict):
+    """dict en lecture seule (reste sérialisable par json/jsonify)."""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("Instantané en lecture seule : utiliser load_data() pour modifier")
+
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+
+class FrozenList(list):
+    """list en lecture seule (reste sérialisable par json/jsonify)."""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("Instantané en lecture seule : utiliser load_data() pour modifier")
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _readonly
+    append = extend = insert = pop = remove = clear = sort = reverse = _readonly
+
+
+def freeze(obj):
+    """Copie profonde figée d'une structure JSON."""
+    if isinstance(obj, dict):
+        return FrozenDict((k, freeze(v)) for k, v in obj.items())
+    if isinstance(obj, list):
+        return FrozenList(freeze(v) for v in obj)
+    return obj
+
+
+class ReadCache:
+    """Cache par collection, invalidé quand la version de stockage change.
+
+    loader(*collections) -> dict : lecture réelle (load_data) ; None (stockage injoignable)
+    lève StorageUnavailable, rien n'est mis en cache.
+    versions(collections) -> {collection: version} : version courante ; None = inconnue
+    (jamais mise en cache).
+    check_interval : durée (s) pendant laquelle une version lue est considérée à jour.
+    """
+
+    def __init__(self, loader, versions, check_interval=0.0):
+        self._loader = loader
+        self._versions = versions
+        self._check_interval = max(0.0, float(check_interval))
+        self._lock = threading.Lock()
+        self._entries = {}  # collection -> (version, instantané figé)
+        self._known = {}  # collection -> (version, instant de vérification)
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.version_checks = 0
+
+    def get(self, *collections):
+        """Retourne {collection: instantané figé} pour les collections demandées."""
+        now = time.monotonic()
+        with self._lock:
+            stale = [
+                c for c in collections
+                if c not in self._known or now - self._known[c][1] >= self._check_interval
+            ]
+        if stale:
+            try:
+                fresh = self._versions(stale) or {}
+            except Exception:
+                fresh = {}
+            with self._lock:
+                self.version_checks += 1
+                for c in stale:
+                    self._known[c] = (fresh.get(c), now)
+
+        result = {}
+        missing = []
+        with self._lock:
+            generation = self._generation
+            for c in collections:
+                version = self._known.get(c, (None, 0))[0]
+                entry = self._entries.get(c)
+                if version is not None and entry and entry[0] == version:
+                    result[c] = entry[1]
+                    self.hits += 1
+                else:
+                    missing.append((c, version))
+                    self.misses += 1
+        if missing:
+            data = self._loader(*[c for c, _v in missing])
+            if data is None:
+                raise StorageUnavailable("stockage indisponible")
+            with self._lock:
+                # Une sauvegarde pendant la lecture rend ce chargement douteux : pas de mise en cache.
+                keep = generation == self._generation
+                for c, version in missing:
+                    snapshot = freeze(data.get(c))
+                    result[c] = snapshot
+                    if keep and version is not None:
+                        self._entries[c] = (version, snapshot)
+        return result
+
+    def invalidate(self, collections=None):
+        """Oublie les collections modifiées (toutes si None)."""
+        with self._lock:
+            self._generation += 1
+            for c in list(self._known if collections is None else collections):
+                self._known.pop(c, None)
+                self._entries.pop(c, None)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+                "version_checks": self.version_checks,
+                "cached": sorted(self._entries),
+            }
@@ -0,0 +1,89 @@
+"""
+Détection des changements entre les données chargées et les données à sauvegarder.
+
+Partagé par les stockages Neon (db.py) et fichier (filestore.py) : au chargement,
+on relève une empreinte par élément ; à la sauvegarde, on en déduit les seules
+opérations nécessaires (ajout en tête / en fin, remplacement par clé, suppression).
+"""
+import json
+
+# Champ identifiant des collections liste (une liste sans clé ne peut qu'être allongée en fin).
+KEY_FIELDS = {
+    "products": "id",
+    "orders": "id",
+    "clients": "id",
+    "momo": "id",
+    "banners": "id",
+    "invoices": "invoice_number",
+    "chat": "id",
+}
+
+
+class Snapshot(dict):
+    """Données chargées avec l'empreinte de chaque élément lu, pour que la
+    sauvegarde n'écrive que ce qui a changé."""
+    fingerprints = None
+
+
+def fingerprint(doc):
+    return json.dumps(doc, ensure_ascii=False, sort_keys=True)
+
+
+def row_key(doc, key_field):
+    val = (doc or {}).get(key_field) if isinstance(doc, dict) else None
+    return None if val is None else str(val)
+
+
+def collection_fingerprints(coll, value):
+    """Empreintes élément par élément : {clé: fp} pour un dict, [(clé, fp)] pour une liste."""
+    if isinstance(value, dict):
+        return {k: fingerprint(v) for k, v in value.items()}
+    key_field = KEY_FIELDS.get(coll)
+    return [(row_key(doc, key_field) if key_field else None, fingerprint(doc)) for doc in value]
+
+
+def dict_patch(value, previous):
+    """Retourne (entrées ajoutées ou modifiées, clés supprimées) pour une collection dict."""
+    changed = {k: v for k, v in value.items() if previous.get(k) != fingerprint(v)}
+    removed = [k for k in previous if k not in value]
+    return changed, removed
+
+
+def list_patch(coll, docs, previous):
+    """Décrit les changements d'une liste.
+
+    Retourne (prepend, append, updates, removed) ou None si seule une réécriture
+    complète est possible (réordonnancement, doublons, élément sans clé).
+    """
+    key_field = KEY_FIELDS.get(coll)
+    current = collection_fingerprints(coll, docs)
+    if not key_field:
+        # Liste sans clé : seul l'ajout en fin est exprimable.
+        n = len(previous)
+        if [fp for _k, fp in current[:n]] != [fp for _k, fp in previous]:
+            return None
+        return [], docs[n:], {}, []
+    keys = [k for k, _fp in current]
+    if None in keys or len(set(keys)) != len(keys):
+        return None
+    old = {k: fp for k, fp in previous}
+    kept = [k for k in keys if k in old]
+    kept_set = set(kept)
+    if kept != [k for k, _fp in previous if k in kept_set]:
+        return None
+    new_pos = [i for i, k in enumerate(keys) if k not in old]
+    prepend, append = [], []
+    if new_pos:
+        if not kept:
+            if previous:
+                return None
+            append = [docs[i] for i in new_pos]
+        elif new_pos[-1] < keys.index(kept[0]):
+            prepend = [docs[i] for i in new_pos]
+        elif new_pos[0] > keys.index(kept[-1]):
+            append = [docs[i] for i in new_pos]
+        else:
+            return None
+    updates = {k: docs[i] for i, (k, fp) in enumerate(current) if k in old and old[k] != fp}
+    removed = [k for k, _fp in previous if k not in kept_set]
+    return prepend, append, updates, removed
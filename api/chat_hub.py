@@ -0,0 +1,74 @@
+"""
+Réveil des requêtes en attente de nouveaux messages du chat (long-poll GET /api/chat?wait=).
+
+publish(fil, id) après l'enregistrement d'un message ; wait(fil, since, timeout)
+rend la main dès qu'un message d'id > since est publié sur ce fil, sinon au bout
+de timeout. Les messages enregistrés par un autre processus (plusieurs workers)
+ne passent pas par ici : l'appelant relit les données par tranches de quelques
+secondes.
+
+Chaque attente occupe un thread du serveur : slot(client, limit) borne le nombre
+d'attentes simultanées d'un même client.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+
+class ChatHub:
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._latest = {}  # fil -> id du dernier message publié
+        self._waiting = 0
+        self._slots = {}  # client -> attentes en cours
+        self._stats = {"published": 0, "woken": 0, "timeouts": 0, "refused": 0}
+
+    def publish(self, thread, msg_id):
+        with self._cond:
+            if msg_id > self._latest.get(thread, -1):
+                self._latest[thread] = msg_id
+            self._stats["published"] += 1
+            self._cond.notify_all()
+
+    def wait(self, thread, since, timeout):
+        """Id du dernier message publié sur le fil (> since), ou None après timeout secondes."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._waiting += 1
+            try:
+                while self._latest.get(thread, -1) <= since:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        return None
+                    self._cond.wait(remaining)
+                self._stats["woken"] += 1
+                return self._latest[thread]
+            finally:
+                self._waiting -= 1
+
+    @contextmanager
+    def slot(self, client, limit):
+        """Réserve une place d'attente pour client le temps du bloc ; rend False si ses limit places sont prises."""
+        with self._cond:
+            taken = self._slots.get(client, 0)
+            if taken >= limit:
+                self._stats["refused"] += 1
+                granted = False
+            else:
+                self._slots[client] = taken + 1
+                granted = True
+        try:
+            yield granted
+        finally:
+            if granted:
+                with self._cond:
+                    left = self._slots[client] - 1
+                    if left:
+                        self._slots[client] = left
+                    else:
+                        del self._slots[client]
+
+    def stats(self):
+        with self._cond:
+            return {"waiting": self._waiting, "threads": len(self._latest), **self._stats}
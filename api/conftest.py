@@ -0,0 +1,23 @@
+"""
+Fixtures partagées : l'API en mode fichier, sur une copie de data.json.
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+
+@pytest.fixture(scope="session")
+def api():
+    tmp = tempfile.mkdtemp()
+    shutil.copy(os.path.join(HERE, "data.json"), os.path.join(tmp, "data.json"))
+    os.environ["DATA_FILE"] = os.path.join(tmp, "data.json")
+    os.environ.pop("DATABASE_URL", None)
+    import app
+    yield app
+    shutil.rmtree(tmp, ignore_errors=True)
@@ -2,37 +2,121 @@
 Connexion Neon (Postgres) pour l'API StickerStreet.
 Utilise DATABASE_URL (connection string Neon) pour stocker les données
 dans une table kv_store au lieu du fichier JSON.
+
+Modes de stockage (variable NEON_STORAGE) :
+- "kv" (défaut) : tout le document JSON dans kv_store, clé 'data'.
+- "collections" : une clé kv_store par collection (products, orders, chat...),
+  modifiée par des mises à jour JSONB partielles (ajout en tête/fin, jsonb_set).
+- "tables" : une table par entité (products, orders, clients, chat_messages,
+  momo, banners, invoices) avec des écritures ligne par ligne ; les dicts
+  (statuses, pending_invoices) restent dans kv_store, une clé par collection.
 """
 import os
+import re
 import json
+import logging
+import threading
+
+from pool import ConnectionPool
+from changes import KEY_FIELDS, Snapshot, collection_fingerprints, dict_patch, fingerprint, list_patch, row_key
 
-_conn = None
+_pool = None
+_schema_lock = threading.Lock()
+_schema_ready = False
 _DATABASE_URL = (os.environ.get("DATABASE_URL") or "").strip()
+NEON_STORAGE = (os.environ.get("NEON_STORAGE") or "kv").strip().lower()
+if NEON_STORAGE not in ("kv", "collections", "tables"):
+    NEON_STORAGE = "kv"
 
+# Collections liste -> (table, champ clé, ordre de lecture).
+# Les listes "DESC" sont stockées du plus récent au plus ancien (insert(0) côté API).
+# Messages du chat : id attribué par la séquence id_chat (les plus anciens, d'avant les ids,
+# reçoivent leur position ; cf. _key_chat_messages).
+_ENTITY_TABLES = {
+    "products": ("products", "id", "ASC"),
+    "orders": ("orders", "id", "DESC"),
+    "clients": ("clients", "id", "ASC"),
+    "chat": ("chat_messages", "id", "ASC"),
+    "momo": ("momo", "id", "ASC"),
+    "banners": ("banners", "id", "ASC"),
+    "invoices": ("invoices", "invoice_number", "DESC"),
+}
+_DICT_COLLECTIONS = ("statuses", "pending_invoices")
+# Champs (hors clé) par lesquels les écritures retrouvent une ligne : index d'expression sur doc->>champ.
+_LOOKUP_FIELDS = {"clients": ("telegram_user_id",), "invoices": ("order_id",)}
+_SEQUENCE_NAME = re.compile(r"^[a-z_]+$")
+_seeded_sequences = set()
+logger = logging.getLogger(__name__)
 
-def get_connection():
-    """Retourne une connexion psycopg2 (créée une seule fois)."""
-    global _conn
+
+def _connect():
+    """Ouvre une connexion psycopg2 en autocommit."""
     if not _DATABASE_URL:
-        return None
-    if _conn is not None and not _conn.closed:
-        return _conn
+        raise RuntimeError("DATABASE_URL non définie")
+    import psycopg2
+    from psycopg2.extras import RealDictCursor
+    # Neon exige sslmode=require
+    url = _DATABASE_URL
+    if "sslmode=" not in url and "?" not in url:
+        url = url + "?sslmode=require"
+    elif "sslmode=" not in url:
+        url = url + "&sslmode=require"
+    conn = psycopg2.connect(url, cursor_factory=RealDictCursor, connect_timeout=10)
+    conn.autocommit = True
+    return conn
+
+
+def _prepare_schema(conn):
+    """Crée / migre le schéma à la première connexion du processus."""
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if _schema_ready:
+            return
+        _ensure_table(conn)
+        _ensure_jobs_table(conn)
+        _ensure_attachments_table(conn)
+        if NEON_STORAGE == "tables":
+            _ensure_entity_tables(conn)
+        elif NEON_STORAGE == "collections":
+            _ensure_collection_keys(conn)
+            _key_chat_collection(conn)
+        _schema_ready = True
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _schema_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    _connect,
+                    maxconn=_env_number("DB_POOL_MAX", 5),
+                    timeout=_env_number("DB_POOL_TIMEOUT", 10),
+                    max_lifetime=_env_number("DB_CONN_MAX_LIFETIME", 1800),
+                    check_after=_env_number("DB_CONN_CHECK_AFTER", 30),
+                    backoff_max=_env_number("DB_RECONNECT_BACKOFF_MAX", 30),
+                    on_connect=_prepare_schema,
+                )
+    return _pool
+
+
+def _env_number(key, default):
     try:
-        import psycopg2
-        from psycopg2.extras import RealDictCursor
-        # Neon exige sslmode=require
-        url = _DATABASE_URL
-        if "sslmode=" not in url and "?" not in url:
-            url = url + "?sslmode=require"
-        elif "sslmode=" not in url:
-            url = url + "&sslmode=require"
-        _conn = psycopg2.connect(url, cursor_factory=RealDictCursor)
-        _conn.autocommit = True
-        _ensure_table(_conn)
-        return _conn
-    except Exception:
-        _conn = None
-        return None
+        return float(os.environ.get(key, "") or default)
+    except ValueError:
+        return float(default)
+
+
+def connection():
+    """Context manager : connexion empruntée au pool, rendue (ou écartée si cassée) en sortie."""
+    return _get_pool().connection()
+
+
+def pool_stats():
+    """Statistiques du pool pour /api/health (None tant qu'il n'existe pas)."""
+    return _pool.stats() if _pool is not None else None
 
 
 def _ensure_table(conn):
@@ -45,6 +129,8 @@ def _ensure_table(conn):
                     value JSONB NOT NULL DEFAULT '{}'
                 )
             """)
+            # Compteur incrémenté à chaque écriture : sert au cache de lecture de l'API.
+            cur.execute("ALTER TABLE kv_store ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 0")
             cur.execute(
                 "INSERT INTO kv_store (key, value) VALUES ('data', %s::jsonb) ON CONFLICT (key) DO NOTHING",
                 (json.dumps(_default_data(), ensure_ascii=False),),
@@ -53,39 +139,595 @@ def _ensure_table(conn):
         pass
 
 
-def is_neon_configured():
-    """True si DATABASE_URL est défini."""
-    return bool(_DATABASE_URL)
+def _ensure_jobs_table(conn):
+    """Crée la table de la file de tâches (jobs.py) ; run_at = fin du bail si status 'running'."""
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id BIGSERIAL PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    payload JSONB NOT NULL DEFAULT '{}',
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INT NOT NULL DEFAULT 0,
+                    run_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                    last_error TEXT,
+                    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                )
+            """)
+            cur.execute("CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (run_at) WHERE status <> 'dead'")
+    except Exception:
+        pass
+
+
+def _ensure_attachments_table(conn):
+    """Crée la table des pièces jointes binaires (attachments.py : PDF de factures hors du document)."""
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS attachments (
+                    id TEXT PRIMARY KEY,
+                    content_type TEXT NOT NULL DEFAULT 'application/octet-stream',
+                    data BYTEA NOT NULL,
+                    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                )
+            """)
+    except Exception:
+        pass
 
 
-def load_data():
-    """Charge les données depuis Neon (table kv_store, clé 'data')."""
-    conn = get_connection()
-    if not conn:
-        return None
+def _ensure_entity_tables(conn):
+    """Crée les tables par entité et y importe le blob 'data' (une seule fois).
+
+    Tout se fait dans une transaction, sous un verrou consultatif : un second
+    worker qui démarre en même temps attend la fin de l'import puis voit
+    'tables_migrated'. Un échec est journalisé et remonté (la connexion est
+    refusée) plutôt que de servir des tables vides ou à moitié remplies.
+    """
     try:
         with conn.cursor() as cur:
+            cur.execute("BEGIN")
+            try:
+                cur.execute("SELECT pg_advisory_xact_lock(hashtext('tables_migrated'))")
+                for table, _key, _order in _ENTITY_TABLES.values():
+                    cur.execute(f"""
+                        CREATE TABLE IF NOT EXISTS {table} (
+                            seq BIGSERIAL PRIMARY KEY,
+                            key TEXT UNIQUE,
+                            doc JSONB NOT NULL
+                        )
+                    """)
+                for coll, fields in _LOOKUP_FIELDS.items():
+                    table = _ENTITY_TABLES[coll][0]
+                    for field in fields:
+                        cur.execute(f"CREATE INDEX IF NOT EXISTS {table}_{field} ON {table} ((doc->>'{field}'))")
+                cur.execute("SELECT 1 FROM kv_store WHERE key = 'tables_migrated'")
+                if not cur.fetchone():
+                    cur.execute("SELECT value FROM kv_store WHERE key = %s", ("data",))
+                    row = cur.fetchone()
+                    blob = row["value"] if row and isinstance(row.get("value"), dict) else _default_data()
+                    _import_entities(cur, blob)
+                    cur.execute(
+                        "INSERT INTO kv_store (key, value) VALUES ('tables_migrated', 'true'::jsonb) "
+                        "ON CONFLICT (key) DO NOTHING"
+                    )
+                _key_chat_messages(cur)
+                cur.execute("COMMIT")
+            except Exception:
+                cur.execute("ROLLBACK")
+                raise
+    except Exception as e:
+        logger.error(f"Migration vers les tables par entité échouée: {e}")
+        raise
+
+
+def _key_chat_messages(cur):
+    """Donne un id (sa position, comme l'ancien curseur du chat) à chaque message qui n'en a pas."""
+    cur.execute("""
+        UPDATE chat_messages AS c
+        SET key = t.pos::text, doc = c.doc || jsonb_build_object('id', t.pos)
+        FROM (SELECT seq, row_number() OVER (ORDER BY seq) - 1 AS pos FROM chat_messages) AS t
+        WHERE c.seq = t.seq AND c.key IS NULL
+    """)
+    if cur.rowcount:
+        _bump_version(cur, "chat")
+
+
+def _import_entities(cur, blob):
+    """Copie le blob dans les tables d'entités sans écraser ce qui y est déjà (rejouable)."""
+    from psycopg2.extras import Json, execute_values
+
+    for coll, (table, key_field, order) in _ENTITY_TABLES.items():
+        docs = blob.get(coll)
+        if not isinstance(docs, list) or not docs:
+            continue
+        # Insertion dans l'ordre de lecture : seq croissant = plus ancien pour les listes DESC.
+        docs = list(reversed(docs)) if order == "DESC" else docs
+        if key_field:
+            execute_values(
+                cur,
+                f"INSERT INTO {table} (key, doc) VALUES %s ON CONFLICT (key) DO NOTHING",
+                [(row_key(doc, key_field), Json(doc)) for doc in docs],
+            )
+        else:
+            # Sans clé, un doublon ne se détecte pas : n'importe que dans une table vide.
+            cur.execute(f"SELECT 1 FROM {table} LIMIT 1")
+            if cur.fetchone():
+                continue
+            execute_values(cur, f"INSERT INTO {table} (key, doc) VALUES %s", [(None, Json(doc)) for doc in docs])
+        _bump_version(cur, coll)
+    for coll in _DICT_COLLECTIONS:
+        val = blob.get(coll)
+        if isinstance(val, dict):
+            cur.execute(
+                "INSERT INTO kv_store (key, value) VALUES (%s, %s) ON CONFLICT (key) DO NOTHING",
+                (coll, Json(val)),
+            )
+
+
+def _ensure_collection_keys(conn):
+    """Découpe kv_store['data'] en une clé par collection (une seule fois)."""
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1 FROM kv_store WHERE key = 'collections_migrated'")
+            if cur.fetchone():
+                return
             cur.execute("SELECT value FROM kv_store WHERE key = %s", ("data",))
             row = cur.fetchone()
-            if row and row.get("value") is not None:
-                val = row["value"]
-                return val if isinstance(val, dict) else _default_data()
-            return _default_data()
+            blob = row["value"] if row and isinstance(row.get("value"), dict) else {}
+            defaults = _default_data()
+            cur.execute("BEGIN")
+            for coll, default in defaults.items():
+                cur.execute(
+                    "INSERT INTO kv_store (key, value) VALUES (%s, %s::jsonb) ON CONFLICT (key) DO NOTHING",
+                    (coll, json.dumps(blob.get(coll, default), ensure_ascii=False)),
+                )
+            cur.execute("INSERT INTO kv_store (key, value) VALUES ('collections_migrated', 'true'::jsonb)")
+            cur.execute("COMMIT")
     except Exception:
+        try:
+            with conn.cursor() as cur:
+                cur.execute("ROLLBACK")
+        except Exception:
+            pass
+
+
+def _key_chat_collection(conn):
+    """Mode collections : id (= position) pour les messages du chat qui n'en ont pas.
+
+    Une seule requête UPDATE au démarrage, plutôt qu'une réécriture de la liste par
+    l'API : un autre worker qui ajoute un message au même moment n'est pas écrasé.
+    """
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                UPDATE kv_store SET version = version + 1, value = (
+                    SELECT jsonb_agg(CASE WHEN t.e ? 'id' THEN t.e ELSE t.e || jsonb_build_object('id', t.o - 1) END
+                                     ORDER BY t.o)
+                    FROM jsonb_array_elements(value) WITH ORDINALITY t(e, o)
+                )
+                WHERE key = 'chat' AND jsonb_typeof(value) = 'array'
+                  AND EXISTS (SELECT 1 FROM jsonb_array_elements(value) e WHERE NOT e ? 'id')
+            """)
+    except Exception as e:
+        logger.error(f"Attribution des ids du chat échouée: {e}")
+        raise
+
+
+def is_neon_configured():
+    """True si DATABASE_URL est défini."""
+    return bool(_DATABASE_URL)
+
+
+def _load_entities(conn, collections):
+    """Lit les tables d'entités demandées ; retourne un Snapshot avec les empreintes par ligne."""
+    defaults = _default_data()
+    data = Snapshot({c: defaults[c] for c in collections})
+    rows = {}
+    with conn.cursor() as cur:
+        for coll, (table, key_field, order) in _ENTITY_TABLES.items():
+            if coll not in collections:
+                continue
+            cur.execute(f"SELECT seq, doc FROM {table} ORDER BY seq {order}")
+            docs = []
+            seen = {} if key_field else []
+            for r in cur.fetchall():
+                doc = r["doc"]
+                docs.append(doc)
+                if key_field:
+                    seen[row_key(doc, key_field)] = fingerprint(doc)
+                else:
+                    seen.append((r["seq"], fingerprint(doc)))
+            data[coll] = docs
+            rows[coll] = seen
+        wanted = [c for c in _DICT_COLLECTIONS if c in collections]
+        if wanted:
+            cur.execute("SELECT key, value FROM kv_store WHERE key = ANY(%s)", (wanted,))
+            for r in cur.fetchall():
+                if isinstance(r.get("value"), dict):
+                    data[r["key"]] = r["value"]
+                    rows[r["key"]] = fingerprint(r["value"])
+    data.fingerprints = rows
+    return data
+
+
+def load_rows(collection, field, values):
+    """Mode tables : seules les lignes de collection dont field vaut l'une des values.
+
+    field est la clé de la table (requête sur key) ou un champ de _LOOKUP_FIELDS
+    (requête sur doc->>field). Une écriture lit ainsi les lignes qu'elle touche,
+    pas la table entière. Retourne un Snapshot {collection: docs} avec les empreintes
+    {clé: fp} des lignes lues, ou None si la lecture échoue.
+    """
+    table, key_field, order = _ENTITY_TABLES[collection]
+    if field != key_field and field not in _LOOKUP_FIELDS.get(collection, ()):
+        raise ValueError(f"{collection}.{field} n'est pas indexé")
+    where = "key = ANY(%s)" if field == key_field else f"doc->>'{field}' = ANY(%s)"
+    values = [str(v) for v in values]
+    for attempt in range(2):
+        try:
+            with connection() as conn, conn.cursor() as cur:
+                cur.execute(f"SELECT doc FROM {table} WHERE {where} ORDER BY seq {order}", (values,))
+                docs = [r["doc"] for r in cur.fetchall()]
+            break
+        except Exception as e:
+            if attempt:
+                logger.error(f"Lecture Neon échouée ({collection}.{field}): {e}")
+                return None
+    data = Snapshot({collection: docs})
+    data.fingerprints = {collection: {row_key(doc, key_field): fingerprint(doc) for doc in docs}}
+    return data
+
+
+def _load_collections(conn, collections):
+    """Lit uniquement les clés kv_store des collections demandées."""
+    defaults = _default_data()
+    data = Snapshot({c: defaults[c] for c in collections})
+    with conn.cursor() as cur:
+        cur.execute("SELECT key, value FROM kv_store WHERE key = ANY(%s)", (list(collections),))
+        for r in cur.fetchall():
+            if isinstance(r.get("value"), type(defaults[r["key"]])):
+                data[r["key"]] = r["value"]
+    data.fingerprints = {c: collection_fingerprints(c, data[c]) for c in collections}
+    return data
+
+
+def _write_collections(conn, data, rows):
+    """Écrit les collections présentes dans data par mises à jour JSONB partielles."""
+    from psycopg2.extras import Json
+
+    written = {}
+    with conn.cursor() as cur:
+        cur.execute("BEGIN")
+        try:
+            for coll, value in data.items():
+                if coll not in _DEFAULT_KEYS:
+                    continue
+                previous = rows.get(coll)
+                patch = None
+                if isinstance(value, dict) and isinstance(previous, dict):
+                    changed, removed = dict_patch(value, previous)
+                    if changed:
+                        cur.execute(
+                            "UPDATE kv_store SET value = value || %s, version = version + 1 WHERE key = %s",
+                            (Json(changed), coll),
+                        )
+                    if removed:
+                        cur.execute(
+                            "UPDATE kv_store SET value = value - %s::text[], version = version + 1 WHERE key = %s",
+                            (removed, coll),
+                        )
+                    patch = True
+                elif isinstance(value, list) and isinstance(previous, list):
+                    patch = list_patch(coll, value, previous)
+                    if patch is not None:
+                        _apply_list_patch(cur, coll, patch)
+                if patch is None:
+                    cur.execute(
+                        """
+                        INSERT INTO kv_store (key, value) VALUES (%s, %s)
+                        ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value, version = kv_store.version + 1
+                        """,
+                        (coll, Json(value)),
+                    )
+                written[coll] = collection_fingerprints(coll, value)
+            cur.execute("COMMIT")
+        except Exception:
+            cur.execute("ROLLBACK")
+            raise
+    return written
+
+
+def _apply_list_patch(cur, coll, patch):
+    """Applique un patch de liste ; les éléments sont retrouvés par clé côté serveur,
+    ce qui reste correct si un autre worker a inséré entre-temps."""
+    from psycopg2.extras import Json
+
+    prepend, append, updates, removed = patch
+    key_field = KEY_FIELDS.get(coll)
+    if removed:
+        cur.execute(
+            """
+            UPDATE kv_store SET version = version + 1, value = (
+                SELECT COALESCE(jsonb_agg(t.e ORDER BY t.o), '[]'::jsonb)
+                FROM jsonb_array_elements(value) WITH ORDINALITY t(e, o)
+                WHERE NOT (t.e->>%s = ANY(%s))
+            ) WHERE key = %s
+            """,
+            (key_field, removed, coll),
+        )
+    for k, doc in updates.items():
+        cur.execute(
+            """
+            UPDATE kv_store SET version = version + 1, value = jsonb_set(value, ARRAY[(
+                SELECT (t.o - 1)::text FROM jsonb_array_elements(value) WITH ORDINALITY t(e, o)
+                WHERE t.e->>%s = %s LIMIT 1
+            )], %s)
+            WHERE key = %s AND EXISTS (
+                SELECT 1 FROM jsonb_array_elements(value) e WHERE e->>%s = %s
+            )
+            """,
+            (key_field, k, Json(doc), coll, key_field, k),
+        )
+    if prepend:
+        cur.execute(
+            "UPDATE kv_store SET value = %s || value, version = version + 1 WHERE key = %s",
+            (Json(prepend), coll),
+        )
+    if append:
+        cur.execute(
+            "UPDATE kv_store SET value = value || %s, version = version + 1 WHERE key = %s",
+            (Json(append), coll),
+        )
+
+
+def _write_entities(conn, data, rows):
+    """Écrit uniquement les lignes ajoutées, modifiées ou supprimées depuis le chargement.
+
+    rows : empreintes relevées au chargement. Une collection à clé sans empreinte
+    est traitée en upsert seulement (jamais de suppression à l'aveugle) ; une
+    collection sans clé n'est alors pas écrite.
+    Retourne les empreintes de l'état écrit.
+    """
+    from psycopg2.extras import Json, execute_values
+
+    written = {}
+    with conn.cursor() as cur:
+        cur.execute("BEGIN")
+        try:
+            for coll, (table, key_field, order) in _ENTITY_TABLES.items():
+                docs = data.get(coll)
+                if not isinstance(docs, list):
+                    continue
+                if key_field:
+                    previous = rows.get(coll)
+                    current = {}
+                    inserts = []
+                    upserts = []
+                    updated = False
+                    # Insertion dans l'ordre de lecture : seq croissant = plus ancien pour les listes DESC.
+                    for doc in (reversed(docs) if order == "DESC" else docs):
+                        k = row_key(doc, key_field)
+                        fp = fingerprint(doc)
+                        current[k] = fp
+                        if previous is None:
+                            upserts.append((k, Json(doc)))
+                        elif k not in previous:
+                            inserts.append((k, Json(doc)))
+                        elif previous[k] != fp:
+                            cur.execute(f"UPDATE {table} SET doc = %s WHERE key = %s", (Json(doc), k))
+                            updated = True
+                    removed = [k for k in (previous or {}) if k not in current]
+                    if removed:
+                        cur.execute(f"DELETE FROM {table} WHERE key = ANY(%s)", (removed,))
+                    if inserts:
+                        execute_values(cur, f"INSERT INTO {table} (key, doc) VALUES %s", inserts)
+                    if upserts:
+                        execute_values(
+                            cur,
+                            f"""
+                            INSERT INTO {table} (key, doc) VALUES %s
+                            ON CONFLICT (key) DO UPDATE SET doc = EXCLUDED.doc
+                            WHERE {table}.doc IS DISTINCT FROM EXCLUDED.doc
+                            """,
+                            upserts,
+                        )
+                    if updated or removed or inserts or upserts:
+                        _bump_version(cur, coll)
+                    written[coll] = current
+                else:
+                    if coll not in rows:
+                        # Sans positions connues, impossible de distinguer ajout et doublon.
+                        continue
+                    previous = rows[coll]
+                    kept = []
+                    new_docs = []
+                    updated = False
+                    for i, doc in enumerate(docs):
+                        fp = fingerprint(doc)
+                        if i < len(previous):
+                            seq, old_fp = previous[i]
+                            if old_fp != fp:
+                                cur.execute(f"UPDATE {table} SET doc = %s WHERE seq = %s", (Json(doc), seq))
+                                updated = True
+                            kept.append((seq, fp))
+                        else:
+                            new_docs.append((doc, fp))
+                    removed = [seq for seq, _fp in previous[len(docs):]]
+                    if removed:
+                        cur.execute(f"DELETE FROM {table} WHERE seq = ANY(%s)", (removed,))
+                    if new_docs:
+                        seqs = execute_values(
+                            cur,
+                            f"INSERT INTO {table} (key, doc) VALUES %s RETURNING seq",
+                            [(None, Json(doc)) for doc, _fp in new_docs],
+                            fetch=True,
+                        )
+                        kept += [(r["seq"], fp) for r, (_doc, fp) in zip(seqs, new_docs)]
+                    if updated or removed or new_docs:
+                        _bump_version(cur, coll)
+                    written[coll] = kept
+            for coll in _DICT_COLLECTIONS:
+                val = data.get(coll)
+                if not isinstance(val, dict):
+                    continue
+                fp = fingerprint(val)
+                if rows.get(coll) != fp:
+                    cur.execute(
+                        """
+                        INSERT INTO kv_store (key, value) VALUES (%s, %s)
+                        ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value, version = kv_store.version + 1
+                        """,
+                        (coll, Json(val)),
+                    )
+                written[coll] = fp
+            cur.execute("COMMIT")
+        except Exception:
+            cur.execute("ROLLBACK")
+            raise
+    return written
+
+
+def _version_key(coll):
+    """Ligne kv_store dont la colonne version suit la collection, selon le mode."""
+    if NEON_STORAGE == "kv":
+        return "data"
+    if NEON_STORAGE == "tables" and coll in _ENTITY_TABLES:
+        return f"version:{coll}"
+    return coll
+
+
+def _bump_version(cur, coll):
+    cur.execute(
+        """
+        INSERT INTO kv_store (key, value, version) VALUES (%s, 'null'::jsonb, 1)
+        ON CONFLICT (key) DO UPDATE SET version = kv_store.version + 1
+        """,
+        (_version_key(coll),),
+    )
+
+
+def next_sequence_value(name, seed):
+    """Prochaine valeur de la séquence Postgres id_<name> (orders, invoices, clients...).
+
+    seed() : plus grand numéro déjà attribué dans les données. Lu une fois par
+    processus, il ne fait que remonter la séquence (jamais la faire reculer), pour
+    ne pas redonner un numéro pris avant l'existence de la séquence.
+    """
+    if not _SEQUENCE_NAME.match(name):
+        raise ValueError(f"Nom de séquence invalide : {name}")
+    seq = f"id_{name}"
+    with connection() as conn, conn.cursor() as cur:
+        if name not in _seeded_sequences:
+            try:
+                cur.execute(f"CREATE SEQUENCE IF NOT EXISTS {seq} MINVALUE 0 START 1")
+            except Exception as e:
+                # 23505 : un autre worker a créé la séquence au même instant (IF NOT EXISTS n'y peut rien).
+                if getattr(e, "pgcode", None) != "23505":
+                    raise
+            floor = int(seed() or 0)
+            cur.execute(
+                f"SELECT setval(%s, %s, true) FROM {seq} WHERE NOT is_called OR last_value < %s",
+                (seq, floor, floor),
+            )
+            _seeded_sequences.add(name)
+        cur.execute("SELECT nextval(%s) AS value", (seq,))
+        return int(cur.fetchone()["value"])
+
+
+def get_versions(collections):
+    """Retourne {collection: version} (0 si jamais écrite, None si Neon injoignable)."""
+    keys = {c: _version_key(c) for c in collections}
+    try:
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT key, version FROM kv_store WHERE key = ANY(%s)", (sorted(set(keys.values())),))
+            found = {r["key"]: r["version"] for r in cur.fetchall()}
+        return {c: found.get(k, 0) for c, k in keys.items()}
+    except Exception:
+        return {c: None for c in collections}
+
+
+def get_setting(key):
+    """Valeur d'une clé annexe de kv_store (ex. 'rate:ton_usd'), None si absente."""
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT value FROM kv_store WHERE key = %s", (key,))
+        row = cur.fetchone()
+    return row["value"] if row else None
+
+
+def set_setting(key, value):
+    """Enregistre une clé annexe de kv_store (sans toucher aux versions des collections)."""
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO kv_store (key, value) VALUES (%s, %s::jsonb)
+            ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value
+            """,
+            (key, json.dumps(value, ensure_ascii=False)),
+        )
+
+
+def load_data(*collections):
+    """Charge les données depuis Neon (kv_store clé 'data', clés par collection ou tables).
+
+    collections : collections utilisées par l'appelant (toutes si vide). Les modes
+    "collections" et "tables" ne lisent que celles-ci ; le mode "kv" renvoie tout.
+    Retourne None si la lecture échoue (connexion impossible ou requête en erreur) :
+    jamais de valeurs par défaut à la place des données réelles.
+    """
+    collections = tuple(c for c in collections if c in _DEFAULT_KEYS) or _DEFAULT_KEYS
+    for attempt in range(2):
+        try:
+            with connection() as conn:
+                return _read(conn, collections)
+        except Exception as e:
+            # Connexion coupée par Neon (inactivité, redémarrage), ou erreur passagère :
+            # une seconde tentative, sur une connexion neuve si le pool a écarté l'ancienne.
+            if attempt:
+                logger.error(f"Lecture Neon échouée ({', '.join(collections)}): {e}")
+                return None
+
+
+def _read(conn, collections):
+    """Lecture brute ; toute erreur remonte : des valeurs par défaut finiraient par être enregistrées."""
+    if NEON_STORAGE in ("collections", "tables"):
+        loader = _load_collections if NEON_STORAGE == "collections" else _load_entities
+        return loader(conn, collections)
+    with conn.cursor() as cur:
+        cur.execute("SELECT value FROM kv_store WHERE key = %s", ("data",))
+        row = cur.fetchone()
+        if row and row.get("value") is not None:
+            val = row["value"]
+            return val if isinstance(val, dict) else _default_data()
         return _default_data()
 
 
 def save_data(data):
-    """Enregistre les données dans Neon."""
-    conn = get_connection()
-    if not conn:
+    """Enregistre les données dans Neon (seulement les collections présentes dans data)."""
+    try:
+        with connection() as conn:
+            return _write(conn, data)
+    except Exception:
         return False
+
+
+def _write(conn, data):
+    if NEON_STORAGE in ("collections", "tables"):
+        writer = _write_collections if NEON_STORAGE == "collections" else _write_entities
+        try:
+            written = writer(conn, data, getattr(data, "fingerprints", None) or {})
+            if isinstance(data, Snapshot):
+                # Une seconde sauvegarde du même objet repart de l'état écrit.
+                data.fingerprints = written
+            return True
+        except Exception:
+            return False
     try:
         with conn.cursor() as cur:
             cur.execute(
                 """
                 INSERT INTO kv_store (key, value) VALUES (%s, %s::jsonb)
-                ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value
+                ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value, version = kv_store.version + 1
                 """,
                 ("data", json.dumps(data, ensure_ascii=False)),
             )
@@ -113,3 +755,6 @@ def _default_data():
         "invoices": [],
         "pending_invoices": {},
     }
+
+
+_DEFAULT_KEYS = tuple(_default_data())
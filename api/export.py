@@ -0,0 +1,72 @@
+"""
+Export comptable en flux : ZIP construit au fil de l'eau et registre CSV.
+
+stream_zip() ne garde en mémoire que l'entrée en cours d'écriture : chaque
+morceau est rendu au client dès qu'il est compressé (ZIP sans retour en arrière,
+tailles dans les descripteurs de données). Les PDF, déjà compressés, sont
+stockés tels quels ; le CSV est compressé (deflate).
+"""
+import csv
+import io
+import zipfile
+from datetime import datetime
+
+
+class _Sink:
+    """Sortie du ZipFile : ni tell() ni seek(), zipfile passe en écriture séquentielle."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def stream_zip(entries):
+    """Générateur de morceaux (bytes) d'un ZIP.
+
+    entries : itérable de (nom, morceaux, compresser) ; morceaux est un itérable de bytes,
+    consommé au fur et à mesure (générateur possible).
+    """
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w", allowZip64=True) as zf:
+        for name, chunks, compressed in entries:
+            info = zipfile.ZipInfo(name, datetime.now().timetuple()[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED if compressed else zipfile.ZIP_STORED
+            with zf.open(info, "w", force_zip64=True) as dest:
+                for chunk in chunks:
+                    dest.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            yield sink.drain()
+    yield sink.drain()
+
+
+def csv_chunks(header, rows, batch=500):
+    """Lignes CSV (UTF-8 avec BOM, pour Excel) par paquets de batch lignes."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    buf.write("\ufeff")
+    writer.writerow(header)
+    for n, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if n % batch == 0:
+            yield buf.getvalue().encode("utf-8")
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue().encode("utf-8")
+
+
+def batched(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
@@ -0,0 +1,371 @@
+"""
+Stockage fichier journalisé pour l'API StickerStreet (mode sans DATABASE_URL).
+
+- DATA_FILE : instantané JSON complet (même format qu'avant, plus la clé
+  "_journal_seq" = dernière ligne du journal déjà incluse).
+- DATA_FILE + ".journal" : une ligne JSON compacte par sauvegarde, qui ne contient
+  que les opérations nécessaires (ajout en tête/fin, remplacement par clé,
+  suppression). Une sauvegarde coûte donc la taille du changement, pas du fichier.
+
+Au démarrage, l'instantané est relu puis le journal rejoué ; une ligne tronquée par
+un arrêt brutal est ignorée. Un thread compacte périodiquement le journal dans
+l'instantané (fichier temporaire + rename, donc jamais de data.json à moitié écrit).
+
+Un DATA_FILE sans "_journal_seq" (seed, ou fichier modifié à la main) fait foi :
+l'ancien journal est alors écarté. Le mode fichier suppose un seul processus API.
+"""
+import json
+import os
+import threading
+
+from changes import KEY_FIELDS, Snapshot, collection_fingerprints, dict_patch, fingerprint, list_patch, row_key
+
+_SEQ_KEY = "_journal_seq"
+# Compteurs d'identifiants (ORD-n, INV, CLI-n...), journalisés comme une collection dict.
+SEQUENCES = "sequences"
+
+
+class FileStore:
+    """Document JSON en mémoire, journal en ajout seul et compaction en arrière-plan."""
+
+    def __init__(self, path, compact_bytes=1024 * 1024, compact_interval=60.0, fsync=True):
+        self.path = path
+        self.journal_path = path + ".journal"
+        self._compact_bytes = max(0, int(compact_bytes))
+        self._compact_interval = max(1.0, float(compact_interval))
+        self._fsync = fsync
+        self._lock = threading.RLock()
+        self._wake = threading.Event()
+        self._data = {}
+        self._fps = {}  # collection -> empreintes de l'état courant (cf. changes.py)
+        self._versions = {}  # collection -> compteur de modifications
+        self._epoch = 0  # incrémenté à chaque relecture complète depuis le disque
+        self._seq = 0  # dernière ligne de journal appliquée
+        self._journal = None
+        self._journal_bytes = 0
+        self._file_stat = None
+        self._seeded = set()  # séquences recalées sur les données depuis la dernière relecture
+        self.compactions = 0
+        with self._lock:
+            self._reload()
+        threading.Thread(target=self._compact_loop, name="filestore-compact", daemon=True).start()
+
+    # ---------- lecture ----------
+
+    def load_data(self, *collections):
+        """Copie modifiable des collections demandées (toutes si vide), avec leurs empreintes."""
+        with self._lock:
+            self._reload_if_changed()
+            data = Snapshot()
+            fps = {}
+            for coll in collections or tuple(self._data):
+                if coll not in self._data:
+                    continue
+                current = self._fps.get(coll)
+                if isinstance(current, dict):
+                    data[coll] = {k: json.loads(fp) for k, fp in current.items()}
+                    fps[coll] = dict(current)
+                elif isinstance(current, list):
+                    data[coll] = [json.loads(fp) for _k, fp in current]
+                    fps[coll] = list(current)
+                else:
+                    data[coll] = json.loads(json.dumps(self._data[coll]))
+            data.fingerprints = fps
+        return data
+
+    def get_versions(self, collections):
+        """{collection: version} ; change dès qu'une sauvegarde ou une relecture la touche."""
+        with self._lock:
+            self._reload_if_changed()
+            return {c: (self._epoch, self._versions.get(c, 0)) for c in collections}
+
+    # ---------- écriture ----------
+
+    def save_data(self, data):
+        """Journalise les changements de data par rapport à ce qui avait été chargé."""
+        previous_all = getattr(data, "fingerprints", None) or {}
+        with self._lock:
+            self._reload_if_changed()
+            ops = []
+            for coll, value in data.items():
+                if coll.startswith("_"):
+                    continue
+                ops += self._diff(coll, value, previous_all.get(coll))
+            if ops:
+                record = {"n": self._seq + 1, "ops": ops}
+                self._append(record)
+                self._apply_record(record)
+            if isinstance(data, Snapshot):
+                # Une seconde sauvegarde du même objet repart de l'état écrit.
+                data.fingerprints = {
+                    c: collection_fingerprints(c, v) for c, v in data.items() if isinstance(v, (list, dict))
+                }
+            should_compact = self._compact_bytes and self._journal_bytes >= self._compact_bytes
+        if should_compact:
+            self._wake.set()
+        return True
+
+    def next_sequence_value(self, name, seed):
+        """Prochaine valeur du compteur name, journalisée avant d'être rendue.
+
+        seed() : plus grand numéro présent dans les données, lu à la première
+        allocation après chaque relecture du fichier (DATA_FILE édité à la main).
+        """
+        with self._lock:
+            self._reload_if_changed()
+            current = int((self._data.get(SEQUENCES) or {}).get(name) or 0)
+            if name not in self._seeded:
+                current = max(current, int(seed() or 0))
+            record = {"n": self._seq + 1, "ops": [{"c": SEQUENCES, "op": "merge", "v": {name: current + 1}}]}
+            self._append(record)
+            self._apply_record(record)
+            self._seeded.add(name)
+            return current + 1
+
+    def _diff(self, coll, value, previous):
+        """Opérations de journal pour passer de previous (empreintes chargées) à value."""
+        if isinstance(value, dict) and isinstance(previous, dict):
+            changed, removed = dict_patch(value, previous)
+            ops = []
+            if changed:
+                ops.append({"c": coll, "op": "merge", "v": changed})
+            if removed:
+                ops.append({"c": coll, "op": "unset", "k": removed})
+            return ops
+        if isinstance(value, list) and isinstance(previous, list):
+            patch = list_patch(coll, value, previous)
+            if patch is not None:
+                prepend, append, updates, removed = patch
+                ops = []
+                if removed:
+                    ops.append({"c": coll, "op": "del", "k": removed})
+                for k, doc in updates.items():
+                    ops.append({"c": coll, "op": "set", "k": k, "v": doc})
+                if prepend:
+                    ops.append({"c": coll, "op": "prepend", "v": prepend})
+                if append:
+                    ops.append({"c": coll, "op": "append", "v": append})
+                return ops
+        # Collection non chargée ou changement non exprimable : remplacement complet si elle diffère.
+        if isinstance(value, (list, dict)):
+            if collection_fingerprints(coll, value) == self._fps.get(coll):
+                return []
+        elif coll in self._data and value == self._data[coll]:
+            return []
+        return [{"c": coll, "op": "put", "v": value}]
+
+    def _append(self, record):
+        line = (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+        if self._journal is None:
+            self._journal = open(self.journal_path, "ab")
+        pos = self._journal.tell()
+        try:
+            self._journal.write(line)
+            self._journal.flush()
+            if self._fsync:
+                os.fsync(self._journal.fileno())
+        except Exception:
+            # Pas de ligne partielle suivie d'autres lignes : on revient à la taille précédente.
+            try:
+                self._journal.truncate(pos)
+            except Exception:
+                pass
+            raise
+        self._journal_bytes = pos + len(line)
+
+    # ---------- application des opérations ----------
+
+    def _apply_record(self, record):
+        for op in record.get("ops") or []:
+            self._apply_op(op)
+        self._seq = max(self._seq, int(record.get("n") or 0))
+
+    def _apply_op(self, op):
+        coll = op["c"]
+        kind = op["op"]
+        if kind == "put":
+            self._data[coll] = json.loads(json.dumps(op["v"]))
+            self._fps[coll] = collection_fingerprints(coll, self._data[coll]) if isinstance(op["v"], (list, dict)) else None
+        elif kind in ("merge", "unset"):
+            target = self._data.setdefault(coll, {})
+            fps = self._fps.setdefault(coll, {})
+            if kind == "merge":
+                for k, v in op["v"].items():
+                    fps[k] = fingerprint(v)
+                    target[k] = json.loads(fps[k])
+            else:
+                for k in op["k"]:
+                    target.pop(k, None)
+                    fps.pop(k, None)
+        else:
+            target = self._data.setdefault(coll, [])
+            fps = self._fps.setdefault(coll, [])
+            docs = [json.loads(fingerprint(d)) for d in (op.get("v") if kind != "set" else [op["v"]]) or []]
+            entries = [(row_key(d, KEY_FIELDS.get(coll)), fingerprint(d)) for d in docs]
+            if kind == "prepend":
+                target[0:0] = docs
+                fps[0:0] = entries
+            elif kind == "append":
+                target.extend(docs)
+                fps.extend(entries)
+            elif kind == "set":
+                for i, (k, _fp) in enumerate(fps):
+                    if k == op["k"]:
+                        target[i] = docs[0]
+                        fps[i] = entries[0]
+                        break
+            elif kind == "del":
+                gone = set(op["k"])
+                keep = [i for i, (k, _fp) in enumerate(fps) if k not in gone]
+                target[:] = [target[i] for i in keep]
+                fps[:] = [fps[i] for i in keep]
+        self._versions[coll] = self._versions.get(coll, 0) + 1
+
+    # ---------- relecture / compaction ----------
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def _reload_if_changed(self):
+        """Relit le disque si DATA_FILE a été remplacé par un autre que nous."""
+        st = self._stat()
+        if st is not None and st != self._file_stat:
+            self._reload()
+
+    def _reload(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        seq = data.pop(_SEQ_KEY, None)
+        self._data = data
+        self._fps = {c: collection_fingerprints(c, v) for c, v in data.items() if isinstance(v, (list, dict))}
+        self._seq = int(seq or 0)
+        self._seeded = set()
+        self._epoch += 1
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        if seq is None:
+            # Instantané sans numéro de journal (seed ou édition manuelle) : il fait foi.
+            os.replace(self._write_tmp(self._serialize(*self._snapshot())), self.path)
+            self._rewrite_journal(b"")
+        else:
+            self._replay()
+        self._file_stat = self._stat()
+
+    def _replay(self):
+        self._journal_bytes = 0
+        if not os.path.exists(self.journal_path):
+            return
+        good_end = 0
+        with open(self.journal_path, "rb") as f:
+            for raw in f:
+                if not raw.endswith(b"\n"):
+                    break  # dernière ligne tronquée par un arrêt brutal
+                good_end += len(raw)
+                try:
+                    record = json.loads(raw)
+                except ValueError:
+                    continue
+                if int(record.get("n") or 0) > self._seq:
+                    self._apply_record(record)
+        if good_end < os.path.getsize(self.journal_path):
+            # Retire la fin tronquée pour que les prochaines lignes restent lisibles.
+            with open(self.journal_path, "r+b") as f:
+                f.truncate(good_end)
+        self._journal_bytes = good_end
+
+    def _snapshot(self):
+        """Copie de l'état sous verrou, sans sérialiser : pour chaque élément, sa chaîne JSON
+        (empreinte, immuable). Coût proportionnel au nombre d'éléments, pas à leur taille."""
+        parts = {}
+        for coll, value in self._data.items():
+            fps = self._fps.get(coll)
+            if isinstance(value, dict) and isinstance(fps, dict):
+                parts[coll] = dict(fps)
+            elif isinstance(value, list) and isinstance(fps, list):
+                parts[coll] = [fp for _k, fp in fps]
+            else:
+                parts[coll] = fingerprint(value)
+        return parts, self._seq
+
+    @staticmethod
+    def _serialize(parts, seq):
+        """Texte de DATA_FILE à partir de _snapshot() ; appelé hors verrou par compact()."""
+        payload = {}
+        for coll, part in parts.items():
+            if isinstance(part, dict):
+                payload[coll] = {k: json.loads(fp) for k, fp in part.items()}
+            elif isinstance(part, list):
+                payload[coll] = [json.loads(fp) for fp in part]
+            else:
+                payload[coll] = json.loads(part)
+        payload[_SEQ_KEY] = seq
+        return json.dumps(payload, ensure_ascii=False, indent=2)
+
+    def _write_tmp(self, text):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        return tmp
+
+    def _rewrite_journal(self, tail):
+        tmp = f"{self.journal_path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(tail)
+            f.flush()
+            os.fsync(f.fileno())
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        os.replace(tmp, self.journal_path)
+        self._journal_bytes = len(tail)
+
+    def compact(self):
+        """Écrit l'état courant dans DATA_FILE et retire du journal les lignes incluses."""
+        with self._lock:
+            if not self._journal_bytes:
+                return False
+            parts, seq = self._snapshot()
+            offset = self._journal_bytes
+            epoch = self._epoch
+        # Sérialisation et écriture hors verrou : lectures et sauvegardes continuent pendant ce temps.
+        tmp = self._write_tmp(self._serialize(parts, seq))
+        with self._lock:
+            if epoch != self._epoch:
+                # DATA_FILE relu entre-temps (modification externe) : ne pas l'écraser.
+                os.remove(tmp)
+                return False
+            os.replace(tmp, self.path)
+            self._file_stat = self._stat()
+            # Lignes journalisées depuis _snapshot() (après offset) : absentes du fichier, elles restent au journal.
+            if self._journal is not None:
+                self._journal.flush()
+            with open(self.journal_path, "rb") as f:
+                f.seek(offset)
+                tail = f.read()
+            self._rewrite_journal(tail)
+            self.compactions += 1
+        return True
+
+    def _compact_loop(self):
+        while True:
+            self._wake.wait(self._compact_interval)
+            self._wake.clear()
+            try:
+                self.compact()
+            except Exception:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                "journal_bytes": self._journal_bytes,
+                "journal_seq": self._seq,
+                "compactions": self.compactions,
+            }
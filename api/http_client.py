@@ -0,0 +1,173 @@
+"""
+Client HTTP sortant de l'API StickerStreet (Telegram, Vercel Blob, CoinGecko).
+
+- Connexions keep-alive réutilisées par hôte : plus de handshake TLS à chaque appel.
+- Au plus max_idle connexions gardées au repos par hôte ; fermées après idle_timeout s.
+- Nouvel essai (attente exponentielle) sur erreur réseau et 429 / 502 / 503 / 504 pour
+  GET, PUT, DELETE. Un POST (sendMessage, createInvoiceLink...) n'est jamais rejoué :
+  le serveur a pu le traiter avant de couper. Une connexion au repos que le serveur a
+  déjà fermée est écartée avant l'envoi (socket lisible = fin de flux), donc sans risque.
+- Statut >= 400 : urllib.error.HTTPError, comme urllib.request.urlopen.
+- Latence, erreurs et réutilisation par hôte : stats(), affichées dans /api/health.
+"""
+import http.client
+import io
+import json
+import select
+import threading
+import time
+import urllib.error
+import urllib.parse
+
+_IDEMPOTENT = {"GET", "HEAD", "PUT", "DELETE"}
+_RETRY_STATUSES = {429, 502, 503, 504}
+# Connexion réutilisée que le serveur a fermée entre deux appels.
+_STALE_ERRORS = (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError)
+
+
+class Response:
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body.decode() or "{}")
+
+
+class HttpClient:
+    def __init__(self, max_idle=4, idle_timeout=60.0, retries=2, backoff=0.3):
+        self.max_idle = max(0, int(max_idle))
+        self.idle_timeout = float(idle_timeout)
+        self.retries = max(0, int(retries))
+        self.backoff = float(backoff)
+        self._lock = threading.Lock()
+        self._idle = {}  # (scheme, host, port) -> [(conn, last_used)]
+        self._stats = {}  # host -> compteurs
+
+    def request(self, method, url, body=None, headers=None, timeout=10.0, retries=None):
+        """Envoie la requête et lit toute la réponse ; lève HTTPError si statut >= 400."""
+        parts = urllib.parse.urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        retries = self.retries if retries is None else max(0, int(retries))
+        attempt = 0
+        while True:
+            start = time.monotonic()
+            conn, reused = self._acquire(key, timeout)
+            try:
+                conn.request(method, path, body=body, headers=headers or {})
+                resp = conn.getresponse()
+                data = resp.read()
+            except Exception as e:
+                conn.close()
+                # Connexion réutilisée coupée : rejouée aussitôt, sans compter d'essai, seulement si la
+                # requête est idempotente (un POST a pu être traité avant la coupure).
+                stale = reused and isinstance(e, _STALE_ERRORS) and method in _IDEMPOTENT
+                self._record(key, start, reused, error=not stale)
+                if stale:
+                    self._count(key, "stale")
+                    continue
+                if method in _IDEMPOTENT and attempt < retries:
+                    attempt += 1
+                    self._count(key, "retries")
+                    time.sleep(self.backoff * (2 ** (attempt - 1)))
+                    continue
+                raise
+            if resp.will_close:
+                conn.close()
+            else:
+                self._release(key, conn)
+            self._record(key, start, reused, error=resp.status >= 500, status=resp.status)
+            if resp.status in _RETRY_STATUSES and method in _IDEMPOTENT and attempt < retries:
+                attempt += 1
+                self._count(key, "retries")
+                time.sleep(self.backoff * (2 ** (attempt - 1)))
+                continue
+            if resp.status >= 400:
+                raise urllib.error.HTTPError(url, resp.status, resp.reason, resp.headers, io.BytesIO(data))
+            return Response(resp.status, resp.headers, data)
+
+    def _acquire(self, key, timeout):
+        now = time.monotonic()
+        with self._lock:
+            idle = self._idle.get(key) or []
+            while idle:
+                conn, last_used = idle.pop()
+                if now - last_used <= self.idle_timeout and not self._closed_by_peer(conn):
+                    if conn.sock is not None:
+                        conn.sock.settimeout(timeout)
+                    conn.timeout = timeout
+                    return conn, True
+                conn.close()
+        scheme, host, port = key
+        cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        self._count(key, "connects")
+        return cls(host, port, timeout=timeout), False
+
+    @staticmethod
+    def _closed_by_peer(conn):
+        """Connexion au repos déjà fermée par le serveur : son socket est lisible (fin de flux,
+        ou données inattendues). Vérifié avant l'envoi, sans attente."""
+        sock = conn.sock
+        if sock is None:
+            return True
+        try:
+            readable, _w, _x = select.select([sock], [], [], 0)
+        except (OSError, ValueError):
+            return True
+        return bool(readable)
+
+    def _release(self, key, conn):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle:
+                idle.append((conn, time.monotonic()))
+                return
+        conn.close()
+
+    def _host_stats(self, key):
+        host = key[1] or "?"
+        stats = self._stats.get(host)
+        if stats is None:
+            stats = self._stats[host] = {
+                "requests": 0, "errors": 0, "retries": 0, "stale": 0, "connects": 0, "reused": 0,
+                "total_ms": 0.0, "max_ms": 0.0, "last_status": None,
+            }
+        return stats
+
+    def _count(self, key, name):
+        with self._lock:
+            self._host_stats(key)[name] += 1
+
+    def _record(self, key, start, reused, error, status=None):
+        ms = (time.monotonic() - start) * 1000
+        with self._lock:
+            stats = self._host_stats(key)
+            stats["requests"] += 1
+            stats["reused"] += 1 if reused else 0
+            stats["errors"] += 1 if error else 0
+            stats["total_ms"] += ms
+            stats["max_ms"] = max(stats["max_ms"], ms)
+            if status is not None:
+                stats["last_status"] = status
+
+    def stats(self):
+        with self._lock:
+            out = {}
+            for host, s in self._stats.items():
+                out[host] = {
+                    **{k: v for k, v in s.items() if k != "total_ms"},
+                    "max_ms": round(s["max_ms"], 1),
+                    "avg_ms": round(s["total_ms"] / s["requests"], 1) if s["requests"] else 0.0,
+                    "idle": sum(len(v) for k, v in self._idle.items() if (k[1] or "?") == host),
+                }
+            return out
+
+    def close_all(self):
+        with self._lock:
+            for idle in self._idle.values():
+                while idle:
+                    idle.pop()[0].close()
@@ -0,0 +1,98 @@
+"""
+Index en mémoire pour les recherches par clé de l'API StickerStreet.
+
+Produit par id, client par telegram_user_id, commandes d'un client, facture
+d'une commande : au lieu de parcourir la liste à chaque requête, un dict
+{clé normalisée: documents} est construit une fois par chargement.
+
+- Instantanés figés (read_data) : l'index est attaché à la liste elle-même et
+  vit aussi longtemps qu'elle dans le cache ; une nouvelle version des données
+  donne un nouvel instantané, donc un nouvel index.
+- Données modifiables d'une requête (request_data) : index tenu par l'unité de
+  travail, reconstruit si la liste est remplacée ; les routes qui ajoutent ou
+  retirent un élément le répercutent avec add() / discard().
+"""
+import threading
+
+_lock = threading.Lock()
+
+
+def normalize_id(value):
+    """Clé comparable quel que soit le type reçu : 42, 42.0, "42" et " 42 " donnent "42"."""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    key = str(value).strip()
+    return key or None
+
+
+class KeyIndex:
+    """{clé normalisée: [documents]} dans l'ordre de la liste indexée."""
+
+    def __init__(self, docs, field):
+        self.field = field
+        self._by_key = {}
+        for doc in docs or ():
+            self.add(doc)
+
+    def get(self, key):
+        """Premier document ayant cette clé (comme next(...) sur la liste), ou None."""
+        found = self._by_key.get(normalize_id(key))
+        return found[0] if found else None
+
+    def get_all(self, key):
+        return list(self._by_key.get(normalize_id(key), ()))
+
+    def add(self, doc, front=False):
+        """À appeler après un ajout dans la liste indexée (front=True pour insert(0, doc))."""
+        key = normalize_id(doc.get(self.field)) if isinstance(doc, dict) else None
+        if key is None:
+            return
+        bucket = self._by_key.setdefault(key, [])
+        if front:
+            bucket.insert(0, doc)
+        else:
+            bucket.append(doc)
+
+    def discard(self, doc):
+        """À appeler après un retrait de la liste indexée."""
+        key = normalize_id(doc.get(self.field)) if isinstance(doc, dict) else None
+        bucket = self._by_key.get(key)
+        if bucket:
+            bucket[:] = [d for d in bucket if d is not doc]
+            if not bucket:
+                del self._by_key[key]
+
+    def __len__(self):
+        return len(self._by_key)
+
+
+def snapshot_memo(docs, name, build):
+    """Valeur dérivée d'une liste figée de read_data(), calculée une fois par instantané."""
+    if docs is None or not hasattr(docs, "__dict__"):
+        return build()
+    memo = getattr(docs, "_memo", None)
+    if memo is None or name not in memo:
+        with _lock:
+            memo = docs.__dict__.setdefault("_memo", {})
+            if name not in memo:
+                memo[name] = build()
+    return memo[name]
+
+
+def snapshot_index(docs, field):
+    """Index d'une liste figée de read_data(), construit à la première recherche."""
+    return snapshot_memo(docs, ("index", field), lambda: KeyIndex(docs, field))
+
+
+def snapshot_positions(docs, field):
+    """{clé normalisée: position} (première occurrence) d'une liste figée, pour les curseurs."""
+    def build():
+        positions = {}
+        for i, doc in enumerate(docs or ()):
+            key = normalize_id(doc.get(field)) if isinstance(doc, dict) else None
+            if key is not None:
+                positions.setdefault(key, i)
+        return positions
+    return snapshot_memo(docs, ("positions", field), build)
@@ -0,0 +1,431 @@
+"""
+File de tâches d'arrière-plan durable pour l'API StickerStreet.
+
+Les appels lents vers l'extérieur (Telegram, Vercel Blob) ne bloquent plus la
+réponse HTTP : la route enregistre une tâche, des threads la traitent ensuite.
+
+- Stockage : table `jobs` en mode Neon (plusieurs processus se partagent la file
+  grâce à FOR UPDATE SKIP LOCKED), fichier JSON à côté de DATA_FILE sinon.
+- Une tâche prise est « louée » (run_at = fin du bail) : si le processus meurt
+  pendant son exécution, elle redevient disponible à l'expiration du bail.
+- Échec : nouvel essai avec attente exponentielle ; après max_attempts, ou sur
+  PermanentJobError, la tâche passe en lettre morte (status "dead"), consultable
+  et relançable par l'admin.
+"""
+import json
+import os
+import threading
+import time
+
+
+class PermanentJobError(Exception):
+    """Échec définitif (requête refusée par le service) : pas de nouvel essai."""
+
+
+class FileJobStore:
+    """File en mémoire, journalisée en ajout seul (un seul processus).
+
+    Chaque changement ajoute une ligne au journal (path + ".journal") : son coût ne
+    dépend pas de la taille de la file. Au-delà de compact_every lignes, la file est
+    réécrite dans path et le journal vidé. Seules les max_dead dernières lettres
+    mortes sont conservées.
+    """
+
+    def __init__(self, path, max_dead=500, compact_every=1000):
+        self.path = path
+        self.journal_path = f"{path}.journal"
+        self.max_dead = max(1, int(max_dead))
+        self.compact_every = max(1, int(compact_every))
+        self._lock = threading.Lock()
+        self._next_id = 1
+        self._jobs = {}
+        self._journal = None
+        self._journal_lines = 0
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    saved = json.load(f)
+                self._jobs = {int(j["id"]): j for j in saved.get("jobs", [])}
+                self._next_id = int(saved.get("next_id") or 1)
+            except (OSError, ValueError, KeyError):
+                self._jobs = {}
+        try:
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        self._apply(json.loads(line))
+                    except (ValueError, KeyError, TypeError):
+                        break  # ligne tronquée par un arrêt brutal
+        except OSError:
+            pass
+        self._prune_dead()
+        self._compact()
+
+    def _apply(self, record):
+        job_id = int(record["id"])
+        if record.get("job") is None:
+            self._jobs.pop(job_id, None)
+        else:
+            self._jobs[job_id] = record["job"]
+        self._next_id = max(self._next_id, job_id + 1)
+
+    def _log(self, *job_ids):
+        """Ajoute l'état courant des tâches job_ids au journal (None : tâche supprimée)."""
+        if self._journal is None:
+            self._journal = open(self.journal_path, "a", encoding="utf-8")
+        for job_id in job_ids:
+            self._journal.write(json.dumps({"id": job_id, "job": self._jobs.get(job_id)}, ensure_ascii=False) + "\n")
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        self._journal_lines += len(job_ids)
+        if self._journal_lines >= self.compact_every:
+            self._compact()
+
+    def _compact(self):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"next_id": self._next_id, "jobs": list(self._jobs.values())}, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        # Le journal n'est vidé qu'une fois la file réécrite : rejouer ses lignes reste sans effet.
+        if self._journal is not None:
+            self._journal.close()
+        self._journal = open(self.journal_path, "w", encoding="utf-8")
+        self._journal_lines = 0
+
+    def _prune_dead(self):
+        """Supprime les lettres mortes les plus anciennes au-delà de max_dead ; retourne leurs ids."""
+        dead = sorted(j for j, job in self._jobs.items() if job["status"] == "dead")
+        pruned = dead[:max(0, len(dead) - self.max_dead)]
+        for job_id in pruned:
+            del self._jobs[job_id]
+        return pruned
+
+    def enqueue(self, kind, payload, delay=0.0):
+        with self._lock:
+            job_id = self._next_id
+            self._next_id += 1
+            self._jobs[job_id] = {
+                "id": job_id, "kind": kind, "payload": payload, "status": "pending",
+                "attempts": 0, "run_at": time.time() + delay, "last_error": None,
+                "created_at": time.time(),
+            }
+            self._log(job_id)
+            return job_id
+
+    def claim(self, lease):
+        now = time.time()
+        with self._lock:
+            ready = [j for j in self._jobs.values() if j["status"] != "dead" and j["run_at"] <= now]
+            if not ready:
+                return None
+            job = min(ready, key=lambda j: (j["run_at"], j["id"]))
+            job.update(status="running", attempts=job["attempts"] + 1, run_at=now + lease)
+            self._log(job["id"])
+            return dict(job)
+
+    def complete(self, job_id):
+        with self._lock:
+            if self._jobs.pop(job_id, None) is not None:
+                self._log(job_id)
+
+    def retry(self, job_id, delay, error):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job:
+                job.update(status="pending", run_at=time.time() + delay, last_error=error)
+                self._log(job_id)
+
+    def bury(self, job_id, error):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job:
+                job.update(status="dead", last_error=error)
+                self._log(job_id, *self._prune_dead())
+
+    def requeue(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if not job or job["status"] != "dead":
+                return False
+            job.update(status="pending", attempts=0, run_at=time.time())
+            self._log(job_id)
+            return True
+
+    def next_due(self):
+        """Secondes avant la prochaine tâche prête (None si la file est vide)."""
+        with self._lock:
+            times = [j["run_at"] for j in self._jobs.values() if j["status"] != "dead"]
+        return max(0.0, min(times) - time.time()) if times else None
+
+    def counts(self):
+        with self._lock:
+            counts = {"pending": 0, "running": 0, "dead": 0}
+            for j in self._jobs.values():
+                counts[j["status"]] = counts.get(j["status"], 0) + 1
+            return counts
+
+    def list(self, status, limit):
+        with self._lock:
+            jobs = sorted((j for j in self._jobs.values() if j["status"] == status), key=lambda j: -j["id"])
+            return [_public(j) for j in jobs[:limit]]
+
+
+class PostgresJobStore:
+    """File dans la table Neon `jobs` (créée par db.py) ; connection : db.connection."""
+
+    def __init__(self, connection, max_dead=500):
+        self._connection = connection
+        self.max_dead = max(1, int(max_dead))
+
+    def _run(self, sql, params=(), fetch=None):
+        with self._connection() as conn, conn.cursor() as cur:
+            cur.execute(sql, params)
+            if fetch == "one":
+                return cur.fetchone()
+            if fetch == "all":
+                return cur.fetchall()
+            return cur.rowcount
+
+    def enqueue(self, kind, payload, delay=0.0):
+        from psycopg2.extras import Json
+        row = self._run(
+            "INSERT INTO jobs (kind, payload, run_at) VALUES (%s, %s, now() + make_interval(secs => %s)) RETURNING id",
+            (kind, Json(payload), float(delay)), fetch="one",
+        )
+        return row["id"]
+
+    def claim(self, lease):
+        row = self._run(
+            """
+            UPDATE jobs SET status = 'running', attempts = attempts + 1,
+                            run_at = now() + make_interval(secs => %s)
+            WHERE id = (
+              SELECT id FROM jobs WHERE status <> 'dead' AND run_at <= now()
+              ORDER BY run_at, id FOR UPDATE SKIP LOCKED LIMIT 1
+            )
+            RETURNING id, kind, payload, attempts
+            """,
+            (float(lease),), fetch="one",
+        )
+        return dict(row) if row else None
+
+    def complete(self, job_id):
+        self._run("DELETE FROM jobs WHERE id = %s", (job_id,))
+
+    def retry(self, job_id, delay, error):
+        self._run(
+            "UPDATE jobs SET status = 'pending', run_at = now() + make_interval(secs => %s), last_error = %s WHERE id = %s",
+            (float(delay), error, job_id),
+        )
+
+    def bury(self, job_id, error):
+        self._run("UPDATE jobs SET status = 'dead', last_error = %s WHERE id = %s", (error, job_id))
+        # Seules les max_dead dernières lettres mortes sont conservées.
+        self._run(
+            """
+            DELETE FROM jobs WHERE status = 'dead' AND id < (
+              SELECT min(id) FROM (
+                SELECT id FROM jobs WHERE status = 'dead' ORDER BY id DESC LIMIT %s
+              ) AS kept
+            )
+            """,
+            (self.max_dead,),
+        )
+
+    def requeue(self, job_id):
+        return self._run(
+            "UPDATE jobs SET status = 'pending', attempts = 0, run_at = now() WHERE id = %s AND status = 'dead'",
+            (job_id,),
+        ) > 0
+
+    def next_due(self):
+        row = self._run(
+            "SELECT EXTRACT(EPOCH FROM (min(run_at) - now())) AS due FROM jobs WHERE status <> 'dead'",
+            fetch="one",
+        )
+        due = row and row["due"]
+        return None if due is None else max(0.0, float(due))
+
+    def counts(self):
+        counts = {"pending": 0, "running": 0, "dead": 0}
+        for r in self._run("SELECT status, count(*) AS n FROM jobs GROUP BY status", fetch="all"):
+            counts[r["status"]] = r["n"]
+        return counts
+
+    def list(self, status, limit):
+        rows = self._run(
+            """
+            SELECT id, kind, payload, status, attempts, last_error,
+                   EXTRACT(EPOCH FROM created_at) AS created_at
+            FROM jobs WHERE status = %s ORDER BY id DESC LIMIT %s
+            """,
+            (status, int(limit)), fetch="all",
+        )
+        return [_public(dict(r)) for r in rows]
+
+
+def _public(job):
+    """Vue admin d'une tâche (sans les contenus binaires encodés en base64)."""
+    payload = {k: v for k, v in (job.get("payload") or {}).items() if not k.endswith("_base64")}
+    return {
+        "id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "last_error": job.get("last_error"),
+        "created_at": float(job.get("created_at") or 0),
+        "payload": payload,
+    }
+
+
+class JobQueue:
+    """Threads de traitement au-dessus d'un store (FileJobStore / PostgresJobStore)."""
+
+    def __init__(self, store, workers=2, max_attempts=8, backoff_base=5.0, backoff_max=900.0,
+                 lease=120.0, idle_poll=30.0, logger=None):
+        self.store = store
+        self.workers = max(1, int(workers))
+        self.max_attempts = max(1, int(max_attempts))
+        self.backoff_base = float(backoff_base)
+        self.backoff_max = float(backoff_max)
+        self.lease = float(lease)
+        self.idle_poll = max(1.0, float(idle_poll))
+        self._logger = logger
+        self._handlers = {}
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._started_pid = None
+        self._stats = {"done": 0, "retried": 0, "dead": 0}
+
+    def register(self, kind, handler):
+        self._handlers[kind] = handler
+
+    def enqueue(self, kind, payload, delay=0.0):
+        """Enregistre la tâche (durable) puis réveille un thread ; retourne son id."""
+        job_id = self.store.enqueue(kind, payload, delay)
+        self.wake()
+        return job_id
+
+    def wake(self):
+        """Réveille un thread (nouvelle tâche, ou tâche relancée par l'admin)."""
+        self.start()
+        self._wake.set()
+
+    def start(self):
+        """Démarre les threads (une fois par processus, y compris après un fork)."""
+        if self._started_pid == os.getpid():
+            return
+        with self._lock:
+            if self._started_pid == os.getpid():
+                return
+            self._started_pid = os.getpid()
+            for i in range(self.workers):
+                threading.Thread(target=self._loop, name=f"jobs-{i}", daemon=True).start()
+
+    def _loop(self):
+        while True:
+            # Effacé avant de chercher : une tâche ajoutée pendant la recherche réveille aussitôt.
+            self._wake.clear()
+            try:
+                job = self.store.claim(self.lease)
+            except Exception as e:
+                self._log(f"Job claim failed: {e}")
+                self._wake.wait(self.idle_poll)
+                continue
+            if job:
+                self._run(job)
+                continue
+            try:
+                due = self.store.next_due()
+            except Exception:
+                due = None
+            self._wake.wait(self.idle_poll if due is None else min(self.idle_poll, max(0.1, due)))
+
+    def _run(self, job):
+        handler = self._handlers.get(job["kind"])
+        try:
+            if handler is None:
+                raise PermanentJobError(f"Type de tâche inconnu : {job['kind']}")
+            handler(job["payload"] or {})
+        except PermanentJobError as e:
+            self._bury(job, str(e))
+        except Exception as e:
+            if job["attempts"] >= self.max_attempts:
+                self._bury(job, str(e))
+            else:
+                delay = min(self.backoff_max, self.backoff_base * (2 ** (job["attempts"] - 1)))
+                self._log(f"Job {job['kind']} #{job['id']} failed (attempt {job['attempts']}), retry in {delay:.0f}s: {e}")
+                self._stats["retried"] += 1
+                self._safe(self.store.retry, job["id"], delay, str(e)[:500])
+        else:
+            self._stats["done"] += 1
+            self._safe(self.store.complete, job["id"])
+
+    def _bury(self, job, error):
+        self._log(f"Job {job['kind']} #{job['id']} dead after {job['attempts']} attempt(s): {error}")
+        self._stats["dead"] += 1
+        self._safe(self.store.bury, job["id"], error[:500])
+
+    def _safe(self, fn, *args):
+        try:
+            fn(*args)
+        except Exception as e:
+            # Le bail expirera : la tâche sera reprise plus tard.
+            self._log(f"Job store update failed: {e}")
+
+    def _log(self, msg):
+        if self._logger:
+            self._logger.warning(msg)
+
+    def stats(self):
+        try:
+            counts = self.store.counts()
+        except Exception:
+            counts = None
+        return {"queue": counts, "workers": self.workers, **self._stats}
+
+
+class PeriodicTask:
+    """fn() appelée toutes les interval secondes dans un thread (une fois par processus) ;
+    once=True : un seul appel, dès le démarrage (migration)."""
+
+    def __init__(self, fn, interval, name, logger=None, once=False):
+        self._fn = fn
+        self.once = once
+        self.interval = max(1.0, float(interval))
+        self.name = name
+        self._logger = logger
+        self._lock = threading.Lock()
+        self._started_pid = None
+        self._stats = {"runs": 0, "failures": 0, "last_result": None}
+
+    def start(self):
+        if self._started_pid == os.getpid():
+            return
+        with self._lock:
+            if self._started_pid == os.getpid():
+                return
+            self._started_pid = os.getpid()
+            threading.Thread(target=self._loop, name=self.name, daemon=True).start()
+
+    def _loop(self):
+        if self.once:
+            self.run()
+            return
+        while True:
+            time.sleep(self.interval)
+            self.run()
+
+    def run(self):
+        try:
+            self._stats["last_result"] = self._fn()
+            self._stats["runs"] += 1
+        except Exception as e:
+            self._stats["failures"] += 1
+            if self._logger:
+                self._logger.warning(f"{self.name} failed: {e}")
+
+    def stats(self):
+        return {"interval": self.interval, **self._stats}
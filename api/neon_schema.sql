@@ -4,7 +4,8 @@
 -- Une seule table pour stocker le blob JSON (compatible avec l'API actuelle)
 CREATE TABLE IF NOT EXISTS kv_store (
   key TEXT PRIMARY KEY,
-  value JSONB NOT NULL DEFAULT '{}'
+  value JSONB NOT NULL DEFAULT '{}',
+  version BIGINT NOT NULL DEFAULT 0  -- incrémenté à chaque écriture (cache de lecture de l'API)
 );
 
 -- Données initiales (même structure que data.json)
@@ -28,3 +29,49 @@ INSERT INTO kv_store (key, value) VALUES (
     "pending_invoices": {}
   }'::jsonb
 ) ON CONFLICT (key) DO NOTHING;
+
+-- Mode NEON_STORAGE=tables : une table par entité (créées automatiquement par api/db.py).
+-- seq conserve l'ordre d'insertion, key est l'identifiant métier (id, invoice_number ; id du message pour le chat).
+-- Au premier lancement, le contenu de kv_store['data'] y est importé.
+CREATE TABLE IF NOT EXISTS products (seq BIGSERIAL PRIMARY KEY, key TEXT UNIQUE, doc JSONB NOT NULL);
+CREATE TABLE IF NOT EXISTS orders (seq BIGSERIAL PRIMARY KEY, key TEXT UNIQUE, doc JSONB NOT NULL);
+CREATE TABLE IF NOT EXISTS clients (seq BIGSERIAL PRIMARY KEY, key TEXT UNIQUE, doc JSONB NOT NULL);
+CREATE TABLE IF NOT EXISTS chat_messages (seq BIGSERIAL PRIMARY KEY, key TEXT UNIQUE, doc JSONB NOT NULL);
+CREATE TABLE IF NOT EXISTS momo (seq BIGSERIAL PRIMARY KEY, key TEXT UNIQUE, doc JSONB NOT NULL);
+CREATE TABLE IF NOT EXISTS banners (seq BIGSERIAL PRIMARY KEY, key TEXT UNIQUE, doc JSONB NOT NULL);
+CREATE TABLE IF NOT EXISTS invoices (seq BIGSERIAL PRIMARY KEY, key TEXT UNIQUE, doc JSONB NOT NULL);
+-- Les écritures lisent seulement les lignes touchées : par key, par telegram_user_id pour les
+-- clients, par order_id pour les factures.
+CREATE INDEX IF NOT EXISTS clients_telegram_user_id ON clients ((doc->>'telegram_user_id'));
+CREATE INDEX IF NOT EXISTS invoices_order_id ON invoices ((doc->>'order_id'));
+
+-- Séquences d'identifiants (ORD-n, numéros de facture, CLI-n, ids produits / bannières).
+-- Créées automatiquement par api/db.py et recalées au-dessus des identifiants existants.
+CREATE SEQUENCE IF NOT EXISTS id_orders MINVALUE 0 START 1;
+CREATE SEQUENCE IF NOT EXISTS id_invoices MINVALUE 0 START 1;
+CREATE SEQUENCE IF NOT EXISTS id_clients MINVALUE 0 START 1;
+CREATE SEQUENCE IF NOT EXISTS id_products MINVALUE 0 START 1;
+CREATE SEQUENCE IF NOT EXISTS id_banners MINVALUE 0 START 1;
+
+-- File de tâches d'arrière-plan (api/jobs.py) : notifications Telegram, envois Vercel Blob.
+-- status : pending | running (run_at = fin du bail) | dead (lettre morte). Une tâche réussie est supprimée.
+CREATE TABLE IF NOT EXISTS jobs (
+  id BIGSERIAL PRIMARY KEY,
+  kind TEXT NOT NULL,
+  payload JSONB NOT NULL DEFAULT '{}',
+  status TEXT NOT NULL DEFAULT 'pending',
+  attempts INT NOT NULL DEFAULT 0,
+  run_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  last_error TEXT,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (run_at) WHERE status <> 'dead';
+
+-- Pièces jointes binaires (api/attachments.py) : PDF des factures pas encore envoyés vers Vercel Blob.
+-- id = sha256 du contenu ; la facture n'en garde que l'identifiant (pdf_attachment).
+CREATE TABLE IF NOT EXISTS attachments (
+  id TEXT PRIMARY KEY,
+  content_type TEXT NOT NULL DEFAULT 'application/octet-stream',
+  data BYTEA NOT NULL,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
@@ -0,0 +1,120 @@
+"""
+Petit moteur PDF texte pour les factures StickerStreet (sans dépendance).
+
+- Pagination automatique : plus aucune ligne perdue en bas de page ; les lignes
+  trop longues sont coupées ; « Page n/N » en pied de page s'il y en a plusieurs.
+- Flux de contenu compressés (FlateDecode).
+- Objets fixes (catalogue, police) sérialisés une seule fois au chargement du
+  module, avec leurs positions : chaque document ne construit que ses pages.
+- render_many() : plusieurs documents en un appel (export, renvoi groupé).
+"""
+import zlib
+from functools import lru_cache
+
+PAGE_WIDTH = 595
+PAGE_HEIGHT = 842
+TOP = 810
+BOTTOM = 40
+LINE_HEIGHT = 16
+FONT_SIZE = 11
+MAX_CHARS = 95  # Helvetica 11 pt sur 515 pt de large, marge comprise
+LINES_PER_PAGE = (TOP - BOTTOM) // LINE_HEIGHT + 1
+
+# Objets 1 (catalogue) et 3 (police) : identiques pour tous les documents.
+_HEADER = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+_CATALOG = b"1 0 obj\n<< /Type /Catalog /Pages 2 0 R >>\nendobj\n"
+_FONT = b"3 0 obj\n<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>\nendobj\n"
+_PREFIX = _HEADER + _CATALOG + _FONT
+_PREFIX_OFFSETS = {1: len(_HEADER), 3: len(_HEADER) + len(_CATALOG)}
+_PAGE_TEMPLATE = (
+    "{num} 0 obj\n<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] "
+    "/Resources << /Font << /F1 3 0 R >> >> /Contents {content} 0 R >>\nendobj\n" % (PAGE_WIDTH, PAGE_HEIGHT)
+)
+
+
+def _escape(text):
+    return str(text or "").replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _wrap(lines):
+    out = []
+    for line in lines:
+        line = str(line if line is not None else "")
+        while len(line) > MAX_CHARS:
+            cut = line.rfind(" ", 3, MAX_CHARS)  # après le retrait "  " des lignes de suite
+            cut = cut if cut > 3 else MAX_CHARS
+            out.append(line[:cut])
+            line = "  " + line[cut:].lstrip()
+        out.append(line)
+    return out
+
+
+def paginate(lines):
+    """Découpe les lignes (après retour à la ligne) en pages ; au moins une page."""
+    lines = _wrap(lines)
+    return [lines[i:i + LINES_PER_PAGE] for i in range(0, len(lines), LINES_PER_PAGE)] or [[]]
+
+
+_STREAM_START = f"BT /F1 {FONT_SIZE} Tf {LINE_HEIGHT} TL 40 {TOP + LINE_HEIGHT} Td\n".encode("ascii")
+
+
+def _line_op(line, ops_cache):
+    """Opérateur « ' » (ligne suivante puis texte) encodé ; en-têtes et pieds se répètent d'une facture à l'autre."""
+    op = ops_cache.get(line)
+    if op is None:
+        op = ops_cache[line] = f"({_escape(line)}) '\n".encode("cp1252", "replace")
+    return op
+
+
+def _content_stream(page_lines, page_no, page_count, ops_cache):
+    ops = [_STREAM_START]
+    ops.extend(_line_op(line, ops_cache) for line in page_lines)
+    ops.append(b"ET")
+    if page_count > 1:
+        ops.append(f"\nBT /F1 9 Tf {PAGE_WIDTH - 90} 20 Td (Page {page_no}/{page_count}) Tj ET".encode("ascii"))
+    return zlib.compress(b"".join(ops), 6)
+
+
+@lru_cache(maxsize=32)
+def _page_objects(count):
+    """Arbre des pages et objets Page d'un document de count pages (ne dépend que de count)."""
+    kids = " ".join(f"{4 + 2 * i} 0 R" for i in range(count))
+    pages = f"2 0 obj\n<< /Type /Pages /Count {count} /Kids [{kids}] >>\nendobj\n".encode("ascii")
+    return pages, [_PAGE_TEMPLATE.format(num=4 + 2 * i, content=5 + 2 * i).encode("ascii") for i in range(count)]
+
+
+def render(lines, _ops_cache=None):
+    """PDF (bytes) d'une suite de lignes de texte, sur autant de pages que nécessaire."""
+    ops_cache = {} if _ops_cache is None else _ops_cache
+    pages = paginate(lines)
+    count = len(pages)
+    pages_obj, page_objs = _page_objects(count)
+    out = bytearray(_PREFIX)
+    offsets = dict(_PREFIX_OFFSETS)
+    offsets[2] = len(out)
+    out += pages_obj
+    for i, page_lines in enumerate(pages):
+        num = 4 + 2 * i
+        stream = _content_stream(page_lines, i + 1, count, ops_cache)
+        offsets[num] = len(out)
+        out += page_objs[i]
+        offsets[num + 1] = len(out)
+        out += f"{num + 1} 0 obj\n<< /Length {len(stream)} /Filter /FlateDecode >>\nstream\n".encode("ascii")
+        out += stream
+        out += b"\nendstream\nendobj\n"
+    size = 4 + 2 * count
+    xref_pos = len(out)
+    out += f"xref\n0 {size}\n0000000000 65535 f \n".encode("ascii")
+    out += "".join(f"{offsets[n]:010d} 00000 n \n" for n in range(1, size)).encode("ascii")
+    out += f"trailer\n<< /Size {size} /Root 1 0 R >>\nstartxref\n{xref_pos}\n%%EOF".encode("ascii")
+    return bytes(out)
+
+
+def render_many(documents):
+    """Liste de PDF pour une liste de documents (chacun une liste de lignes).
+
+    Les lignes déjà encodées (en-têtes, mentions fixes, articles courants) sont
+    partagées entre les documents du lot.
+    """
+    ops_cache = {}
+    return [render(lines, ops_cache) for lines in documents]
@@ -0,0 +1,119 @@
+"""
+Cache disque des PDF de factures (LRU borné en octets).
+
+Fichier <numéro de facture>_<sha256>.pdf, écrit à la création de la facture :
+renvoyer la facture à la validation de la commande ne demande ni téléchargement
+depuis Vercel Blob ni décodage base64. Le sha256 enregistré dans la facture
+(pdf_sha256) garantit qu'on ne sert pas un PDF périmé. Les fichiers les moins
+récemment utilisés sont supprimés au-delà de max_bytes ; au redémarrage, l'ordre
+est reconstruit d'après les dates de modification (rafraîchies à chaque lecture).
+"""
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+
+_UNSAFE = re.compile(r"[^A-Za-z0-9_-]")
+
+
+def content_hash(pdf_bytes):
+    return hashlib.sha256(pdf_bytes).hexdigest()
+
+
+class PdfCache:
+    def __init__(self, directory, max_bytes=50 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max(0, int(max_bytes))
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # numéro -> (chemin, sha256, taille), du plus ancien au plus récent
+        self._size = 0
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+        try:
+            os.makedirs(directory, exist_ok=True)
+            files = []
+            for name in os.listdir(directory):
+                m = re.match(r"^(.+)_([0-9a-f]{64})\.pdf$", name)
+                if m:
+                    path = os.path.join(directory, name)
+                    st = os.stat(path)
+                    files.append((st.st_mtime, m.group(1), path, m.group(2), st.st_size))
+            for _mtime, key, path, digest, size in sorted(files):
+                self._remember(key, path, digest, size)
+            self._evict()
+        except OSError:
+            pass
+
+    @staticmethod
+    def _key(invoice_number):
+        return _UNSAFE.sub("_", str(invoice_number or ""))
+
+    def _remember(self, key, path, digest, size):
+        old = self._entries.pop(key, None)
+        if old:
+            self._size -= old[2]
+            if old[0] != path:
+                self._remove(old[0])
+        self._entries[key] = (path, digest, size)
+        self._size += size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _evict(self):
+        while self._size > self.max_bytes and self._entries:
+            _key, (path, _digest, size) = self._entries.popitem(last=False)
+            self._size -= size
+            self._stats["evictions"] += 1
+            self._remove(path)
+
+    def put(self, invoice_number, pdf_bytes):
+        """Enregistre le PDF ; retourne son sha256 (à garder dans la facture)."""
+        digest = content_hash(pdf_bytes)
+        if len(pdf_bytes) > self.max_bytes:
+            return digest
+        key = self._key(invoice_number)
+        path = os.path.join(self.directory, f"{key}_{digest}.pdf")
+        try:
+            tmp = f"{path}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(pdf_bytes)
+            os.replace(tmp, path)
+        except OSError:
+            return digest
+        with self._lock:
+            self._remember(key, path, digest, len(pdf_bytes))
+            self._evict()
+        return digest
+
+    def get(self, invoice_number, digest=None):
+        """PDF en cache (bytes) ou None ; digest : sha256 attendu, si connu."""
+        key = self._key(invoice_number)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (digest and entry[1] != digest):
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+        path = entry[0]
+        try:
+            with open(path, "rb") as f:
+                pdf_bytes = f.read()
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                if self._entries.get(key) == entry:
+                    del self._entries[key]
+                    self._size -= entry[2]
+                self._stats["misses"] += 1
+            return None
+        self._stats["hits"] += 1
+        return pdf_bytes
+
+    def stats(self):
+        with self._lock:
+            return {"files": len(self._entries), "bytes": self._size, "max_bytes": self.max_bytes, **self._stats}
@@ -0,0 +1,211 @@
+"""
+Pool de connexions thread-safe pour Neon (psycopg2).
+
+- Taille bornée : au-delà de maxconn, les threads attendent (jusqu'à timeout).
+- Connexion vérifiée (SELECT 1) si elle est restée inactive plus de check_after s.
+- Connexion renouvelée après max_lifetime s (Neon coupe les connexions longues).
+- Échecs de connexion : attente exponentielle avant de réessayer, pour ne pas
+  enchaîner les handshakes TLS quand Neon est indisponible.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+
+class PoolUnavailable(Exception):
+    """Aucune connexion obtenue (pool saturé, ou Neon en attente de reconnexion)."""
+
+
+class ConnectionPool:
+    def __init__(self, connect, maxconn=5, timeout=10.0, max_lifetime=1800.0, check_after=30.0,
+                 backoff_base=0.5, backoff_max=30.0, on_connect=None):
+        self._connect = connect
+        self._on_connect = on_connect
+        self.maxconn = max(1, int(maxconn))
+        self.timeout = float(timeout)
+        self.max_lifetime = float(max_lifetime)
+        self.check_after = float(check_after)
+        self.backoff_base = float(backoff_base)
+        self.backoff_max = float(backoff_max)
+        self._cond = threading.Condition()
+        self._idle = []  # [(conn, created_at, last_used)]
+        self._in_use = {}  # id(conn) -> created_at
+        self._opening = 0
+        self._failures = 0
+        self._retry_at = 0.0
+        self._stats = {
+            "connects": 0,
+            "connect_failures": 0,
+            "discarded": 0,
+            "waits": 0,
+            "wait_time_ms": 0.0,
+            "max_wait_ms": 0.0,
+            "timeouts": 0,
+        }
+
+    @contextmanager
+    def connection(self):
+        """Prête une connexion le temps du bloc ; elle est écartée si elle est cassée."""
+        conn, created = self._acquire()
+        broken = False
+        try:
+            yield conn
+        except Exception as e:
+            broken = self._is_broken(conn, e)
+            raise
+        finally:
+            self._release(conn, created, broken)
+
+    def _acquire(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        waited = False
+        while True:
+            conn = None
+            with self._cond:
+                while True:
+                    if self._idle:
+                        conn, created, last_used = self._idle.pop()
+                        now = time.monotonic()
+                        if getattr(conn, "closed", False) or now - created > self.max_lifetime:
+                            self._discard(conn)
+                            conn = None
+                            continue
+                        # Place réservée avant la vérification, qui se fait hors verrou.
+                        self._in_use[id(conn)] = created
+                        check = now - last_used > self.check_after
+                        break
+                    if len(self._in_use) + self._opening < self.maxconn:
+                        now = time.monotonic()
+                        if now < self._retry_at:
+                            raise PoolUnavailable("reconnexion Neon en attente (backoff)")
+                        self._opening += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise PoolUnavailable("pool de connexions saturé")
+                    waited = True
+                    self._cond.wait(remaining)
+            if conn is None:
+                break
+            # SELECT 1 hors verrou : une connexion lente ou morte ne bloque pas les autres threads.
+            if check and not self._ping(conn):
+                self._close(conn)
+                with self._cond:
+                    self._in_use.pop(id(conn), None)
+                    self._stats["discarded"] += 1
+                    self._cond.notify()
+                continue
+            with self._cond:
+                self._record_wait(start, waited)
+            return conn, created
+        # Connexion ouverte hors verrou : le handshake TLS ne bloque pas les autres threads.
+        conn = None
+        try:
+            conn = self._connect()
+            if self._on_connect:
+                self._on_connect(conn)
+        except Exception:
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            with self._cond:
+                self._opening -= 1
+                self._failures += 1
+                self._stats["connect_failures"] += 1
+                delay = min(self.backoff_max, self.backoff_base * (2 ** (self._failures - 1)))
+                self._retry_at = time.monotonic() + delay
+                self._cond.notify()
+            raise
+        created = time.monotonic()
+        with self._cond:
+            self._opening -= 1
+            self._failures = 0
+            self._retry_at = 0.0
+            self._stats["connects"] += 1
+            self._in_use[id(conn)] = created
+            self._record_wait(start, waited)
+        return conn, created
+
+    def _release(self, conn, created, broken):
+        if not broken and not getattr(conn, "closed", False):
+            broken = not self._reset(conn)
+        with self._cond:
+            self._in_use.pop(id(conn), None)
+            if broken or time.monotonic() - created > self.max_lifetime:
+                self._discard(conn)
+            else:
+                self._idle.append((conn, created, time.monotonic()))
+            self._cond.notify()
+
+    def _record_wait(self, start, waited):
+        if not waited:
+            return
+        ms = (time.monotonic() - start) * 1000
+        self._stats["waits"] += 1
+        self._stats["wait_time_ms"] += ms
+        self._stats["max_wait_ms"] = max(self._stats["max_wait_ms"], ms)
+
+    def _discard(self, conn):
+        self._stats["discarded"] += 1
+        self._close(conn)
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    @staticmethod
+    def _ping(conn):
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+                cur.fetchone()
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _reset(conn):
+        """Remet la connexion au repos (transaction ouverte suite à une erreur)."""
+        try:
+            from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+            if conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+                with conn.cursor() as cur:
+                    cur.execute("ROLLBACK")
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _is_broken(conn, exc):
+        if getattr(conn, "closed", False):
+            return True
+        try:
+            import psycopg2
+            return isinstance(exc, (psycopg2.OperationalError, psycopg2.InterfaceError))
+        except ImportError:
+            return False
+
+    def close_all(self):
+        with self._cond:
+            while self._idle:
+                self._discard(self._idle.pop()[0])
+
+    def stats(self):
+        with self._cond:
+            waits = self._stats["waits"]
+            return {
+                "max": self.maxconn,
+                "in_use": len(self._in_use),
+                "idle": len(self._idle),
+                "opening": self._opening,
+                **{k: round(v, 1) if isinstance(v, float) else v for k, v in self._stats.items()},
+                "avg_wait_ms": round(self._stats["wait_time_ms"] / waits, 1) if waits else 0.0,
+                "backoff_s": round(max(0.0, self._retry_at - time.monotonic()), 1),
+            }
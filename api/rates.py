@@ -0,0 +1,124 @@
+"""
+Cours mis en cache pour l'API StickerStreet (TON/USD via CoinGecko).
+
+- Un thread rafraîchit la valeur toutes les ttl secondes : les requêtes
+  (/api/rates/ton, /api/invoice/stars) ne l'attendent jamais.
+- Valeur plus vieille que ttl (CoinGecko lent ou limité) : servie quand même
+  (stale-while-revalidate) et un rafraîchissement est relancé ; au-delà de
+  max_stale, get() renvoie None et l'appelant passe au cours de secours.
+- Dernière valeur valide enregistrée (save) et relue au démarrage (load_saved),
+  au plus une fois toutes les persist_interval secondes.
+"""
+import os
+import threading
+import time
+
+
+class CachedRate:
+    def __init__(self, fetch, ttl=60.0, max_stale=21600.0, persist_interval=600.0,
+                 load_saved=None, save=None, logger=None):
+        self._fetch = fetch
+        self._load_saved = load_saved
+        self.ttl = max(1.0, float(ttl))
+        self.max_stale = float(max_stale)
+        self.persist_interval = float(persist_interval)
+        self._save = save
+        self._logger = logger
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._value = None
+        self._fetched_at = 0.0  # time.time() de la valeur
+        self._persisted_at = 0.0
+        self._started_pid = None
+        self._refreshing = False
+        self._stats = {"fetches": 0, "failures": 0, "stale_served": 0}
+
+    def get(self):
+        """(valeur, âge en secondes) ; (None, âge ou None) si rien d'assez récent."""
+        self.start()
+        with self._lock:
+            value, fetched_at = self._value, self._fetched_at
+        age = time.time() - fetched_at if value is not None else None
+        if age is None or age > self.ttl:
+            self._wake.set()  # le thread rafraîchit, la requête n'attend pas
+            if age is None or age > self.max_stale:
+                return None, age
+            self._stats["stale_served"] += 1
+        return value, age
+
+    def start(self):
+        """Démarre le thread de rafraîchissement (une fois par processus, y compris après un fork)."""
+        if self._started_pid == os.getpid():
+            return
+        with self._lock:
+            if self._started_pid == os.getpid():
+                return
+            self._started_pid = os.getpid()
+        threading.Thread(target=self._loop, name="rate-refresh", daemon=True).start()
+
+    def _loop(self):
+        self._restore()
+        failures = 0
+        while True:
+            if self.refresh():
+                failures = 0
+            else:
+                # Source en échec : pas de nouvel appel à chaque requête qui trouve la valeur périmée.
+                failures += 1
+                time.sleep(min(self.ttl, 2.0 ** failures))
+            self._wake.wait(self.ttl)
+            self._wake.clear()
+
+    def _restore(self):
+        """Relit la dernière valeur enregistrée (hors requête : le stockage peut être lent)."""
+        if not self._load_saved:
+            return
+        try:
+            saved = self._load_saved() or {}
+            if float(saved.get("value") or 0) > 0:
+                with self._lock:
+                    if self._value is None:
+                        self._value = float(saved["value"])
+                        self._fetched_at = self._persisted_at = float(saved.get("fetched_at") or 0)
+        except Exception as e:
+            self._log(f"Cours enregistré illisible: {e}")
+
+    def refresh(self):
+        """Interroge la source ; garde l'ancienne valeur en cas d'échec. True si la valeur est neuve."""
+        with self._lock:
+            if self._refreshing:
+                return False
+            self._refreshing = True
+        try:
+            value = float(self._fetch() or 0)
+            if value <= 0:
+                raise ValueError("cours nul")
+        except Exception as e:
+            self._stats["failures"] += 1
+            self._log(f"Rafraîchissement du cours échoué: {e}")
+            return False
+        finally:
+            with self._lock:
+                self._refreshing = False
+        now = time.time()
+        with self._lock:
+            self._value, self._fetched_at = value, now
+            persist = self._save and now - self._persisted_at >= self.persist_interval
+            if persist:
+                self._persisted_at = now
+        self._stats["fetches"] += 1
+        if persist:
+            try:
+                self._save({"value": value, "fetched_at": now})
+            except Exception as e:
+                self._log(f"Enregistrement du cours échoué: {e}")
+        return True
+
+    def _log(self, msg):
+        if self._logger:
+            self._logger.warning(msg)
+
+    def stats(self):
+        with self._lock:
+            age = time.time() - self._fetched_at if self._value is not None else None
+            return {"value": self._value, "age_s": None if age is None else round(age, 1), "ttl": self.ttl, **self._stats}
@@ -0,0 +1,28 @@
+"""
+Cache de lecture : un stockage injoignable (load_data -> None) n'est jamais mis en cache.
+
+Lancer depuis api/ : python -m pytest -q
+"""
+import pytest
+
+from cache import ReadCache
+from unit_of_work import StorageUnavailable
+
+
+def test_unavailable_storage_raises_and_is_not_cached():
+    answers = [None, {"products": [{"id": 1}]}]
+    cache = ReadCache(lambda *c: answers.pop(0), lambda c: {k: 7 for k in c})
+    with pytest.raises(StorageUnavailable):
+        cache.get("products")
+    assert cache.stats()["cached"] == []
+    assert cache.get("products")["products"] == [{"id": 1}]
+    assert cache.stats()["cached"] == ["products"]
+
+
+@pytest.mark.parametrize("path", ["/api/products", "/api/statuses", "/api/momo"])
+def test_catalog_route_answers_503_without_cache_headers(api, path, monkeypatch):
+    api._read_cache.invalidate()
+    monkeypatch.setattr(api._read_cache, "_loader", lambda *c: None)
+    r = api.app.test_client().get(path)
+    assert r.status_code == 503
+    assert "ETag" not in r.headers and "Cache-Control" not in r.headers
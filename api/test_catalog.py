@@ -0,0 +1,28 @@
+"""
+Corps JSON du catalogue : compacts (ni ", " ni ": ") et accents en UTF-8.
+
+Lancer depuis api/ : python -m pytest -q
+"""
+import json
+
+import pytest
+
+
+@pytest.fixture(scope="module")
+def client(api):
+    return api.app.test_client()
+
+
+@pytest.mark.parametrize("path", ["/api/products", "/api/products/1", "/api/statuses", "/api/momo"])
+def test_catalog_body_is_compact(client, path):
+    r = client.get(path, headers={"Accept-Encoding": "identity"})
+    assert r.status_code == 200
+    body = r.get_data(as_text=True)
+    assert '", "' not in body and '": ' not in body
+    assert body == json.dumps(json.loads(body), ensure_ascii=False, separators=(",", ":"))
+    assert "\\u00" not in body
+
+
+def test_catalog_body_is_stable_across_requests(client):
+    first = client.get("/api/products").get_data()
+    assert client.get("/api/products").get_data() == first
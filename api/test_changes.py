@@ -0,0 +1,74 @@
+"""
+Patchs de collections (changes.py) : appliqués à l'état chargé, ils redonnent l'état sauvegardé.
+
+Lancer depuis api/ : python -m pytest -q
+"""
+import copy
+
+import pytest
+
+from changes import collection_fingerprints, dict_patch, list_patch, row_key, KEY_FIELDS
+
+ORDERS = [{"id": f"ORD-{n}", "status": "pending"} for n in (3, 2, 1)]
+
+
+def _apply(coll, previous_docs, patch):
+    """Applique (prepend, append, updates, removed) comme le font db.py et filestore.py."""
+    prepend, append, updates, removed = patch
+    key_field = KEY_FIELDS.get(coll)
+    docs = [d for d in previous_docs if row_key(d, key_field) not in removed] if key_field else list(previous_docs)
+    docs = [updates.get(row_key(d, key_field), d) for d in docs] if key_field else docs
+    return prepend + docs + append
+
+
+def _round_trip(coll, before, after):
+    patch = list_patch(coll, after, collection_fingerprints(coll, before))
+    assert patch is not None
+    assert _apply(coll, before, patch) == after
+    return patch
+
+
+def test_insert_at_front_and_end():
+    after = [{"id": "ORD-4"}] + copy.deepcopy(ORDERS)
+    assert _round_trip("orders", ORDERS, after)[0] == [{"id": "ORD-4"}]
+    after = copy.deepcopy(ORDERS) + [{"id": "ORD-0"}]
+    assert _round_trip("orders", ORDERS, after)[1] == [{"id": "ORD-0"}]
+
+
+def test_update_and_delete():
+    after = copy.deepcopy(ORDERS)
+    after[1]["status"] = "confirmed"
+    del after[2]
+    prepend, append, updates, removed = _round_trip("orders", ORDERS, after)
+    assert (prepend, append) == ([], [])
+    assert updates == {"ORD-2": after[1]}
+    assert removed == ["ORD-1"]
+
+
+def test_insert_into_empty_list():
+    _round_trip("orders", [], copy.deepcopy(ORDERS))
+
+
+@pytest.mark.parametrize("after", [
+    [ORDERS[1], ORDERS[0], ORDERS[2]],  # réordonnancement
+    [ORDERS[0], {"id": "ORD-9"}, ORDERS[1], ORDERS[2]],  # insertion au milieu
+    ORDERS + [ORDERS[0]],  # doublon
+    ORDERS + [{"status": "sans clé"}],
+    [{"id": "ORD-9"}],  # tout remplacé
+])
+def test_unexpressible_changes_need_full_rewrite(after):
+    assert list_patch("orders", copy.deepcopy(after), collection_fingerprints("orders", ORDERS)) is None
+
+
+def test_keyless_list_only_appends():
+    before = [{"t": 1}, {"t": 2}]
+    assert _round_trip("notes", before, before + [{"t": 3}]) == ([], [{"t": 3}], {}, [])
+    assert list_patch("notes", [{"t": 1}, {"t": 9}], collection_fingerprints("notes", before)) is None
+
+
+def test_dict_patch():
+    before = {"pending": {"label": "En attente"}, "shipped": {"label": "Expédiée"}}
+    after = {"pending": {"label": "À payer"}, "delivered": {"label": "Livrée"}}
+    changed, removed = dict_patch(after, collection_fingerprints("statuses", before))
+    assert changed == after
+    assert removed == ["shipped"]
@@ -0,0 +1,67 @@
+"""
+Chat support : le fil est celui de l'initData Telegram validée, et les long-polls sont bornés par client.
+
+Lancer depuis api/ : python -m pytest -q
+"""
+import hashlib
+import hmac
+import json
+import time
+import urllib.parse
+
+import pytest
+
+TOKEN = "123:test"
+
+
+def _init_data(user_id, token=TOKEN):
+    fields = {"auth_date": str(int(time.time())), "user": json.dumps({"id": user_id, "first_name": "T"})}
+    check = "\n".join(f"{k}={v}" for k, v in sorted(fields.items()))
+    secret = hmac.new(b"WebAppData", token.encode(), hashlib.sha256).digest()
+    fields["hash"] = hmac.new(secret, check.encode(), hashlib.sha256).hexdigest()
+    return urllib.parse.urlencode(fields)
+
+
+@pytest.fixture
+def client(api, monkeypatch):
+    monkeypatch.setattr(api, "TELEGRAM_BOT_TOKEN", TOKEN)
+    monkeypatch.setattr(api, "ADMIN_TELEGRAM_IDS", [])
+    return api.app.test_client()
+
+
+def _as(user_id):
+    return {"X-Telegram-Init-Data": _init_data(user_id)}
+
+
+def test_thread_comes_from_init_data(client):
+    r = client.post("/api/chat", json={"text": "salut"}, headers=_as(4201))
+    assert r.status_code == 200
+    assert r.get_json()[0]["telegram_user_id"] == "4201"
+    texts = [m["text"] for m in client.get("/api/chat", headers=_as(4201)).get_json()]
+    assert "salut" in texts
+    assert "salut" not in [m["text"] for m in client.get("/api/chat", headers=_as(4202)).get_json()]
+
+
+def test_other_threads_are_refused(client):
+    assert client.get("/api/chat?telegram_user_id=4201").status_code == 401
+    assert client.get("/api/chat?telegram_user_id=4201", headers=_as(4202)).status_code == 403
+    assert client.post("/api/chat", json={"text": "x", "telegram_user_id": 4201}).status_code == 401
+    bad = {"X-Telegram-Init-Data": _init_data(4201, token="999:autre")}
+    assert client.get("/api/chat", headers=bad).status_code == 401
+
+
+def test_reply_requires_admin_key(api, client, monkeypatch):
+    monkeypatch.setattr(api, "ADMIN_API_KEY", "secret")
+    body = {"text": "bonjour", "telegram_user_id": "4201"}
+    assert client.post("/api/chat/reply", json=body).status_code == 401
+    assert client.post("/api/chat/reply", json=body, headers={"X-Admin-Key": "secret"}).status_code == 200
+
+
+def test_long_polls_are_capped_per_client(api, client):
+    with api._chat_hub.slot("4203", api.CHAT_WAIT_PER_CLIENT) as first:
+        with api._chat_hub.slot("4203", api.CHAT_WAIT_PER_CLIENT) as second:
+            assert first and second
+            r = client.get("/api/chat?since=999999&wait=5", headers=_as(4203))
+            assert r.status_code == 429 and r.headers.get("Retry-After")
+    r = client.get("/api/chat?since=999999&wait=0.1", headers=_as(4203))
+    assert r.status_code == 200 and r.get_json() == []
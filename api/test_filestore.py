@@ -0,0 +1,82 @@
+"""
+Stockage fichier journalisé : compaction et relecture du journal.
+
+Lancer depuis api/ : python -m pytest -q
+"""
+import json
+import threading
+
+import pytest
+
+from filestore import FileStore
+
+
+@pytest.fixture
+def path(tmp_path):
+    p = tmp_path / "data.json"
+    p.write_text(json.dumps({"orders": [{"id": "ORD-1"}], "statuses": {"pending": {"label": "En attente"}}}))
+    return str(p)
+
+
+def _store(path):
+    return FileStore(path, compact_bytes=0, compact_interval=3600, fsync=False)
+
+
+def _add_order(store, order_id):
+    data = store.load_data("orders")
+    data["orders"].insert(0, {"id": order_id})
+    store.save_data(data)
+
+
+def test_compaction_serializes_outside_the_lock(path, monkeypatch):
+    store = _store(path)
+    _add_order(store, "ORD-2")
+    started, release = threading.Event(), threading.Event()
+    serialize = FileStore._serialize
+
+    def slow_serialize(parts, seq):
+        started.set()
+        assert release.wait(5)
+        return serialize(parts, seq)
+
+    monkeypatch.setattr(FileStore, "_serialize", staticmethod(slow_serialize))
+    compaction = threading.Thread(target=store.compact)
+    compaction.start()
+    assert started.wait(5)
+    _add_order(store, "ORD-3")  # ne doit pas attendre la fin de la sérialisation
+    release.set()
+    compaction.join(5)
+    monkeypatch.setattr(FileStore, "_serialize", staticmethod(serialize))
+
+    with open(path, encoding="utf-8") as f:
+        assert [o["id"] for o in json.load(f)["orders"]] == ["ORD-2", "ORD-1"]
+    assert [o["id"] for o in _store(path).load_data("orders")["orders"]] == ["ORD-3", "ORD-2", "ORD-1"]
+
+
+def test_replay_ignores_a_truncated_last_line(path):
+    store = _store(path)
+    _add_order(store, "ORD-2")
+    _add_order(store, "ORD-3")
+    with open(store.journal_path, "ab") as f:
+        f.write(b'{"n":99,"ops":[{"c":"orders","op":"prepend","v":[{"id":"ORD-')  # arrêt brutal
+    store = _store(path)
+    assert [o["id"] for o in store.load_data("orders")["orders"]] == ["ORD-3", "ORD-2", "ORD-1"]
+    with open(store.journal_path, "rb") as f:
+        assert f.read().endswith(b"\n")  # fin tronquée retirée
+    _add_order(store, "ORD-4")
+    assert [o["id"] for o in _store(path).load_data("orders")["orders"]] == ["ORD-4", "ORD-3", "ORD-2", "ORD-1"]
+
+
+def test_replay_after_compaction_skips_included_lines(path):
+    store = _store(path)
+    _add_order(store, "ORD-2")
+    assert store.compact()
+    _add_order(store, "ORD-3")
+    assert [o["id"] for o in _store(path).load_data("orders")["orders"]] == ["ORD-3", "ORD-2", "ORD-1"]
+
+
+def test_sequence_is_journaled_and_seeded_once(path):
+    store = _store(path)
+    assert store.next_sequence_value("orders", lambda: 1041) == 1042
+    assert store.next_sequence_value("orders", lambda: pytest.fail("déjà recalée")) == 1043
+    assert _store(path).next_sequence_value("orders", lambda: 0) == 1044
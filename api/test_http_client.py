@@ -0,0 +1,83 @@
+"""
+Client HTTP sortant : un POST n'est jamais rejoué après une coupure, une connexion fermée au repos est écartée.
+
+Lancer depuis api/ : python -m pytest -q
+"""
+import http.client
+import socket
+import threading
+import time
+
+import pytest
+
+from http_client import HttpClient
+
+OK = b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok"
+# Réponse complète puis fermeture de la connexion, sans en-tête Connection: close.
+OK_THEN_CLOSE = b"HTTP/1.1 200 OK\r\nContent-Length: 8\r\n\r\nok#close"
+
+
+class Server:
+    """Serveur TCP minimal : handle(conn_index, request_index) -> réponse, ou None pour couper sans répondre."""
+
+    def __init__(self, handle):
+        self.handle = handle
+        self.requests = []
+        self._sock = socket.socket()
+        self._sock.bind(("127.0.0.1", 0))
+        self._sock.listen()
+        self.url = f"http://127.0.0.1:{self._sock.getsockname()[1]}/x"
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        n_conn = 0
+        while True:
+            conn, _addr = self._sock.accept()
+            threading.Thread(target=self._client, args=(conn, n_conn), daemon=True).start()
+            n_conn += 1
+
+    def _client(self, conn, n_conn):
+        with conn:
+            n_req = 0
+            while True:
+                data = b""
+                while b"\r\n\r\n" not in data:
+                    chunk = conn.recv(4096)
+                    if not chunk:
+                        return
+                    data += chunk
+                self.requests.append(data.split(b" ", 1)[0].decode())
+                answer = self.handle(n_conn, n_req)
+                n_req += 1
+                if answer is None:
+                    return
+                conn.sendall(answer)
+                if answer.endswith(b"#close"):
+                    return
+
+
+def test_post_is_not_replayed_when_a_reused_connection_drops():
+    # 2e requête sur la première connexion : reçue, puis coupure sans réponse.
+    server = Server(lambda c, r: OK if (c, r) != (0, 1) else None)
+    client = HttpClient(retries=2)
+    client.request("GET", server.url)
+    with pytest.raises(http.client.RemoteDisconnected):
+        client.request("POST", server.url, body=b"{}")
+    assert server.requests == ["GET", "POST"]
+
+
+def test_get_is_replayed_when_a_reused_connection_drops():
+    server = Server(lambda c, r: OK if (c, r) != (0, 1) else None)
+    client = HttpClient(retries=0)
+    client.request("GET", server.url)
+    assert client.request("GET", server.url).body == b"ok"
+    assert server.requests == ["GET", "GET", "GET"]
+
+
+def test_idle_connection_closed_by_server_is_not_used():
+    server = Server(lambda c, r: OK_THEN_CLOSE if c == 0 else OK)
+    client = HttpClient(retries=0)
+    client.request("GET", server.url)
+    time.sleep(0.1)
+    assert client.request("POST", server.url, body=b"{}").body == b"ok"
+    assert server.requests == ["GET", "POST"]
@@ -0,0 +1,56 @@
+"""
+Unité de travail : lecture par lignes (rows) et sauvegarde des seules lignes touchées.
+
+Lancer depuis api/ : python -m pytest -q
+"""
+import pytest
+
+from changes import Snapshot, fingerprint
+from unit_of_work import StorageUnavailable, UnitOfWork
+
+CLIENTS = [{"id": f"CLI-{n}", "telegram_user_id": n} for n in range(1, 6)]
+
+
+def _row_loader(calls):
+    def load(collection, field, values):
+        calls.append((collection, field, list(values)))
+        docs = [dict(c) for c in CLIENTS if str(c[field]) in values]
+        data = Snapshot({collection: docs})
+        data.fingerprints = {collection: {d["id"]: fingerprint(d) for d in docs}}
+        return data
+    return load
+
+
+def test_rows_reads_only_requested_keys_and_saves_them():
+    calls, saved = [], []
+    work = UnitOfWork(lambda *c: pytest.fail("chargement complet"), saved.append, _row_loader(calls))
+    index = work.index("clients", "telegram_user_id", [3])
+    index.get(3)["name"] = "Bob"
+    work.rows("clients").append({"id": "CLI-6", "telegram_user_id": 6})
+    assert work.index("clients", "telegram_user_id", ["3", 3.0]).get(3)["name"] == "Bob"
+    work.mark_dirty("clients")
+    assert work.commit()
+    assert calls == [("clients", "telegram_user_id", ["3"])]
+    payload = saved[0]
+    assert [d["id"] for d in payload["clients"]] == ["CLI-3", "CLI-6"]
+    assert list(payload.fingerprints["clients"]) == ["CLI-3"]
+
+
+def test_rows_keeps_request_changes_and_refuses_full_load():
+    work = UnitOfWork(lambda *c: {"clients": list(CLIENTS)}, lambda d: True, _row_loader([]))
+    work.index("clients", "id", ["CLI-2"]).get("CLI-2")["name"] = "Al"
+    work.rows("clients", "telegram_user_id", [2])
+    assert [d.get("name") for d in work.rows("clients")] == ["Al"]
+    with pytest.raises(RuntimeError):
+        work.load("clients")
+
+
+def test_rows_without_row_loader_loads_whole_collection():
+    work = UnitOfWork(lambda *c: {"clients": list(CLIENTS)}, lambda d: True)
+    assert len(work.rows("clients", "telegram_user_id", [1])) == len(CLIENTS)
+
+
+def test_rows_unavailable_storage():
+    work = UnitOfWork(lambda *c: None, lambda d: True, lambda *a: None)
+    with pytest.raises(StorageUnavailable):
+        work.rows("clients", "id", ["CLI-1"])
@@ -0,0 +1,142 @@
+"""
+Unité de travail par requête pour l'API StickerStreet.
+
+Une requête qui modifie les données les charge une seule fois (à la première
+demande de chaque collection), signale les collections modifiées, puis tout est
+enregistré en un seul save_data() en fin de requête — ou abandonné en cas
+d'erreur. Une écriture coûte ainsi un aller-retour de stockage au plus.
+
+Quand le stockage sait lire des lignes par clé (Neon "tables"), rows() ne charge
+que les documents que la requête touche : la liste de la requête est alors
+partielle, et la sauvegarde n'écrit que ces documents et ceux ajoutés.
+"""
+from changes import KEY_FIELDS, Snapshot, row_key
+from indexes import KeyIndex, normalize_id
+
+
+class StorageUnavailable(Exception):
+    """Le stockage n'a rien renvoyé (Neon injoignable)."""
+
+
+class UnitOfWork:
+    """loader(*collections) -> dict, saver(data) -> bool : load_data / save_data.
+
+    row_loader(collection, field, values) -> Snapshot : lecture des seules lignes
+    demandées (db.load_rows) ; None si le stockage charge toujours la collection entière.
+    """
+
+    def __init__(self, loader, saver, row_loader=None):
+        self._loader = loader
+        self._saver = saver
+        self._row_loader = row_loader
+        self._partial = {}  # collection chargée par lignes -> {(champ, valeur)} déjà lus
+        self._data = Snapshot()
+        self._data.fingerprints = {}
+        self._loaded = set()
+        self._dirty = set()
+        self._indexes = {}  # (collection, champ) -> (liste indexée, KeyIndex)
+        self.loads = 0
+        self.saves = 0
+
+    def load(self, *collections):
+        """Données partagées de la requête ; ne lit que les collections pas encore chargées."""
+        missing = [c for c in collections if c not in self._loaded]
+        partial = [c for c in missing if c in self._partial]
+        if partial:
+            # La liste partielle a pu être modifiée : la compléter risquerait d'écraser ces changements.
+            raise RuntimeError(f"{', '.join(partial)} : déjà lue par lignes (rows) dans cette requête")
+        if missing:
+            loaded = self._loader(*missing)
+            if loaded is None:
+                raise StorageUnavailable("stockage indisponible")
+            self.loads += 1
+            for coll, value in loaded.items():
+                if coll in self._loaded:
+                    continue  # déjà chargée (et peut-être modifiée) dans cette requête
+                self._data[coll] = value
+                self._loaded.add(coll)
+                fps = (getattr(loaded, "fingerprints", None) or {}).get(coll)
+                if fps is not None:
+                    self._data.fingerprints[coll] = fps
+            self._loaded.update(missing)
+        return self._data
+
+    def rows(self, collection, field=None, values=()):
+        """Liste de la requête pour collection, contenant au moins les documents dont field vaut
+        l'une des values (aucun si field est None : de quoi ajouter des documents).
+
+        Sans row_loader, ou si la collection est déjà chargée en entier, c'est la liste complète.
+        """
+        if collection in self._loaded or self._row_loader is None:
+            return self.load(collection)[collection]
+        fetched = self._partial.setdefault(collection, set())
+        docs = self._data.setdefault(collection, [])
+        fps = self._data.fingerprints.setdefault(collection, {})
+        wanted = []
+        if field is not None:
+            for value in values:
+                key = normalize_id(value)
+                if key is not None and (field, key) not in fetched and key not in wanted:
+                    wanted.append(key)
+        if wanted:
+            loaded = self._row_loader(collection, field, wanted)
+            if loaded is None:
+                raise StorageUnavailable("stockage indisponible")
+            self.loads += 1
+            key_field = KEY_FIELDS[collection]
+            added = []
+            for doc in loaded.get(collection) or []:
+                k = row_key(doc, key_field)
+                if k not in fps:  # déjà lu par un autre champ : garder l'objet de la requête
+                    fps[k] = loaded.fingerprints[collection][k]
+                    docs.append(doc)
+                    added.append(doc)
+            fetched.update((field, key) for key in wanted)
+            for (coll, _field), (indexed, index) in self._indexes.items():
+                if coll == collection and indexed is docs:
+                    for doc in added:
+                        index.add(doc)
+        return docs
+
+    def index(self, collection, field, keys=None):
+        """Index {champ: documents} d'une collection chargée, reconstruit si la liste a été remplacée.
+
+        keys : valeurs cherchées ; seules ces lignes sont lues si le stockage le permet (rows()).
+        """
+        docs = self.load(collection)[collection] if keys is None else self.rows(collection, field, keys)
+        entry = self._indexes.get((collection, field))
+        if entry is None or entry[0] is not docs:
+            entry = self._indexes[(collection, field)] = (docs, KeyIndex(docs, field))
+        return entry[1]
+
+    def mark_dirty(self, *collections):
+        """Signale les collections à enregistrer en fin de requête."""
+        self._dirty.update(collections)
+
+    @property
+    def dirty(self):
+        return bool(self._dirty)
+
+    def commit(self):
+        """Enregistre les collections modifiées en un seul appel ; True si rien à faire."""
+        if not self._dirty:
+            return True
+        dirty = sorted(self._dirty)
+        if all(c in self._data.fingerprints for c in dirty):
+            payload = Snapshot((c, self._data[c]) for c in dirty if c in self._data)
+            payload.fingerprints = {c: self._data.fingerprints[c] for c in payload}
+        else:
+            # Stockage sans empreintes (Neon "kv") : il réécrit tout le document chargé.
+            payload = self._data
+        ok = self._saver(payload) is not False
+        self.saves += 1
+        if ok:
+            self._dirty.clear()
+            if payload is not self._data and payload.fingerprints:
+                # La sauvegarde met à jour les empreintes : un second commit repart de l'état écrit.
+                self._data.fingerprints.update(payload.fingerprints)
+        return ok
+
+    def rollback(self):
+        """Oublie les modifications non enregistrées."""
+        self._dirty.clear()
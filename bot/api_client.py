@@ -0,0 +1,65 @@
+"""
+Client HTTP asynchrone du bot vers l'API StickerStreet.
+
+Un seul httpx.AsyncClient (connexions keep-alive partagées) pour tous les
+handlers : un appel lent n'attend que son propre handler, pas toute la boucle
+d'événements. Délai par appel (timeout=), et les appels indépendants se lancent
+ensemble avec asyncio.gather().
+"""
+import logging
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class ApiClient:
+    def __init__(self, base_url, admin_key="", timeout=5.0, max_connections=20):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = float(timeout)
+        self._headers = {"X-Admin-Key": admin_key} if admin_key else {}
+        self._limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self._client = None
+
+    def _http(self):
+        # Créé au premier appel, dans la boucle d'événements de l'application.
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url, headers=self._headers, timeout=self.timeout, limits=self._limits,
+            )
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def request(self, method, path, json=None, headers=None, timeout=None):
+        """Réponse httpx (tout statut), ou None si l'API est injoignable ou trop lente."""
+        try:
+            return await self._http().request(
+                method, path, json=json, headers=headers,
+                timeout=self.timeout if timeout is None else timeout,
+            )
+        except httpx.HTTPError as e:
+            logger.error(f"API {method} {path} error: {e!r}")
+            return None
+
+    async def _json(self, method, path, json=None, timeout=None):
+        r = await self.request(method, path, json=json, timeout=timeout)
+        if r is None or not r.is_success:
+            return None
+        try:
+            return r.json()
+        except ValueError:
+            logger.error(f"API {method} {path}: réponse non JSON")
+            return None
+
+    async def get(self, path, timeout=None):
+        return await self._json("GET", path, timeout=timeout)
+
+    async def post(self, path, data, timeout=None):
+        return await self._json("POST", path, json=data, timeout=timeout)
+
+    async def patch(self, path, data, timeout=None):
+        return await self._json("PATCH", path, json=data, timeout=timeout)
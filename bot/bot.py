@@ -2,10 +2,12 @@
 Bot Telegram StickerStreet - Relié à l'API et à la webapp
 Commande : python bot.py
 """
+import asyncio
+import hashlib
 import json
 import logging
 import os
-import requests
+import re
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -21,6 +23,11 @@ from telegram.ext import (
     filters,
 )
 
+from api_client import ApiClient
+from catalog import CatalogCache
+from persistence import SQLitePersistence
+from updates import PerChatUpdateProcessor
+
 # Configuration
 BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "")
 API_URL = os.getenv("STICKERSTREET_API", "http://localhost:5000")
@@ -30,6 +37,30 @@ _admin_ids = os.getenv("ADMIN_TELEGRAM_ID", "")
 ADMIN_TELEGRAM_IDS = [str(x).strip() for x in _admin_ids.split(",") if x.strip()]
 ADMIN_API_KEY = os.getenv("ADMIN_API_KEY", "").strip()
 _admin_user_ids = [int(x) for x in ADMIN_TELEGRAM_IDS if x.isdigit()]
+# Mode webhook si WEBHOOK_URL est défini (URL publique du bot, sans le chemin), sinon polling
+WEBHOOK_URL = (os.getenv("WEBHOOK_URL", "") or "").strip().rstrip("/")
+WEBHOOK_PATH = (os.getenv("WEBHOOK_PATH", "telegram") or "telegram").strip("/")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "") or os.getenv("PORT", "") or "8443")
+# Jeton vérifié sur chaque appel de Telegram (A-Z a-z 0-9 _ -) ; par défaut dérivé du token du bot
+WEBHOOK_SECRET = (os.getenv("WEBHOOK_SECRET", "") or "").strip() or hashlib.sha256(f"webhook:{BOT_TOKEN}".encode()).hexdigest()
+# Mises à jour traitées en parallèle (une seule à la fois par discussion) ; 1 = une par une
+BOT_CONCURRENT_UPDATES = int(os.getenv("BOT_CONCURRENT_UPDATES", "32") or "32")
+# API Bot de Telegram (serveur Bot API local, test de charge) ; le token est ajouté à la fin
+TELEGRAM_API_BASE_URL = (os.getenv("TELEGRAM_API_BASE_URL", "") or "").strip()
+# Paniers et inscriptions en cours conservés entre deux redémarrages (SQLite), écrits toutes les N s
+BOT_PERSISTENCE_FILE = (os.getenv("BOT_PERSISTENCE_FILE", "") or "").strip() or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "bot_state.sqlite3"
+)
+BOT_PERSISTENCE_INTERVAL = float(os.getenv("BOT_PERSISTENCE_INTERVAL", "5") or "5")
+# Appels à l'API : délai par appel (s) et connexions simultanées du pool
+API_TIMEOUT = float(os.getenv("API_TIMEOUT", "5") or "5")
+API_MAX_CONNECTIONS = int(os.getenv("API_MAX_CONNECTIONS", "20") or "20")
+# Secondes entre deux rafraîchissements du catalogue et des statuts en mémoire (JobQueue)
+CATALOG_REFRESH_INTERVAL = float(os.getenv("CATALOG_REFRESH_INTERVAL", "60") or "60")
+# Copie locale du catalogue et des statuts (secours si l'API est injoignable)
+CATALOG_SNAPSHOT_FILE = (os.getenv("CATALOG_SNAPSHOT_FILE", "") or "").strip() or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "catalog_snapshot.json"
+)
 
 logging.basicConfig(
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
@@ -39,38 +70,24 @@ logger = logging.getLogger(__name__)
 
 
 # ==================== API ====================
-def api_get(path):
-    try:
-        headers = {"X-Admin-Key": ADMIN_API_KEY} if ADMIN_API_KEY else None
-        r = requests.get(f"{API_URL}{path}", headers=headers, timeout=5)
-        return r.json() if r.ok else None
-    except Exception as e:
-        logger.error(f"API GET error: {e}")
-        return None
+_api = ApiClient(API_URL, ADMIN_API_KEY, timeout=API_TIMEOUT, max_connections=API_MAX_CONNECTIONS)
+_catalog = CatalogCache(_api, CATALOG_SNAPSHOT_FILE)
 
 
-def api_post(path, data):
-    try:
-        headers = {"X-Admin-Key": ADMIN_API_KEY} if ADMIN_API_KEY else None
-        r = requests.post(f"{API_URL}{path}", json=data, headers=headers, timeout=5)
-        return r.json() if r.ok else None
-    except Exception as e:
-        logger.error(f"API POST error: {e}")
-        return None
+async def api_get(path, timeout=None):
+    return await _api.get(path, timeout=timeout)
 
 
-def api_patch(path, data):
-    try:
-        headers = {"X-Admin-Key": ADMIN_API_KEY} if ADMIN_API_KEY else None
-        r = requests.patch(f"{API_URL}{path}", json=data, headers=headers, timeout=5)
-        return r.json() if r.ok else None
-    except Exception as e:
-        logger.error(f"API PATCH error: {e}")
-        return None
+async def api_post(path, data, timeout=None):
+    return await _api.post(path, data, timeout=timeout)
+
+
+async def api_patch(path, data, timeout=None):
+    return await _api.patch(path, data, timeout=timeout)
 
 
 def _load_local_data():
-    """Charge les données depuis data.json local si l'API est indisponible."""
+    """Ancien secours : data.json de l'API, lu une seule fois si le bot n'a pas encore de catalogue local."""
     base = os.path.dirname(os.path.abspath(__file__))
     for p in [
         os.path.join(base, "..", "api", "data.json"),
@@ -85,22 +102,44 @@ def _load_local_data():
     return None
 
 
-def get_products():
-    """Récupère les produits via l'API, ou en fallback depuis data.json local."""
-    products = api_get("/api/products")
-    if products:
-        return products
-    data = _load_local_data()
-    return data.get("products") if data else None
+_fallback_seeded = False
+
+
+async def _load_fallback(name):
+    """API injoignable : catalogue local (relu seulement si le fichier a changé), sinon data.json une fois."""
+    global _fallback_seeded
+    _catalog.load_snapshot()
+    if _catalog.get(name) is None and not _fallback_seeded:
+        _fallback_seeded = True
+        data = await asyncio.to_thread(_load_local_data)
+        if data:
+            _catalog.seed({"products": data.get("products"), "statuses": data.get("statuses")})
+    return _catalog.get(name)
+
+
+async def get_products():
+    """Produits en mémoire (voir refresh_catalog), chargés à la demande s'ils manquent ; en secours le catalogue local."""
+    if _catalog.products() is None:
+        await _catalog.refresh(["products"])
+    return _catalog.products() or await _load_fallback("products")
+
+
+async def get_product(pid):
+    """Produit par id : dictionnaire id → produit du cache, sans parcourir la liste."""
+    products = await get_products()
+    return _catalog.product(pid) if products else None
+
 
+async def get_statuses():
+    """Statuts en mémoire, chargés à la demande s'ils manquent ; en secours le catalogue local."""
+    if _catalog.statuses() is None:
+        await _catalog.refresh(["statuses"])
+    return _catalog.statuses() or await _load_fallback("statuses") or {}
 
-def get_statuses():
-    """Récupère les statuts via l'API ou en fallback."""
-    st = api_get("/api/statuses")
-    if st:
-        return st
-    data = _load_local_data()
-    return data.get("statuses", {}) if data else {}
+
+async def refresh_catalog(context: ContextTypes.DEFAULT_TYPE):
+    """Tâche JobQueue : relit produits et statuts s'ils ont changé (ETag)."""
+    await _catalog.refresh()
 
 
 def xof_fmt(v):
@@ -129,7 +168,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 async def catalog(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    products = get_products()
+    products = await get_products()
     if not products:
         await update.message.reply_text("⚠️ Catalogue indisponible. Réessaie plus tard.")
         return
@@ -166,8 +205,7 @@ async def catalog(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 async def product_detail(update: Update, context: ContextTypes.DEFAULT_TYPE, pid: int):
-    products = get_products()
-    p = next((x for x in (products or []) if x["id"] == pid), None)
+    p = await get_product(pid)
     if not p:
         await update.callback_query.answer("Produit introuvable")
         return
@@ -200,8 +238,7 @@ async def add_to_cart_callback(update: Update, context: ContextTypes.DEFAULT_TYP
         await q.answer("Erreur")
         return
     sz = parts[2] if len(parts) > 2 else ""
-    products = get_products()
-    p = next((x for x in (products or []) if x["id"] == pid), None)
+    p = await get_product(pid)
     if not p:
         await q.answer("Produit introuvable")
         return
@@ -270,13 +307,17 @@ async def order_confirm_callback(update: Update, context: ContextTypes.DEFAULT_T
         }
         for i in cart
     ]
-    order = api_post("/api/orders", {
-        "items": items,
-        "telegram_user_id": update.effective_user.id,
-    })
+    # Numéros MoMo demandés pendant la création de la commande.
+    order, momo = await asyncio.gather(
+        api_post("/api/orders", {
+            "items": items,
+            "telegram_user_id": update.effective_user.id,
+        }),
+        api_get("/api/momo"),
+    )
     if order:
         context.user_data["cart"] = []
-        momo = api_get("/api/momo") or []
+        momo = momo or []
         momo_lines = "\n".join(f"• {op['name']} : {op.get('num', '—')}" for op in momo) if momo else "• Wave : 0709393959\n• Djamo : lien dans l'app"
         await q.edit_message_text(
             f"🎉 *Commande validée !*\n\n"
@@ -298,12 +339,16 @@ async def order_cancel_callback(update: Update, context: ContextTypes.DEFAULT_TY
 
 
 async def my_orders(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    orders = api_get(f"/api/orders?telegram_user_id={update.effective_user.id}")
+    # Une seule page : les commandes les plus récentes.
+    orders, statuses = await asyncio.gather(
+        api_get(f"/api/orders?telegram_user_id={update.effective_user.id}&limit=10"),
+        get_statuses(),
+    )
     if not orders:
         await update.message.reply_text("Tu n'as pas encore de commandes.")
         return
 
-    statuses = get_statuses() or {}
+    statuses = statuses or {}
     text = "📋 *Tes commandes*\n\n"
     for o in orders:
         st = statuses.get(o.get("status", "pending"), {})
@@ -355,7 +400,7 @@ async def register_address(update: Update, context: ContextTypes.DEFAULT_TYPE):
     address = (update.message.text or "").strip()
     context.user_data["register"]["address"] = address
     reg = context.user_data["register"]
-    client = api_post("/api/register", {
+    client = await api_post("/api/register", {
         "telegram_user_id": update.effective_user.id,
         "name": reg["name"],
         "phone": reg.get("phone", ""),
@@ -409,14 +454,12 @@ async def successful_payment(update: Update, context: ContextTypes.DEFAULT_TYPE)
     if not payload:
         await update.message.reply_text("❌ Paiement reçu mais payload manquant. Contacte le support.")
         return
-    order = api_post("/api/orders/from-invoice", {
+    order = await api_post("/api/orders/from-invoice", {
         "invoice_id": payload,
         "invoice_payload": payload,
         "telegram_user_id": update.effective_user.id,
     })
     if order:
-        momo = api_get("/api/momo") or []
-        momo_lines = "\n".join(f"• {op['name']} : {op.get('num', '—')}" for op in momo) if momo else "• Wave : 0709393959\n• Djamo : lien dans l'app"
         await update.message.reply_text(
             f"🎉 *Paiement Stars reçu !*\n\n"
             f"Commande *{order['id']}* créée.\n"
@@ -428,6 +471,31 @@ async def successful_payment(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await update.message.reply_text("❌ Erreur lors de la création de la commande. Réessaie ou contacte le support.")
 
 
+_CHAT_THREAD_PREFIX = "chat_thread_"
+# En-tête écrit par l'API (post_chat) ; .text ne contient plus les balises HTML.
+_CHAT_NOTIFICATION = re.compile(r"📩 Client \(WebApp\) #(\d+|anonyme) :\n")
+
+
+def _quoted_chat_thread(message, bot_id):
+    """Fil ("<telegram_user_id>" ou "anonyme") de la notification chat citée par message, sinon None.
+
+    Le fil est lu dans le bouton « Répondre » de la notification ; l'en-tête n'est lu que pour les
+    notifications envoyées avant ce bouton. Seuls les messages envoyés par le bot sont acceptés.
+    """
+    quoted = message.reply_to_message
+    if quoted is None or quoted.from_user is None or quoted.from_user.id != bot_id:
+        return None
+    if quoted.reply_markup:
+        for row in quoted.reply_markup.inline_keyboard:
+            for button in row:
+                data = button.callback_data
+                if isinstance(data, str) and data.startswith(_CHAT_THREAD_PREFIX):
+                    thread = data[len(_CHAT_THREAD_PREFIX):]
+                    return thread if thread == "anonyme" or thread.isdigit() else None
+    m = _CHAT_NOTIFICATION.match(quoted.text or "")
+    return m.group(1) if m else None
+
+
 async def admin_chat_reply(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Quand l'admin envoie un message (non-commande), l'ajoute au chat support webapp."""
     if not ADMIN_TELEGRAM_IDS or str(update.effective_user.id) not in ADMIN_TELEGRAM_IDS:
@@ -436,9 +504,15 @@ async def admin_chat_reply(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text = (update.message.text or "").strip()
     if not text:
         return
-    ok = api_post("/api/chat/reply", {"text": text})
+    thread = _quoted_chat_thread(update.message, context.bot.id)
+    if thread is None:
+        await update.message.reply_text(
+            "↩️ Réponse non envoyée : réponds en citant la notification « 📩 Client (WebApp) #… » du client."
+        )
+        return
+    ok = await api_post("/api/chat/reply", {"text": text, "telegram_user_id": None if thread == "anonyme" else thread})
     if ok is not None:
-        await update.message.reply_text("✅ Réponse envoyée au chat webapp.")
+        await update.message.reply_text(f"✅ Réponse envoyée au client #{thread}.")
     else:
         await update.message.reply_text("❌ Erreur envoi. Vérifie que l'API est accessible.")
 
@@ -459,6 +533,8 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await order_cancel_callback(update, context)
     elif data.startswith("add_"):
         await add_to_cart_callback(update, context)
+    elif data.startswith(_CHAT_THREAD_PREFIX):
+        await update.callback_query.answer("Cite ce message (Répondre) et écris ta réponse au client.", show_alert=True)
     elif data.startswith("prod_"):
         suf = data[5:]
         if suf == "list":
@@ -472,19 +548,32 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def post_init(app):
     """Configure le bouton Menu principal pour ouvrir la webapp (initData inclus)."""
+    _catalog.load_snapshot()  # réponses immédiates au démarrage, même si l'API est encore injoignable
     try:
         await app.bot.set_chat_menu_button(menu_button=MenuButtonWebApp(text="🛒 StickerStreet", web_app=WebAppInfo(url=WEBAPP_URL)))
     except Exception as e:
         logger.warning(f"Menu button non configuré: {e}")
 
 
+async def post_shutdown(app):
+    await _api.close()
+
+
 def main():
     if not BOT_TOKEN:
         print("❌ Configure TELEGRAM_BOT_TOKEN (variable d'environnement ou .env)")
         print("   Ex: TELEGRAM_BOT_TOKEN=123456:ABC-DEF python bot.py")
         return
 
-    app = Application.builder().token(BOT_TOKEN).post_init(post_init).build()
+    builder = (
+        Application.builder().token(BOT_TOKEN).post_init(post_init).post_shutdown(post_shutdown)
+        .persistence(SQLitePersistence(BOT_PERSISTENCE_FILE, update_interval=BOT_PERSISTENCE_INTERVAL))
+    )
+    if TELEGRAM_API_BASE_URL:
+        builder = builder.base_url(TELEGRAM_API_BASE_URL)
+    if BOT_CONCURRENT_UPDATES > 1:
+        builder = builder.concurrent_updates(PerChatUpdateProcessor(BOT_CONCURRENT_UPDATES))
+    app = builder.build()
     conv_register = ConversationHandler(
         entry_points=[CommandHandler("register", register_start)],
         states={
@@ -493,7 +582,13 @@ def main():
             REGISTER_ADDRESS: [MessageHandler(filters.TEXT & ~filters.COMMAND, register_address)],
         },
         fallbacks=[CommandHandler("cancel", register_cancel)],
+        name="register",
+        persistent=True,
     )
+    if app.job_queue is not None:
+        app.job_queue.run_repeating(refresh_catalog, interval=CATALOG_REFRESH_INTERVAL, first=0)
+    else:
+        logger.warning("JobQueue indisponible (pip install \"python-telegram-bot[job-queue]\") : catalogue relu à la demande")
     app.add_handler(PreCheckoutQueryHandler(pre_checkout))
     app.add_handler(MessageHandler(filters.SUCCESSFUL_PAYMENT, successful_payment))
     app.add_handler(conv_register)
@@ -510,6 +605,17 @@ def main():
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, _fallback_text))
     app.add_handler(CallbackQueryHandler(callback_handler))
 
+    if WEBHOOK_URL:
+        print(f"🤖 Bot StickerStreet en cours d'exécution (webhook {WEBHOOK_URL}/{WEBHOOK_PATH}, port {WEBHOOK_PORT})...")
+        app.run_webhook(
+            listen="0.0.0.0",
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=f"{WEBHOOK_URL}/{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=Update.ALL_TYPES,
+        )
+        return
     print("🤖 Bot StickerStreet en cours d'exécution...")
     app.run_polling(allowed_updates=Update.ALL_TYPES)
 
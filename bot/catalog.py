@@ -0,0 +1,136 @@
+"""
+Catalogue et statuts en mémoire dans le bot.
+
+Une tâche JobQueue appelle refresh() toutes les CATALOG_REFRESH_INTERVAL
+secondes : requête conditionnelle (If-None-Match avec l'ETag de l'API), un 304
+ne coûte ni corps ni décodage JSON. Les handlers (/catalog, prod_, add_,
+/orders) lisent la mémoire sans aller-retour vers l'API ; product(pid) passe
+par le dictionnaire id → produit au lieu de parcourir la liste.
+
+Chaque nouvelle version est aussi écrite dans un petit fichier JSON (snapshot_path :
+produits, statuts et ETags, rien d'autre). Si l'API est injoignable, ce fichier
+est relu, une seule fois tant que sa date de modification ne change pas.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# ressource -> chemin de l'API
+RESOURCES = {"products": "/api/products", "statuses": "/api/statuses"}
+
+
+class CatalogCache:
+    def __init__(self, api, snapshot_path=None):
+        self._api = api
+        self.snapshot_path = snapshot_path
+        self._snapshot_mtime = None
+        self._values = {}  # ressource -> valeur JSON
+        self._etags = {}
+        self._fetched_at = {}
+        self._by_id = {}
+        self.stats = {"refreshes": 0, "not_modified": 0, "failures": 0}
+
+    async def refresh(self, names=None):
+        """Relit les ressources qui ont changé ; garde l'ancienne valeur si l'API ne répond pas. True si tout est à jour."""
+        ok = True
+        changed = False
+        for name in names or RESOURCES:
+            etag = self._etags.get(name)
+            r = await self._api.request("GET", RESOURCES[name], headers={"If-None-Match": etag} if etag else None)
+            if r is not None and r.status_code == 304 and name in self._values:
+                self.stats["not_modified"] += 1
+                self._fetched_at[name] = time.time()
+                continue
+            try:
+                if r is None or not r.is_success:
+                    raise ValueError(f"statut {r.status_code if r is not None else 'injoignable'}")
+                value = r.json()
+                if value is None:
+                    # Corps null : rien à garder, l'ancienne valeur et le fichier local restent.
+                    raise ValueError("corps vide")
+            except ValueError as e:
+                self.stats["failures"] += 1
+                logger.warning(f"Rafraîchissement {name} échoué: {e}")
+                ok = False
+                continue
+            self.set(name, value, r.headers.get("ETag"))
+            self.stats["refreshes"] += 1
+            changed = True
+        if changed:
+            # Copies : le fichier est écrit hors de la boucle d'événements pendant que les handlers lisent.
+            await asyncio.to_thread(self.save_snapshot, dict(self._values), dict(self._etags))
+        return ok
+
+    def set(self, name, value, etag=None):
+        self._values[name] = value
+        self._etags[name] = etag
+        self._fetched_at[name] = time.time()
+        if name == "products":
+            self._by_id = {p.get("id"): p for p in value or [] if isinstance(p, dict)}
+
+    def save_snapshot(self, values=None, etags=None):
+        if not self.snapshot_path:
+            return
+        values = self._values if values is None else values
+        etags = self._etags if etags is None else etags
+        tmp = f"{self.snapshot_path}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"saved_at": time.time(), "values": values, "etags": etags},
+                          f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp, self.snapshot_path)
+            self._snapshot_mtime = os.stat(self.snapshot_path).st_mtime_ns
+        except OSError as e:
+            logger.warning(f"Écriture du catalogue local échouée ({self.snapshot_path}): {e}")
+
+    def load_snapshot(self):
+        """Complète la mémoire avec le fichier s'il a changé depuis la dernière lecture. True si des valeurs ont été lues."""
+        try:
+            mtime = os.stat(self.snapshot_path).st_mtime_ns if self.snapshot_path else None
+        except OSError:
+            return False
+        if mtime is None or mtime == self._snapshot_mtime:
+            return False
+        self._snapshot_mtime = mtime
+        try:
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Catalogue local illisible ({self.snapshot_path}): {e}")
+            return False
+        loaded = False
+        for name, value in (saved.get("values") or {}).items():
+            if name in RESOURCES and self._values.get(name) is None and value is not None:
+                self.set(name, value, (saved.get("etags") or {}).get(name))
+                self._fetched_at[name] = float(saved.get("saved_at") or 0)
+                loaded = True
+        return loaded
+
+    def seed(self, values):
+        """Valeurs de secours (sans ETag) pour les ressources jamais chargées ; enregistrées dans le fichier."""
+        values = {k: v for k, v in values.items() if k in RESOURCES and v is not None and self._values.get(k) is None}
+        for name, value in values.items():
+            self.set(name, value)
+        if values:
+            self.save_snapshot()
+
+    def get(self, name):
+        """Valeur en mémoire, ou None si elle n'a jamais pu être chargée."""
+        return self._values.get(name)
+
+    def products(self):
+        return self._values.get("products")
+
+    def product(self, pid):
+        return self._by_id.get(pid)
+
+    def statuses(self):
+        return self._values.get("statuses")
+
+    def age(self, name):
+        fetched = self._fetched_at.get(name)
+        return None if fetched is None else time.time() - fetched
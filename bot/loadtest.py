@@ -0,0 +1,245 @@
+"""
+Test de charge du bot en mode webhook, sans Telegram ni API réels.
+
+Lance un faux serveur (API Bot de Telegram + API StickerStreet, avec une latence
+réglable), démarre bot.py en mode webhook contre lui, puis rejoue des mises à
+jour sur le webhook et mesure le temps jusqu'à la dernière réponse du bot.
+
+Sans --updates : chaque discussion envoie /orders puis --adds appuis sur « Ajouter
+au panier » ; on vérifie que les réponses de chaque discussion arrivent dans
+l'ordre (panier à 1, 2, 3... articles). Avec --updates fichier.jsonl : mises à
+jour enregistrées (une par ligne, format de l'API Bot), rejouées telles quelles.
+
+Usage : python loadtest.py [--chats 50] [--adds 5] [--concurrency 32] [--api-latency 0.05]
+"""
+import argparse
+import json
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+TOKEN = "123456:LOADTEST"
+SECRET = "loadtest-secret"
+PRODUCT = {"id": 3, "cat": "stickers", "name": "Sticker test", "emoji": "🏷️", "desc": "", "sizes": ["8x8cm"],
+           "price": 1, "ton": 0.1, "xof": 500}
+STATUSES = {"pending": {"label": "En attente", "icon": "⏳"}}
+
+
+class FakeServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, api_latency, tg_latency):
+        super().__init__(("127.0.0.1", 0), _FakeHandler)
+        self.api_latency = api_latency
+        self.tg_latency = tg_latency
+        self.lock = threading.Lock()
+        self.calls = {}  # méthode Telegram -> nombre d'appels
+        self.replies = {}  # chat_id -> [textes envoyés / modifiés], dans l'ordre de réception
+        self.webhook_set = threading.Event()
+
+    def record(self, method, chat_id, text):
+        with self.lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            if chat_id is not None and text is not None:
+                self.replies.setdefault(chat_id, []).append(text)
+        if method == "setWebhook":
+            self.webhook_set.set()
+
+    def count(self, method):
+        with self.lock:
+            return self.calls.get(method, 0)
+
+
+class _FakeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        if "json" in (self.headers.get("Content-Type") or ""):
+            return json.loads(raw or b"{}")
+        from urllib.parse import parse_qsl
+        return dict(parse_qsl(raw.decode("utf-8")))
+
+    def do_GET(self):
+        self._api(None)
+
+    def do_POST(self):
+        if self.path.startswith(f"/bot{TOKEN}/"):
+            self._telegram(self.path.rsplit("/", 1)[1], self._body())
+        else:
+            self._api(self._body())
+
+    def _api(self, body):
+        time.sleep(self.server.api_latency)
+        path = self.path.split("?")[0]
+        if path == "/api/products":
+            return self._send([PRODUCT])
+        if path == "/api/statuses":
+            return self._send(STATUSES)
+        if path == "/api/orders" and self.command == "GET":
+            return self._send([{"id": "ORD-1", "status": "pending", "totalXof": 500, "date": "2025-01-01"}])
+        return self._send({"error": "inconnu"}, 404)
+
+    def _telegram(self, method, body):
+        time.sleep(self.server.tg_latency)
+        chat_id = body.get("chat_id")
+        self.server.record(method, int(chat_id) if chat_id not in (None, "") else None, body.get("text"))
+        if method == "getMe":
+            return self._send({"ok": True, "result": {
+                "id": 123456, "is_bot": True, "first_name": "LoadTest", "username": "loadtest_bot",
+                "can_join_groups": True, "can_read_all_group_messages": False, "supports_inline_queries": False,
+            }})
+        if method in ("sendMessage", "editMessageText"):
+            return self._send({"ok": True, "result": {
+                "message_id": 1, "date": int(time.time()),
+                "chat": {"id": int(chat_id or 0), "type": "private"}, "text": body.get("text") or "",
+            }})
+        return self._send({"ok": True, "result": True})
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def generate_updates(chats, adds):
+    """/orders puis adds × add_3 par discussion, entrelacés d'une discussion à l'autre."""
+    updates, n = [], 0
+    users = [{"id": 10_000 + c, "is_bot": False, "first_name": f"User{c}"} for c in range(chats)]
+    for step in range(adds + 1):
+        for user in users:
+            n += 1
+            chat = {"id": user["id"], "type": "private"}
+            if step == 0:
+                updates.append({"update_id": n, "message": {
+                    "message_id": n, "date": int(time.time()), "chat": chat, "from": user, "text": "/orders",
+                    "entities": [{"type": "bot_command", "offset": 0, "length": 7}],
+                }})
+            else:
+                updates.append({"update_id": n, "callback_query": {
+                    "id": str(n), "from": user, "chat_instance": str(user["id"]), "data": "add_3_8x8cm",
+                    "message": {"message_id": 1, "date": int(time.time()), "chat": chat, "text": "produit"},
+                }})
+    return updates
+
+
+def check_order(replies, adds):
+    """Discussions dont les paniers ne montent pas 1, 2, 3... dans l'ordre."""
+    bad = []
+    for chat_id, texts in replies.items():
+        counts = [int(m.group(1)) for m in (re.search(r"panier : (\d+) article", t) for t in texts) if m]
+        if counts != list(range(1, adds + 1)):
+            bad.append((chat_id, counts))
+    return bad
+
+
+def run(args):
+    fake = FakeServer(args.api_latency, args.tg_latency)
+    threading.Thread(target=fake.serve_forever, daemon=True).start()
+    fake_url = f"http://127.0.0.1:{fake.server_address[1]}"
+    webhook_port = _free_port()
+    state_dir = tempfile.mkdtemp()
+    env = dict(
+        os.environ,
+        TELEGRAM_BOT_TOKEN=TOKEN,
+        TELEGRAM_API_BASE_URL=f"{fake_url}/bot",
+        STICKERSTREET_API=fake_url,
+        WEBHOOK_URL=f"http://127.0.0.1:{webhook_port}",
+        WEBHOOK_PORT=str(webhook_port),
+        WEBHOOK_SECRET=SECRET,
+        BOT_CONCURRENT_UPDATES=str(args.concurrency),
+        CATALOG_SNAPSHOT_FILE=os.path.join(state_dir, "catalog.json"),
+        BOT_PERSISTENCE_FILE=os.path.join(state_dir, "bot_state.sqlite3"),
+        ADMIN_TELEGRAM_ID="",
+    )
+    here = os.path.dirname(os.path.abspath(__file__))
+    bot = subprocess.Popen([sys.executable, os.path.join(here, "bot.py")], cwd=here, env=env,
+                           stdout=subprocess.DEVNULL, stderr=None if args.verbose else subprocess.DEVNULL)
+    try:
+        if not fake.webhook_set.wait(30):
+            raise SystemExit("Le bot n'a pas enregistré son webhook (30 s)")
+        if args.updates:
+            with open(args.updates, encoding="utf-8") as f:
+                updates = [json.loads(line) for line in f if line.strip()]
+            expected = None
+        else:
+            updates = generate_updates(args.chats, args.adds)
+            expected = args.chats * args.adds
+        time.sleep(0.5)  # premier rafraîchissement du catalogue
+        url = f"http://127.0.0.1:{webhook_port}/telegram"
+        start = time.perf_counter()
+        with httpx.Client(headers={"X-Telegram-Bot-Api-Secret-Token": SECRET}) as client:
+            for update in updates:  # comme Telegram : dans l'ordre, sans attendre le traitement
+                client.post(url, json=update).raise_for_status()
+        posted = time.perf_counter() - start
+        deadline = start + args.timeout
+        if expected is None:
+            # Mises à jour enregistrées : fin quand le bot n'appelle plus Telegram depuis 1 s.
+            last, idle_since = -1, time.perf_counter()
+            while time.perf_counter() < deadline and time.perf_counter() - idle_since < 1.0:
+                with fake.lock:
+                    total = sum(fake.calls.values())
+                if total != last:
+                    last, idle_since = total, time.perf_counter()
+                time.sleep(0.05)
+            elapsed = idle_since - start
+        else:
+            while fake.count("editMessageText") < expected and time.perf_counter() < deadline:
+                time.sleep(0.01)
+            elapsed = time.perf_counter() - start
+        print(f"{len(updates)} mises à jour, concurrence {args.concurrency}, latence API {args.api_latency * 1000:.0f} ms")
+        print(f"  envoi webhook {posted:.2f} s, traitement complet {elapsed:.2f} s, {len(updates) / elapsed:.0f} mises à jour/s")
+        print(f"  appels Telegram : {dict(sorted(fake.calls.items()))}")
+        if expected is not None:
+            done = fake.count("editMessageText")
+            bad = check_order(fake.replies, args.adds)
+            print(f"  réponses panier {done}/{expected}, discussions dans le désordre : {len(bad)}")
+            if done < expected or bad:
+                print(f"  exemples : {bad[:3]}")
+                return 1
+        return 0
+    finally:
+        bot.terminate()
+        try:
+            bot.wait(10)
+        except subprocess.TimeoutExpired:
+            bot.kill()
+        fake.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--chats", type=int, default=50)
+    parser.add_argument("--adds", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=32, help="BOT_CONCURRENT_UPDATES du bot testé")
+    parser.add_argument("--api-latency", type=float, default=0.05, help="secondes par appel à l'API StickerStreet")
+    parser.add_argument("--tg-latency", type=float, default=0.02, help="secondes par appel à l'API Bot")
+    parser.add_argument("--updates", help="fichier .jsonl de mises à jour enregistrées à rejouer")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--verbose", action="store_true", help="affiche les journaux du bot")
+    sys.exit(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
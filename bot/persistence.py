@@ -0,0 +1,196 @@
+"""
+Persistance du bot dans SQLite (mode WAL) : paniers (user_data), chat_data et
+état des ConversationHandler (/register) survivent aux redémarrages.
+
+- Écriture différée : update_*() ne fait que déposer la valeur sérialisée dans
+  une file ; un thread l'écrit par lots, en une transaction. Aucun handler
+  n'attend le disque, et plusieurs modifications d'un même utilisateur entre deux
+  lots n'en font qu'une écriture.
+- Chargement paresseux : get_user_data()/get_chat_data() ne chargent rien au
+  démarrage ; les données d'un utilisateur sont lues (une requête par clé
+  primaire) la première fois qu'il écrit au bot, via refresh_user_data(). Le
+  démarrage ne dépend pas du nombre d'utilisateurs enregistrés.
+- Les conversations en cours (quelques lignes : entrées supprimées à la fin
+  de la conversation) sont chargées au démarrage, comme l'attend ConversationHandler.
+"""
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_data (id INTEGER PRIMARY KEY, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS chat_data (id INTEGER PRIMARY KEY, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS conversations (
+    name TEXT NOT NULL, key TEXT NOT NULL, state TEXT NOT NULL, PRIMARY KEY (name, key)
+);
+"""
+
+
+class SQLitePersistence(BasePersistence):
+    def __init__(self, path, update_interval=5.0):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")  # WAL : durable au checkpoint, sans fsync par transaction
+        self._conn.executescript(_SCHEMA)
+        # Lectures sur une connexion à part : en WAL, elles n'attendent pas le lot en cours d'écriture.
+        self._reader = sqlite3.connect(path, check_same_thread=False)
+        self._db_lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+        # (table, id) -> JSON, ou None pour une suppression ; la dernière valeur l'emporte
+        self._pending = {}
+        self._wake = threading.Event()
+        self._idle = threading.Event()
+        self._idle.set()
+        self._writer = None
+        self._loaded = {"user_data": set(), "chat_data": set()}
+        self.stats = {"loads": 0, "batches": 0, "rows_written": 0}
+
+    # ---------- lecture ----------
+
+    def _read(self, table, key):
+        row = self._reader.execute(f"SELECT data FROM {table} WHERE id = ?", (key,)).fetchone()
+        self.stats["loads"] += 1
+        return json.loads(row[0]) if row else None
+
+    def _refresh(self, table, key, data):
+        loaded = self._loaded[table]
+        if key in loaded:
+            return
+        loaded.add(key)
+        with self._pending_lock:
+            if (table, key) in self._pending:  # modifié depuis : la mémoire est plus récente
+                return
+        stored = self._read(table, key)
+        if stored:
+            for k, v in stored.items():
+                data.setdefault(k, v)
+
+    async def get_user_data(self):
+        return {}
+
+    async def get_chat_data(self):
+        return {}
+
+    async def refresh_user_data(self, user_id, user_data):
+        self._refresh("user_data", user_id, user_data)
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        self._refresh("chat_data", chat_id, chat_data)
+
+    async def get_conversations(self, name):
+        rows = self._reader.execute("SELECT key, state FROM conversations WHERE name = ?", (name,)).fetchall()
+        return {tuple(json.loads(key)): json.loads(state) for key, state in rows}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    # ---------- écriture différée ----------
+
+    def _queue(self, item, value):
+        with self._pending_lock:
+            self._pending[item] = value
+            self._idle.clear()
+        if self._writer is None or not self._writer.is_alive():
+            self._writer = threading.Thread(target=self._write_loop, name="bot-persistence", daemon=True)
+            self._writer.start()
+        self._wake.set()
+
+    async def update_user_data(self, user_id, data):
+        self._loaded["user_data"].add(user_id)
+        self._queue(("user_data", user_id), json.dumps(data, ensure_ascii=False) if data else None)
+
+    async def update_chat_data(self, chat_id, data):
+        self._loaded["chat_data"].add(chat_id)
+        self._queue(("chat_data", chat_id), json.dumps(data, ensure_ascii=False) if data else None)
+
+    async def drop_user_data(self, user_id):
+        self._queue(("user_data", user_id), None)
+
+    async def drop_chat_data(self, chat_id):
+        self._queue(("chat_data", chat_id), None)
+
+    async def update_conversation(self, name, key, new_state):
+        item = ("conversations", (name, json.dumps(list(key))))
+        self._queue(item, None if new_state is None else json.dumps(new_state))
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    def _write_loop(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            with self._pending_lock:
+                batch, self._pending = self._pending, {}
+            try:
+                if batch:
+                    self._write(batch)
+            except sqlite3.Error as e:
+                logger.error(f"Persistance du bot : écriture de {len(batch)} entrées échouée: {e}")
+                with self._pending_lock:
+                    for item, value in batch.items():
+                        self._pending.setdefault(item, value)  # une valeur plus récente reste prioritaire
+                time.sleep(5)
+                self._wake.set()
+                continue
+            with self._pending_lock:
+                if not self._pending:
+                    self._idle.set()
+
+    def _write(self, batch):
+        with self._db_lock:
+            self._conn.execute("BEGIN")
+            try:
+                for (table, key), value in batch.items():
+                    if table == "conversations":
+                        name, conv_key = key
+                        if value is None:
+                            self._conn.execute("DELETE FROM conversations WHERE name = ? AND key = ?", (name, conv_key))
+                        else:
+                            self._conn.execute(
+                                "INSERT INTO conversations (name, key, state) VALUES (?, ?, ?) "
+                                "ON CONFLICT (name, key) DO UPDATE SET state = excluded.state",
+                                (name, conv_key, value),
+                            )
+                    elif value is None:
+                        self._conn.execute(f"DELETE FROM {table} WHERE id = ?", (key,))
+                    else:
+                        self._conn.execute(
+                            f"INSERT INTO {table} (id, data) VALUES (?, ?) ON CONFLICT (id) DO UPDATE SET data = excluded.data",
+                            (key, value),
+                        )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        self.stats["batches"] += 1
+        self.stats["rows_written"] += len(batch)
+
+    async def flush(self):
+        """Arrêt du bot : attend que tout ce qui est en file soit écrit."""
+        if self._writer is not None and self._writer.is_alive():
+            self._wake.set()
+            await asyncio.to_thread(self._idle.wait, 30)
+        with self._db_lock:
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
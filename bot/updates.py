@@ -0,0 +1,54 @@
+"""
+Traitement concurrent des mises à jour Telegram, dans l'ordre pour chaque discussion.
+
+Les discussions différentes avancent en parallèle (au plus max_concurrent_updates
+handlers à la fois) ; les mises à jour d'une même discussion passent une par une,
+dans l'ordre d'arrivée : le panier (user_data) et l'état du ConversationHandler
+(/register) ne voient jamais deux handlers à la fois.
+"""
+import asyncio
+
+from telegram.ext import BaseUpdateProcessor
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    def __init__(self, max_concurrent_updates, max_pending=4096):
+        # Le sémaphore de la classe de base (pris avant do_process_update) ne borne que les
+        # mises à jour en attente : un client qui envoie une rafale n'occupe pas les places
+        # des autres en attendant son verrou. _running borne les handlers réellement actifs.
+        super().__init__(max(max_pending, max_concurrent_updates))
+        self._running = asyncio.Semaphore(max_concurrent_updates)
+        self._chats = {}  # clé -> [verrou, mises à jour en cours ou en attente]
+
+    @staticmethod
+    def _key(update):
+        chat = getattr(update, "effective_chat", None)
+        if chat is not None:
+            return chat.id
+        user = getattr(update, "effective_user", None)  # pre_checkout_query : pas de discussion
+        return ("user", user.id) if user is not None else None
+
+    async def do_process_update(self, update, coroutine):
+        key = self._key(update)
+        if key is None:
+            async with self._running:
+                await coroutine
+            return
+        entry = self._chats.get(key)
+        if entry is None:
+            entry = self._chats[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:  # asyncio.Lock réveille les attentes dans l'ordre (FIFO)
+                async with self._running:
+                    await coroutine
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._chats[key]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
@@ -1,7 +1,7 @@
 import { useState, useEffect, useRef, useCallback, lazy, Suspense } from "react";
 import { S } from "./data/constants";
 import { THEMES } from "./data/themes";
-import { fetchProducts, fetchBanners, uploadBlobImage, createProduct, patchProduct, removeProduct, createBanner, patchBanner, removeBanner, fetchOrders, createOrder, updateOrderStatus, fetchChat, postChatMessage, authTelegramMiniapp } from "./api";
+import { fetchProducts, fetchBanners, uploadBlobImage, createProduct, patchProduct, removeProduct, createBanner, patchBanner, removeBanner, fetchOrders, fetchOrdersPage, fetchOrdersSummary, createOrder, updateOrderStatus, fetchChat, postChatMessage, authTelegramMiniapp } from "./api";
 import { XOF_FMT } from "./data/constants";
 
 const ProductView = lazy(() => import("./components/ProductView"));
@@ -55,6 +55,9 @@ export default function App() {
   const [products, setProducts] = useState(PRODUCTS);
   const [banners, setBanners] = useState([]);
   const [orders, setOrders] = useState([]);
+  const [ordersNext, setOrdersNext] = useState(null);
+  const [ordersSummary, setOrdersSummary] = useState(null);
+  const chatSince = useRef(null); // id du dernier message reçu du fil
   const [filter, setFilter] = useState("all");
   const [msgs, setMsgs] = useState([{ from: "bot", text: "Salut ! 👋 Bienvenue chez StickerStreet. Dis-moi ce qu'il te faut !", time: "14:30" }]);
   const [ci, setCi] = useState("");
@@ -249,18 +252,59 @@ export default function App() {
 
   useEffect(() => {
     if (view === "admin") {
-      fetchOrders().then(setOrders).catch(() => setOrders([]));
+      fetchOrdersPage()
+        .then(({ orders: page, next }) => { setOrders(page); setOrdersNext(next); })
+        .catch(() => setOrders([]));
+      fetchOrdersSummary().then(setOrdersSummary).catch(() => setOrdersSummary(null));
     } else if (profile?.telegram_user_id) {
       fetchOrders(profile.telegram_user_id).then(setOrders).catch(() => setOrders([]));
     }
   }, [view, profile?.telegram_user_id]);
 
+  const mergeChat = useCallback((messages) => {
+    const fresh = messages.filter((m) => chatSince.current == null || m.id > chatSince.current);
+    if (!fresh.length) return;
+    chatSince.current = fresh[fresh.length - 1].id;
+    setMsgs((p) => [...p.filter((m) => !m.pending), ...fresh]);
+  }, []);
+
   useEffect(() => {
     if (view !== "chat") return;
-    fetchChat().then(setMsgs).catch(() => {});
-    const iv = setInterval(() => fetchChat().then(setMsgs).catch(() => {}), 4000);
-    return () => clearInterval(iv);
-  }, [view]);
+    // Dernière page du fil au chargement, puis long-poll : la réponse part dès qu'un message arrive.
+    // Le fil est celui de l'initData Telegram (envoyée par fetchChat), pas un id choisi ici.
+    let stopped = false;
+    chatSince.current = null;
+    (async () => {
+      try {
+        const first = await fetchChat();
+        if (stopped) return;
+        chatSince.current = first.length ? first[first.length - 1].id ?? -1 : -1;
+        setMsgs(first);
+      } catch {
+        chatSince.current = -1;
+      }
+      while (!stopped) {
+        try {
+          const messages = await fetchChat({ since: chatSince.current, wait: 25 });
+          if (!stopped) mergeChat(messages);
+        } catch {
+          await new Promise((r) => setTimeout(r, 4000));
+        }
+      }
+    })();
+    return () => { stopped = true; };
+  }, [view, mergeChat]);
+
+  const loadMoreOrders = useCallback(async () => {
+    if (!ordersNext) return;
+    try {
+      const { orders: page, next } = await fetchOrdersPage({ after: ordersNext });
+      setOrders((p) => [...p, ...page]);
+      setOrdersNext(next);
+    } catch (err) {
+      notify("Erreur : " + (err.message || "chargement des commandes"));
+    }
+  }, [ordersNext, notify]);
 
   const addCart = useCallback((p, sz, q = 1, d = null) => {
     const priceInfo = getPriceForSize(p, sz);
@@ -282,14 +326,13 @@ export default function App() {
     if (!ci.trim()) return;
     const txt = ci;
     setCi("");
-    setMsgs((p) => [...p, { from: "user", text: txt, time: new Date().toLocaleTimeString("fr-FR", { hour: "2-digit", minute: "2-digit" }) }]);
+    setMsgs((p) => [...p, { from: "user", text: txt, pending: true, time: new Date().toLocaleTimeString("fr-FR", { hour: "2-digit", minute: "2-digit" }) }]);
     try {
-      const messages = await postChatMessage(txt);
-      setMsgs(messages);
+      mergeChat(await postChatMessage(txt, { since: chatSince.current }));
     } catch (err) {
       setMsgs((p) => [...p, { from: "bot", text: (err.message || "Erreur d'envoi. Vérifie ta connexion et l'URL de l'API.") + " Réessaie ou contacte-nous via Telegram.", time: new Date().toLocaleTimeString("fr-FR", { hour: "2-digit", minute: "2-digit" }) }]);
     }
-  }, [ci]);
+  }, [ci, mergeChat]);
 
   const [checkoutLoading, setCheckoutLoading] = useState(false);
   const checkout = useCallback(async () => {
@@ -313,6 +356,7 @@ export default function App() {
   const handleUpdateOrderStatus = useCallback(async (orderId, status) => {
     try {
       await updateOrderStatus(orderId, status);
+      fetchOrdersSummary().then(setOrdersSummary).catch(() => {});
     } catch (err) {
       notify("Erreur mise à jour statut");
     }
@@ -575,6 +619,8 @@ export default function App() {
               onDeleteBanner={handleDeleteBanner}
               onUploadImage={handleUploadImage}
               onChangeAdminPin={handleChangeAdminPin}
+              ordersSummary={ordersSummary}
+              onLoadMoreOrders={ordersNext ? loadMoreOrders : null}
               notify={notify}
             />
           </Suspense>
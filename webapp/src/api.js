@@ -105,10 +105,25 @@ export async function removeBanner(bannerId) {
   return r.json();
 }
 
-export async function fetchOrders(telegramUserId = null) {
-  const url = telegramUserId ? `${API}/orders?telegram_user_id=${telegramUserId}` : `${API}/orders`;
-  const r = await fetch(url);
+/** Une page de commandes (plus récentes d'abord) : { orders, total, next } — next = curseur de la page suivante ou null. */
+export async function fetchOrdersPage({ telegramUserId = null, after = null, limit = null } = {}) {
+  const params = new URLSearchParams();
+  if (telegramUserId) params.set("telegram_user_id", telegramUserId);
+  if (after) params.set("after", after);
+  if (limit) params.set("limit", limit);
+  const qs = params.toString();
+  const r = await fetch(qs ? `${API}/orders?${qs}` : `${API}/orders`);
   if (!r.ok) throw new Error("Erreur chargement commandes");
+  return { orders: await r.json(), total: Number(r.headers.get("X-Total-Count") || 0), next: r.headers.get("X-Next-Cursor") };
+}
+
+export async function fetchOrders(telegramUserId = null) {
+  return (await fetchOrdersPage({ telegramUserId })).orders;
+}
+
+export async function fetchOrdersSummary() {
+  const r = await fetch(`${API}/orders/summary`);
+  if (!r.ok) throw new Error("Erreur chargement statistiques");
   return r.json();
 }
 
@@ -130,8 +145,23 @@ export async function createOrder(items, profile = null) {
   return r.json();
 }
 
-export async function fetchChat() {
-  const r = await fetch(`${API}/chat`);
+function chatQuery({ since = null, wait = null } = {}) {
+  const q = new URLSearchParams();
+  if (since != null) q.set("since", since);
+  if (wait) q.set("wait", wait);
+  const s = q.toString();
+  return s ? `?${s}` : "";
+}
+
+/** Fil du client = utilisateur de l'initData Telegram (vérifiée par l'API) ; sans initData, fil anonyme. */
+function chatHeaders(base = {}) {
+  const initData = (typeof window !== "undefined" && window.Telegram?.WebApp?.initData) || "";
+  return initData ? { ...base, "X-Telegram-Init-Data": initData } : base;
+}
+
+/** Derniers messages du fil du client, ou seulement ceux d'id > `since` ; `wait` (s) : attend qu'un message arrive (long-poll). */
+export async function fetchChat({ since = null, wait = null } = {}) {
+  const r = await fetch(`${API}/chat${chatQuery({ since, wait })}`, { headers: chatHeaders() });
   if (!r.ok) {
     const err = await r.json().catch(() => ({}));
     throw new Error(err.error || `Erreur chargement chat (${r.status})`);
@@ -139,11 +169,12 @@ export async function fetchChat() {
   return r.json();
 }
 
-export async function postChatMessage(text) {
+/** Envoie un message ; retourne les messages du fil d'id > `since` (dont celui envoyé). */
+export async function postChatMessage(text, { since = null } = {}) {
   const r = await fetch(`${API}/chat`, {
     method: "POST",
-    headers: { "Content-Type": "application/json" },
-    body: JSON.stringify({ text }),
+    headers: chatHeaders({ "Content-Type": "application/json" }),
+    body: JSON.stringify({ text, since }),
   });
   if (!r.ok) {
     const err = await r.json().catch(() => ({}));
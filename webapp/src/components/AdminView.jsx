@@ -104,6 +104,8 @@ export default function AdminView({
   onDeleteBanner,
   onUploadImage,
   onChangeAdminPin,
+  ordersSummary = null,
+  onLoadMoreOrders = null,
   notify,
 }) {
   const [newPin, setNewPin] = useState("");
@@ -142,8 +144,10 @@ export default function AdminView({
     } catch {}
   }, [allowUnsafeBannerImages]);
 
-  const rev = orders.reduce((s, o) => s + (o.totalXof || 0), 0);
-  const pend = orders.filter((o) => o.status === "pending").length;
+  // Les commandes sont paginées : les compteurs viennent de /api/orders/summary quand il répond.
+  const rev = ordersSummary ? ordersSummary.revenue_xof : orders.reduce((s, o) => s + (o.totalXof || 0), 0);
+  const pend = ordersSummary ? ordersSummary.pending : orders.filter((o) => o.status === "pending").length;
+  const orderCount = ordersSummary ? ordersSummary.count : orders.length;
 
   const parsedSizes = useMemo(
     () => form.sizes.split(",").map((x) => x.trim()).filter(Boolean),
@@ -430,7 +434,7 @@ export default function AdminView({
       <div style={{ display: "grid", gridTemplateColumns: "1fr 1fr", gap: 10, marginBottom: 20 }}>
         {[
           { v: XOF_FMT(rev), l: "Revenus", c: "#F59E0B" },
-          { v: orders.length, l: "Commandes", c: "#3B82F6" },
+          { v: orderCount, l: "Commandes", c: "#3B82F6" },
           { v: pend, l: "En attente", c: "#FF3B5C" },
           { v: prods.length, l: "Produits", c: "#00C48C" },
         ].map((s, i) => (
@@ -463,6 +467,11 @@ export default function AdminView({
               </div>
             </div>
           ))}
+          {onLoadMoreOrders && (
+            <button onClick={onLoadMoreOrders} style={{ padding: "12px 20px", background: t.bgAlt, color: t.text, border: "none", borderRadius: 12, fontWeight: 600, fontSize: 14, cursor: "pointer", fontFamily: "'Poppins',sans-serif" }}>
+              Charger plus de commandes
+            </button>
+          )}
         </div>
       )}
 